@@ -1,6 +1,13 @@
 from flask import Flask, request
-from localizations.sohograma import SohogramaInput, magnetic_inversion
+from localizations.sohograma import SohogramaInput, compute_semblance_sweep, DEFAULT_ENGINE, CPU_ENGINE
+from localizations.peaks import extract_peaks, MAX_PEAKS
+from localizations.hierarchical import hierarchical_search, COARSE_RESOLUTION, FINE_RESOLUTION, TOP_K_REGIONS
+from transport import encode_arrays, decode_arrays, TransportStats, NPZ_MIMETYPE, JSON_MIMETYPE
+from jobs import JobManager, JobStatus
+from slice_cache import SliceCache, cached_semblance
+from functools import partial
 import numpy as np
+import time
 from flask import jsonify
 
 
@@ -12,57 +19,241 @@ app = Flask(__name__)
 
 EARTH_FIELD = np.array([0, 1, -1])
 
-@app.route('/sohograma', methods=['POST'])
-def get_pt_cloud():
-    scenario_data = request.json
-    # print(f'Received data! {scenario_data}')
+job_manager = JobManager()
 
-    search_x = np.arange(scenario_data['grid_range']['x_min'], scenario_data['grid_range']['x_max'])
-    search_y = np.arange(scenario_data['grid_range']['y_min'], scenario_data['grid_range']['y_max'])
-    
-    scan_pts = np.array(scenario_data['scan_pts'])
-    scan_vals = np.array(scenario_data['scan_vals'])
-    
-    search_z = np.arange(scenario_data['z_min'], scenario_data['z_max']+1)
+slice_cache = SliceCache()
+
+# Spacing (in meters) of the searched grid when a request doesn't give one.
+DEFAULT_RESOLUTION = 1
+
+FULL_MODE = 'full'
+
+HIERARCHICAL_MODE = 'hierarchical'
+
+
+def parse_scenario_data():
+    """
+    Read the scenario sent in the request body, either as a npz payload or as legacy json lists.
+    Returns:
+        The scenario data dictionary (with scan_pts and scan_vals as arrays) and the parse TransportStats.
+    """
+    if request.mimetype == NPZ_MIMETYPE:
+        arrays, scenario_data, parse_stats = decode_arrays(request.get_data())
+        scenario_data.update(arrays)
+    else:
+        start = time.perf_counter()
+        scenario_data = request.json
+        scenario_data['scan_pts'] = np.array(scenario_data['scan_pts'])
+        scenario_data['scan_vals'] = np.array(scenario_data['scan_vals'])
+        parse_stats = TransportStats(seconds=time.perf_counter() - start, num_bytes=request.content_length)
+
+    print(f'Parsed {request.mimetype} request: {parse_stats.num_bytes} bytes in {parse_stats.seconds:.3f}s')
+    return scenario_data, parse_stats
+
+
+def make_arrays_response(arrays, parse_stats, compress=False):
+    """
+    Send the arrays back as npz if the client accepts it, otherwise as json lists.
+    Timings of the parsing and serialization are reported in the response headers.
+    """
+    start = time.perf_counter()
+    if request.accept_mimetypes.best_match([JSON_MIMETYPE, NPZ_MIMETYPE]) == NPZ_MIMETYPE:
+        payload, serialize_stats = encode_arrays(arrays, compress=compress)
+        response = app.response_class(payload, mimetype=NPZ_MIMETYPE)
+    else:
+        response = jsonify({name: arr.tolist() for name, arr in arrays.items()})
+        serialize_stats = TransportStats(seconds=time.perf_counter() - start,
+                                         num_bytes=response.content_length)
+
+    print(f'Serialized {response.mimetype} response: {serialize_stats.num_bytes} bytes in '
+          f'{serialize_stats.seconds:.3f}s')
+    response.headers['X-Parse-Time'] = f'{parse_stats.seconds:.6f}'
+    response.headers['X-Serialize-Time'] = f'{serialize_stats.seconds:.6f}'
+    return response
+
+
+def get_search_grid(scenario_data, resolution=DEFAULT_RESOLUTION):
+    """
+    Axes of the grid searched for the given scenario, spaced by the given resolution (in meters).
+    """
+    search_x = np.arange(scenario_data['grid_range']['x_min'], scenario_data['grid_range']['x_max'], resolution)
+    search_y = np.arange(scenario_data['grid_range']['y_min'], scenario_data['grid_range']['y_max'], resolution)
+    # Depths include z_max, a small tolerance keeps it despite the rounding of fractional resolutions.
+    search_z = np.arange(scenario_data['z_min'], scenario_data['z_max'] + resolution * 1e-6, resolution)
     
     print(f'SearchX: {search_x.min()}-{search_x.max()}')
     print(f'SearchY: {search_y.min()}-{search_y.max()}')
     print(f'SearchZ: {search_z.min()}-{search_z.max()}')
+    print(f'X: {search_x.shape[0]} Y: {search_y.shape[0]} Z: {search_z.shape[0]}')
+    print(f'Total blocks: {search_x.shape[0] * search_y.shape[0] * search_z.shape[0]}')
+    return search_x, search_y, search_z
+
+
+def get_hierarchical_pt_cloud(scenario_data, parse_stats):
+    """
+    Coarse to fine search, see hierarchical_search. Returns the refined peaks, the coarse cube and its axes
+    along with the number of evaluated voxels and the number of voxels of a full scan at the fine resolution.
+    """
+    coarse_resolution = scenario_data.get('coarse_resolution', COARSE_RESOLUTION)
+    fine_resolution = scenario_data.get('resolution', FINE_RESOLUTION)
+    coarse_axes = get_search_grid(scenario_data, coarse_resolution)
+    fine_axes = get_search_grid(scenario_data, fine_resolution)
+    full_voxels = np.prod([axis.shape[0] for axis in fine_axes])
     
-    semb_vals = np.zeros((search_x.shape[0], search_y.shape[0], search_z.shape[0]))
+    result = hierarchical_search(coarse_axes, scenario_data['scan_pts'], scenario_data['scan_vals'], EARTH_FIELD,
+                                 coarse_resolution=coarse_resolution, fine_resolution=fine_resolution,
+                                 top_k=scenario_data.get('top_k', TOP_K_REGIONS),
+                                 bounds=([axis.min() for axis in fine_axes], [axis.max() for axis in fine_axes]),
+                                 engine=scenario_data.get('engine', DEFAULT_ENGINE))
+    print(f'Hierarchical search evaluated {result.evaluated_voxels} voxels out of {full_voxels} '
+          f'({100 * result.evaluated_voxels / full_voxels:.2f}%)')
+    
+    arrays = {
+        'peaks': result.peaks,
+        'pt_cloud': result.coarse_semb_vals,
+        'search_x': coarse_axes[0],
+        'search_y': coarse_axes[1],
+        'search_z': coarse_axes[2],
+        'evaluated_voxels': np.array(result.evaluated_voxels),
+        'full_voxels': np.array(full_voxels)
+    }
+    return make_arrays_response(arrays, parse_stats, compress=scenario_data.get('compress', False))
+
 
-    print(f'ScanPts: {scan_pts.shape} ScanVals: {scan_vals.shape}')
-    inversion_func = magnetic_inversion(scan_vals.shape[0])
-    inversion_func[(search_x.shape[0], search_y.shape[0], search_z.shape[0]), 1](search_x,
-                                                                            search_y,
-                                                                            search_z, 
-                                                                            scan_pts,
-                                                                            scan_vals,
-                                                                            EARTH_FIELD, 
-                                                                            semb_vals,
-                                                                            scan_vals.max(),
-                                                                            scan_vals.mean(),
-                                                                            20)
+def get_sweep_pt_cloud(scenario_data, parse_stats, search_x, search_y, search_z):
+    """
+    Best semblance over the requested dipole_axes and rotation angles (in degrees) of the search grid around
+    center (the middle of the grid by default). Returns the best cube along with the index of the direction and
+    angle reaching it in each voxel and the location (grid_x, grid_y) of the voxel under that angle, see
+    compute_semblance_sweep. Peaks are located through grid_x and grid_y.
+    The sweep only runs on the cpu engine, other engines are rejected. Its results aren't cached, every request
+    computes the sweep again.
+    """
+    engine = scenario_data.get('engine', CPU_ENGINE)
+    if engine != CPU_ENGINE:
+        return jsonify({'error': f'Sweeps only run on the {CPU_ENGINE} engine, got {engine}'}), 400
+    
+    dipole_axes = np.reshape(np.array(scenario_data.get('dipole_axes', [EARTH_FIELD]), dtype=np.float64), (-1, 3))
+    angles = np.array(scenario_data.get('angles', [0]), dtype=np.float64).reshape(-1)
+    center = np.array(scenario_data.get('center', [(search_x[0] + search_x[-1]) / 2,
+                                                   (search_y[0] + search_y[-1]) / 2]), dtype=np.float64)
+    print(f'Sweeping {dipole_axes.shape[0]} dipole axes and {angles.shape[0]} angles around {center}')
+    
+    result = compute_semblance_sweep(search_x, search_y, search_z, scenario_data['scan_pts'],
+                                     scenario_data['scan_vals'], dipole_axes, np.deg2rad(angles), center)
+    arrays = {
+        'peaks': extract_peaks(result.semb_vals, search_x, search_y, search_z,
+                               max_peaks=scenario_data.get('max_peaks', MAX_PEAKS), grid_x=result.grid_x,
+                               grid_y=result.grid_y),
+        'axis_idxs': result.axis_idxs,
+        'angle_idxs': result.angle_idxs,
+        'dipole_axes': dipole_axes,
+        'angles': angles
+    }
+    if scenario_data.get('include_cube', True):
+        arrays['pt_cloud'] = result.semb_vals
+        arrays['grid_x'] = result.grid_x
+        arrays['grid_y'] = result.grid_y
+    
+    return make_arrays_response(arrays, parse_stats, compress=scenario_data.get('compress', False))
 
 
+@app.route('/sohograma', methods=['POST'])
+def get_pt_cloud():
+    """
+    Semblance of the scenario over its search grid.
+    The grid spacing is given by resolution (1m by default). With mode=hierarchical the grid is searched coarse to
+    fine, from coarse_resolution down to resolution, refining the top_k strongest regions.
+    Passing dipole_axes or angles sweeps several dipole directions and grid rotations, see get_sweep_pt_cloud.
+    """
+    scenario_data, parse_stats = parse_scenario_data()
+    if scenario_data.get('mode', FULL_MODE) == HIERARCHICAL_MODE:
+        return get_hierarchical_pt_cloud(scenario_data, parse_stats)
     
-    print(f'Before: {semb_vals.max()}')
-    print(f'X: {search_x.shape[0]} Y: {search_y.shape[0]} Z: {search_z.shape[0]}')
-    print(f'Total blocks: {search_x.shape[0] * search_y.shape[0] * search_z.shape[0]}')
+    search_x, search_y, search_z = get_search_grid(scenario_data, scenario_data.get('resolution', DEFAULT_RESOLUTION))
+    if 'dipole_axes' in scenario_data or 'angles' in scenario_data:
+        return get_sweep_pt_cloud(scenario_data, parse_stats, search_x, search_y, search_z)
     
-    print(f'After: {semb_vals.max()}')
+    scan_pts = scenario_data['scan_pts']
+    scan_vals = scenario_data['scan_vals']
+    
+    # The engine may be picked per request, otherwise use cuda when a gpu is available.
+    engine = scenario_data.get('engine', DEFAULT_ENGINE)
 
+    print(f'ScanPts: {scan_pts.shape} ScanVals: {scan_vals.shape} Engine: {engine}')
+    semb_vals = cached_semblance(slice_cache, search_x, search_y, search_z, scan_pts, scan_vals, EARTH_FIELD,
+                                 engine=engine)
     
-    return jsonify({'pt_cloud': semb_vals.tolist()})
-    # return semb_vals.tolist()
+    print(f'After: {semb_vals.max()}')
     
-    # Send back the pt cloud.
+    # Ranked candidate sources, clients which only need them may skip the cube.
+    peaks = extract_peaks(semb_vals, search_x, search_y, search_z,
+                          max_peaks=scenario_data.get('max_peaks', MAX_PEAKS))
+    print(f'Peaks: {peaks.shape[0]}')
+    arrays = {'peaks': peaks}
+    if scenario_data.get('include_cube', True):
+        arrays['pt_cloud'] = semb_vals
     
+    return make_arrays_response(arrays, parse_stats, compress=scenario_data.get('compress', False))
+
+
+@app.route('/jobs', methods=['POST'])
+def submit_job():
+    """
+    Queue an inversion of the given scenario, same input as /sohograma.
+    The cube is computed one z-slice at a time, poll /jobs/<job_id> for the progress.
+    """
+    scenario_data, _ = parse_scenario_data()
+    search_x, search_y, search_z = get_search_grid(scenario_data, scenario_data.get('resolution', DEFAULT_RESOLUTION))
+    engine = scenario_data.get('engine', DEFAULT_ENGINE)
     
+    compute_func = partial(cached_semblance, slice_cache, search_x, search_y, search_z, scenario_data['scan_pts'],
+                           scenario_data['scan_vals'], EARTH_FIELD, engine=engine)
+    job = job_manager.submit((search_x.shape[0], search_y.shape[0], search_z.shape[0]), compute_func,
+                             search_axes=(search_x, search_y, search_z), compress=scenario_data.get('compress', False))
+    print(f'Submitted job {job.job_id} Engine: {engine}')
+    return jsonify(job.describe()), 202
+
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job_status(job_id):
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({'error': f'Unknown job {job_id}'}), 404
     
+    return jsonify(job.describe())
 
+
+@app.route('/jobs/<job_id>/result', methods=['GET'])
+def get_job_result(job_id):
+    """
+    Semblance cube of a finished job and its ranked candidate sources (peaks).
+    Pass partial=1 to fetch the slices computed so far, along with a mask of the completed slices.
+    Pass cube=0 to only fetch the peaks and max_peaks to limit their number.
+    """
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({'error': f'Unknown job {job_id}'}), 404
     
+    partial_result = request.args.get('partial', '0') == '1'
+    if job.status != JobStatus.DONE and not partial_result:
+        return jsonify(job.describe()), 409
     
+    max_peaks = request.args.get('max_peaks', MAX_PEAKS, type=int)
+    arrays = {'peaks': extract_peaks(job.semb_vals, *job.search_axes, max_peaks=max_peaks),
+              'completed': job.completed}
+    if request.args.get('cube', '1') == '1':
+        arrays['pt_cloud'] = job.semb_vals
     
+    return make_arrays_response(arrays, TransportStats(seconds=0.0, num_bytes=0), compress=job.compress)
 
 
+@app.route('/jobs/<job_id>', methods=['DELETE'])
+def cancel_job(job_id):
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({'error': f'Unknown job {job_id}'}), 404
+    
+    job.cancel()
+    print(f'Cancelled job {job_id}')
+    return jsonify(job.describe())
@@ -0,0 +1,94 @@
+import argparse
+import contextlib
+import io
+import time
+import numpy as np
+from numba import config, cuda
+from localizations.sohograma import civilized_cpu_sohograma, compute_semblance, CPU_ENGINE, CUDA_ENGINE
+
+"""
+Benchmark of the sohograma inversion engines over a synthetic strip scan with a single dipole.
+Run from the backend directory:
+    python benchmark.py --grid 30 --depths 6 --samples 2000
+Set NUMBA_ENABLE_CUDASIM=1 to check the cuda kernel on a machine without a gpu (slow, keep the grid small).
+"""
+
+EARTH_FIELD = np.array([0, 1, -1])
+
+
+def synthetic_scan(num_samples, grid_size, seed=0):
+    """
+    Strip-like scan over the grid with the field of a single dipole buried at its center.
+    """
+    rng = np.random.default_rng(seed)
+    scan_pts = np.zeros((num_samples, 3))
+    scan_pts[:, 0] = rng.uniform(0, grid_size, num_samples)
+    scan_pts[:, 1] = rng.uniform(0, grid_size, num_samples)
+
+    dipole_loc = np.array([grid_size / 2, grid_size / 2, -5])
+    r = scan_pts - dipole_loc
+    abs_r = np.linalg.norm(r, axis=1)[:, None]
+    norm_r = r / abs_r
+    mag_vec = (3 * norm_r * (norm_r @ EARTH_FIELD)[:, None] - EARTH_FIELD) * 1.2566e-6 / (4 * np.pi * abs_r ** 3)
+    scan_vals = np.linalg.norm(mag_vec + EARTH_FIELD * 1e-9, axis=1) * 1e9 + 4.5e6
+    return scan_pts, scan_vals
+
+
+def time_python_path(search_x, search_y, search_z, scan_pts, scan_vals, num_voxels):
+    """
+    Time the per-voxel python closure over the first num_voxels voxels and extrapolate to the grid.
+    """
+    cpu_sohograma = civilized_cpu_sohograma(scan_vals.shape[0])
+    semb_vals = np.zeros((search_x.shape[0], search_y.shape[0], search_z.shape[0]))
+    voxels = list(np.ndindex(semb_vals.shape))[:num_voxels]
+
+    start = time.perf_counter()
+    # The python path prints every voxel, keep it out of the measurement.
+    with contextlib.redirect_stdout(io.StringIO()):
+        for ix, iy, iz in voxels:
+            cpu_sohograma(ix, iy, iz, search_x, search_y, search_z, scan_pts, scan_vals, EARTH_FIELD,
+                          semb_vals, scan_vals.max(), scan_vals.mean(), (0, 0), 0)
+    elapsed = time.perf_counter() - start
+    return elapsed * semb_vals.size / len(voxels)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--grid', type=int, default=30, help='Size of the searched grid in meters.')
+    parser.add_argument('--depths', type=int, default=6, help='Number of searched heights.')
+    parser.add_argument('--samples', type=int, default=2000, help='Number of scan points.')
+    parser.add_argument('--python-voxels', type=int, default=20,
+                        help='Number of voxels timed in the python path.')
+    args = parser.parse_args()
+
+    scan_pts, scan_vals = synthetic_scan(args.samples, args.grid)
+    search_x = np.arange(0, args.grid, dtype=np.float64)
+    search_y = np.arange(0, args.grid, dtype=np.float64)
+    search_z = np.arange(-args.depths, 0, dtype=np.float64)
+    num_voxels = search_x.shape[0] * search_y.shape[0] * search_z.shape[0]
+    print(f'Voxels: {num_voxels} Samples: {args.samples}')
+
+    python_time = time_python_path(search_x, search_y, search_z, scan_pts, scan_vals, args.python_voxels)
+    print(f'Python path (extrapolated): {python_time:.3f}s')
+
+    # First call includes the compilation.
+    start = time.perf_counter()
+    compute_semblance(search_x, search_y, search_z, scan_pts, scan_vals, EARTH_FIELD, engine=CPU_ENGINE)
+    print(f'Numba cpu engine (first call): {time.perf_counter() - start:.3f}s')
+
+    start = time.perf_counter()
+    cpu_semb = compute_semblance(search_x, search_y, search_z, scan_pts, scan_vals, EARTH_FIELD,
+                                 engine=CPU_ENGINE)
+    cpu_time = time.perf_counter() - start
+    print(f'Numba cpu engine: {cpu_time:.3f}s Speedup: {python_time / cpu_time:.1f}x')
+
+    if cuda.is_available() or config.ENABLE_CUDASIM:
+        start = time.perf_counter()
+        cuda_semb = compute_semblance(search_x, search_y, search_z, scan_pts, scan_vals, EARTH_FIELD,
+                                      engine=CUDA_ENGINE)
+        print(f'Cuda engine: {time.perf_counter() - start:.3f}s')
+        print(f'Max difference between cpu and cuda engines: {np.abs(cpu_semb - cuda_semb).max()}')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+import threading
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from enum import Enum
+import numpy as np
+
+"""
+Background inversion jobs.
+A job computes the semblance cube one z-slice at a time so clients can poll its progress,
+fetch the slices computed so far and cancel it between slices.
+"""
+
+# Finished jobs kept around for their results, older ones are dropped first.
+MAX_FINISHED_JOBS = 8
+
+
+class JobStatus(Enum):
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    CANCELLED = 'cancelled'
+    FAILED = 'failed'
+
+
+class InversionJob():
+
+    def __init__(self, shape, search_axes=None, compress=False) -> None:
+        """
+        Args:
+            shape (tuple): Shape (nx,ny,nz) of the computed semblance cube.
+            search_axes (tuple): The (search_x, search_y, search_z) axes of the cube, used to locate its peaks.
+            compress (bool): Whether the result is sent back deflated.
+        """
+        self.job_id = uuid.uuid4().hex
+        self.status = JobStatus.QUEUED
+        self.error = None
+
+        # Filled slice by slice, completed marks the z indices that are ready.
+        self.semb_vals = np.zeros(shape)
+        self.completed = np.zeros(shape[2], dtype=bool)
+        self.cancel_event = threading.Event()
+
+        self.search_axes = search_axes
+        self.compress = compress
+
+    @property
+    def is_finished(self):
+        return self.status in (JobStatus.DONE, JobStatus.CANCELLED, JobStatus.FAILED)
+
+    @property
+    def progress(self):
+        return float(self.completed.mean()) if self.completed.size > 0 else 1.0
+
+    def on_slice(self, iz, slice_vals):
+        self.semb_vals[:, :, iz] = slice_vals
+        self.completed[iz] = True
+
+    def cancel(self):
+        self.cancel_event.set()
+        if self.status == JobStatus.QUEUED:
+            self.status = JobStatus.CANCELLED
+
+    def describe(self):
+        return {
+            'job_id': self.job_id,
+            'status': self.status.value,
+            'progress': self.progress,
+            'completed_slices': np.flatnonzero(self.completed).tolist(),
+            'num_slices': int(self.completed.size),
+            'error': self.error
+        }
+
+
+class JobManager():
+
+    def __init__(self, max_workers=1) -> None:
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.jobs = OrderedDict()
+        self.lock = threading.Lock()
+
+    def submit(self, shape, compute_func, search_axes=None, compress=False):
+        """
+        Queue a new job.
+        Args:
+            shape (tuple): Shape (nx,ny,nz) of the computed semblance cube.
+            compute_func (callable): Called with the on_slice and is_cancelled callbacks of the job,
+                                     expected to report every computed z-slice through on_slice.
+            search_axes, compress: See InversionJob.
+
+        Returns:
+            The queued InversionJob.
+        """
+        job = InversionJob(shape, search_axes=search_axes, compress=compress)
+        with self.lock:
+            self.jobs[job.job_id] = job
+            self._evict_finished()
+
+        self.executor.submit(self._run, job, compute_func)
+        return job
+
+    def get(self, job_id):
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def _run(self, job, compute_func):
+        if job.cancel_event.is_set():
+            job.status = JobStatus.CANCELLED
+            return
+
+        job.status = JobStatus.RUNNING
+        try:
+            compute_func(on_slice=job.on_slice, is_cancelled=job.cancel_event.is_set)
+            job.status = JobStatus.CANCELLED if job.cancel_event.is_set() else JobStatus.DONE
+        except Exception as e:
+            job.error = str(e)
+            job.status = JobStatus.FAILED
+
+    def _evict_finished(self):
+        finished_ids = [job_id for job_id, job in self.jobs.items() if job.is_finished]
+        for job_id in finished_ids[:max(0, len(finished_ids) - MAX_FINISHED_JOBS)]:
+            del self.jobs[job_id]
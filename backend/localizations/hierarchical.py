@@ -0,0 +1,75 @@
+from collections import namedtuple
+from itertools import product
+from localizations.sohograma import compute_semblance, semblance_at_points
+from localizations.peaks import extract_peaks
+import numpy as np
+
+"""
+Coarse to fine semblance search.
+The semblance is smooth and peaked, so instead of evaluating every voxel of a fine grid the search evaluates
+a coarse grid, keeps its strongest local maxima (regions) and refines each one of them by halving the
+spacing around its best point until reaching the requested resolution.
+"""
+
+# Spacing (in meters) of the coarse grid.
+COARSE_RESOLUTION = 4.0
+
+# Spacing (in meters) the regions are refined to.
+FINE_RESOLUTION = 0.25
+
+# Number of coarse local maxima refined.
+TOP_K_REGIONS = 16
+
+# Offsets of the 26 neighbours of a voxel, evaluated around the best point of a region at every level.
+NEIGHBOUR_OFFSETS = np.array([offset for offset in product((-1, 0, 1), repeat=3) if any(offset)], dtype=np.float64)
+
+HierarchicalResult = namedtuple('HierarchicalResult', 'peaks coarse_semb_vals evaluated_voxels')
+
+
+def hierarchical_search(coarse_axes, scan_pts, scan_vals, dipole_axis, coarse_resolution=COARSE_RESOLUTION,
+                        fine_resolution=FINE_RESOLUTION, top_k=TOP_K_REGIONS, bounds=None, engine=None):
+    """
+    Search the semblance maxima from the coarse grid down to the fine resolution.
+    Args:
+        coarse_axes (tuple): (search_x, search_y, search_z) axes of the coarse grid, spaced by coarse_resolution.
+        scan_pts (np.array): (n,3) locations of the scan points.
+        scan_vals (np.array): (n,) measured field at each scan point.
+        dipole_axis (np.array): Direction of the simulated dipoles.
+        coarse_resolution (float): Spacing of the coarse grid.
+        fine_resolution (float): Spacing of the last refinement level.
+        top_k (int): Number of refined regions.
+        bounds (tuple): (lower, upper) (x,y,z) bounds of the refined points, the extent of the coarse grid by default.
+        engine (str): Engine of the coarse grid, see compute_semblance.
+
+    Returns:
+        HierarchicalResult with the refined (x,y,z,semblance) peaks ranked by semblance, the coarse semblance
+        cube and the number of evaluated voxels.
+    """
+    coarse_semb_vals = compute_semblance(*coarse_axes, scan_pts, scan_vals, dipole_axis, engine=engine)
+    regions = extract_peaks(coarse_semb_vals, *coarse_axes, max_peaks=top_k)
+    evaluated_voxels = coarse_semb_vals.size
+
+    if bounds is None:
+        bounds = ([axis.min() for axis in coarse_axes], [axis.max() for axis in coarse_axes])
+    lower_bounds, upper_bounds = np.asarray(bounds[0], dtype=np.float64), np.asarray(bounds[1], dtype=np.float64)
+    best_pts, best_vals = regions[:, :3], regions[:, 3]
+
+    # The maximum is within half the previous spacing from the best point, its neighbours at the new spacing cover it.
+    step = coarse_resolution
+    while step > fine_resolution and best_pts.shape[0] > 0:
+        step = max(step / 2, fine_resolution)
+        candidates = np.clip(best_pts[:, None, :] + NEIGHBOUR_OFFSETS * step, lower_bounds, upper_bounds)
+        candidate_vals = semblance_at_points(candidates.reshape(-1, 3), scan_pts, scan_vals,
+                                             dipole_axis).reshape(candidates.shape[:2])
+        evaluated_voxels += candidate_vals.size
+
+        best_idx = np.argmax(candidate_vals, axis=1)
+        improved = candidate_vals[np.arange(best_pts.shape[0]), best_idx] > best_vals
+        best_pts[improved] = candidates[improved, best_idx[improved]]
+        best_vals[improved] = candidate_vals[improved, best_idx[improved]]
+
+    # Regions may converge to the same maximum.
+    _, unique_idxs = np.unique(np.round(best_pts / fine_resolution), axis=0, return_index=True)
+    peaks = np.column_stack((best_pts, best_vals))[unique_idxs]
+    peaks = peaks[np.argsort(-peaks[:, 3], kind='stable')]
+    return HierarchicalResult(peaks=peaks, coarse_semb_vals=coarse_semb_vals, evaluated_voxels=evaluated_voxels)
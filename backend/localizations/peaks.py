@@ -0,0 +1,52 @@
+from scipy import ndimage
+import numpy as np
+
+"""
+Candidate sources in a semblance cube.
+A candidate is a local maximum of the semblance, voxels with the maximal value in their neighbourhood.
+"""
+
+# Number of candidates returned by default, the strongest ones first.
+MAX_PEAKS = 200
+
+# Size (in voxels) of the cube around each voxel it has to be the maximum of.
+PEAK_NEIGHBOURHOOD = 3
+
+# Connectivity used to merge adjacent maxima of equal value (plateaus) into a single candidate.
+PLATEAU_STRUCTURE = np.ones((3, 3, 3), dtype=bool)
+
+
+def extract_peaks(semb_vals, search_x, search_y, search_z, max_peaks=MAX_PEAKS, neighbourhood=PEAK_NEIGHBOURHOOD,
+                  min_semblance=0.0, grid_x=None, grid_y=None):
+    """
+    Find the local maxima of the semblance cube.
+    Args:
+        semb_vals (np.ndarray): (nx,ny,nz) semblance cube.
+        search_x (np.ndarray): X values of the cube.
+        search_y (np.ndarray): Y values of the cube.
+        search_z (np.ndarray): Z values of the cube.
+        max_peaks (int): Maximal number of returned candidates.
+        neighbourhood (int): Size of the neighbourhood of a local maximum.
+        min_semblance (float): Candidates must have a semblance strictly above it, skips empty (zero) regions.
+        grid_x, grid_y (np.ndarray): (nx,ny,nz) location of each voxel when it isn't given by the axes
+                                     (e.g. rotated grids of a sweep), search_x and search_y are ignored then.
+
+    Returns:
+        (K,4) array of the (x,y,z,semblance) of the candidates, ranked by semblance.
+    """
+    # Voxels which weren't computed (nan) never win.
+    cube = np.where(np.isnan(semb_vals), -np.inf, semb_vals)
+    is_peak = (ndimage.maximum_filter(cube, size=neighbourhood, mode='nearest') == cube) & (cube > min_semblance)
+
+    # Keep a single voxel (the first one) of every plateau, all of its voxels share the same value.
+    labels, _ = ndimage.label(is_peak, structure=PLATEAU_STRUCTURE)
+    peak_idxs = np.flatnonzero(is_peak)
+    _, first = np.unique(labels.flat[peak_idxs], return_index=True)
+    peak_idxs = peak_idxs[first]
+
+    peak_vals = cube.flat[peak_idxs]
+    ranking = np.argsort(-peak_vals, kind='stable')[:max_peaks]
+    ix, iy, iz = np.unravel_index(peak_idxs[ranking], cube.shape)
+    peak_x = search_x[ix] if grid_x is None else grid_x[ix, iy, iz]
+    peak_y = search_y[iy] if grid_y is None else grid_y[ix, iy, iz]
+    return np.column_stack((peak_x, peak_y, search_z[iz], peak_vals[ranking]))
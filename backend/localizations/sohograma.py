@@ -2,6 +2,8 @@ import numba
 from numba import cuda
 from collections import namedtuple
 import numpy as np
+import os
+import threading
 
 """
 This is a junk of untested code from my memory for the sohograma algorithm.
@@ -10,6 +12,17 @@ Need to write a UI for it and test it out on a cuda gpu.
 
 SohogramaInput = namedtuple('SohogramaInput', 'grid_range scan_pts scan_vals z_min z_max')
 
+# Best semblance of each voxel along with the indices of the dipole direction and grid rotation reaching it.
+# Each rotation moves the voxel, grid_x and grid_y are the location of the voxel under its best rotation.
+SweepResult = namedtuple('SweepResult', 'semb_vals axis_idxs angle_idxs grid_x grid_y')
+
+CUDA_ENGINE = 'cuda'
+
+CPU_ENGINE = 'cpu'
+
+# Engine used when a request doesn't ask for one, can be overridden through the environment.
+DEFAULT_ENGINE = os.environ.get('SOHOGRAMA_ENGINE', CUDA_ENGINE if cuda.is_available() else CPU_ENGINE)
+
 def civilized_cpu_sohograma(num_samples):
     def cpu_sohograma(ix, iy, iz, search_x, search_y, search_z, scan_pts, scan_vals, norm_dipole_axis,
                         semb_vals, scan_max_val, scan_min, center, angle):
@@ -103,87 +116,424 @@ def civilized_cpu_sohograma(num_samples):
 
 
 
-def magnetic_inversion(num_samples):
-    @cuda.jit
-    def cuda_func(search_x, search_y, search_z, scan_pts, scan_vals, norm_dipole_axis,
-                    arr, scan_max_val, scan_min, val):
-        ix = cuda.blockIdx.x
-        iy = cuda.blockIdx.y
-        iz = cuda.blockIdx.z
+# Threads of a block cooperating over the samples of a voxel, a power of 2 for the reductions.
+THREADS_PER_BLOCK = 128
 
-        if (ix >= search_x.shape[0] or iy >= search_y.shape[0] or iz >= search_z.shape[0]):
-            return
+# Upper bound on the launched blocks, larger grids are covered by striding over the voxels.
+MAX_BLOCKS = 65535
 
-        mag_field_vals = cuda.shared.array(num_samples, dtype=numba.float64)
-        
-        
-        for ipoint in range(num_samples):
-            x_val = scan_pts[ipoint, 0]
-            y_val = scan_pts[ipoint, 1]
-            z_val = scan_pts[ipoint, 2]
-            
-            x_grid = search_x[ix]
-            y_grid = search_y[iy]
-            
-            dipole_vec_x = x_val-x_grid
-            dipole_vec_y = y_val-y_grid
-            dipole_vec_z = z_val-search_z[iz]
-            
-            
-            sqrt_dot = (dipole_vec_x**2 + dipole_vec_y**2 + dipole_vec_z**2) ** 0.5
-            
-            normed_sens_x = dipole_vec_x / sqrt_dot
-            normed_sens_y = dipole_vec_y / sqrt_dot
-            normed_sens_z = dipole_vec_z / sqrt_dot
 
+@cuda.jit(device=True)
+def cuda_dipole_field(x, y, z, scan_x, scan_y, scan_z, axis_x, axis_y, axis_z):
+    """
+    Magnitude (in nT) of the earth field and the field of a dipole at (x, y, z) at a scan point, see voxel_semblance.
+    """
+    dipole_vec_x = scan_x - x
+    dipole_vec_y = scan_y - y
+    dipole_vec_z = scan_z - z
 
-            const_val = numba.float64(1.2566e-6 / (4 * np.pi * (sqrt_dot ** 3)))
-            
-            dot_norm_axis_sen_vec = (norm_dipole_axis[0] * normed_sens_x 
-                                     + norm_dipole_axis[1] * normed_sens_y
-                                     + norm_dipole_axis[2] * normed_sens_z)
-            
-            vec_val_x = 3 * normed_sens_x * dot_norm_axis_sen_vec - norm_dipole_axis[0]
-            vec_val_y = 3 * normed_sens_y * dot_norm_axis_sen_vec - norm_dipole_axis[1]
-            vec_val_z = 3 * normed_sens_z * dot_norm_axis_sen_vec - norm_dipole_axis[2]
-            
-            mean_x = norm_dipole_axis[0] * 1e-9
-            mean_y = norm_dipole_axis[1] * 1e-9
-            mean_z = norm_dipole_axis[2] * 1e-9
-            
-            x_part = mean_x + const_val * vec_val_x
-            y_part = mean_y + const_val * vec_val_y
-            z_part = mean_z + const_val * vec_val_z
-            
-            field_val = (x_part ** 2 + y_part ** 2 + z_part ** 2) ** 0.5
-            mag_field_vals[ipoint] = field_val * 1e9
+    sqrt_dot = (dipole_vec_x**2 + dipole_vec_y**2 + dipole_vec_z**2) ** 0.5
 
-        max_field_val = numba.float64(0)
-        min_field_val = numba.float64(1e10)
-        for ipoint in range(num_samples):
-            if mag_field_vals[ipoint] > max_field_val:
-                max_field_val = mag_field_vals[ipoint]
-            
-            if mag_field_vals[ipoint] < min_field_val:
-                min_field_val = mag_field_vals[ipoint]
-            
-        
-        # Compute the semblance value.
-        sim_trace_sq = numba.float64(0)
-        semblance_nom = numba.float64(0)
-        denom_scan_val = numba.float64(0)
-        
-        for ipoint in range(num_samples):
-            curr_val = (scan_vals[ipoint] - scan_min)/(scan_max_val-scan_min)
-            # normed_field = (mag_field_vals[ipoint]-min_field_val) / (max_field_val-min_field_val)
-            normed_field = mag_field_vals[ipoint]/max_field_val
-        
-            sim_trace_sq = sim_trace_sq + normed_field ** 2
-            semblance_nom = semblance_nom + (normed_field + curr_val) ** 2
-            denom_scan_val = denom_scan_val + curr_val**2
-            
-        semblance_val = semblance_nom / (2 * (sim_trace_sq + denom_scan_val))
-        arr[ix, iy, iz] = semblance_val
- 
-    
-    return cuda_func
+    normed_sens_x = dipole_vec_x / sqrt_dot
+    normed_sens_y = dipole_vec_y / sqrt_dot
+    normed_sens_z = dipole_vec_z / sqrt_dot
+
+    const_val = 1.2566e-6 / (4 * np.pi * (sqrt_dot ** 3))
+    dot_norm_axis_sen_vec = axis_x * normed_sens_x + axis_y * normed_sens_y + axis_z * normed_sens_z
+
+    x_part = axis_x * 1e-9 + const_val * (3 * normed_sens_x * dot_norm_axis_sen_vec - axis_x)
+    y_part = axis_y * 1e-9 + const_val * (3 * normed_sens_y * dot_norm_axis_sen_vec - axis_y)
+    z_part = axis_z * 1e-9 + const_val * (3 * normed_sens_z * dot_norm_axis_sen_vec - axis_z)
+    return (x_part ** 2 + y_part ** 2 + z_part ** 2) ** 0.5 * 1e9
+
+
+@cuda.jit
+def cuda_semblance_kernel(search_x, search_y, search_z, scan_pts, scan_vals, norm_dipole_axis,
+                          semb_vals, scan_max_val, scan_min):
+    """
+    Semblance of each voxel of the search grid, same arguments as cpu_magnetic_inversion.
+    Each block handles one voxel at a time, its threads go over the samples in chunks of THREADS_PER_BLOCK.
+    The semblance of voxel_semblance is expanded into sums which don't depend on the maximal field:
+        sum((f/max + c)^2) = sum(f^2)/max^2 + 2*sum(f*c)/max + sum(c^2)
+    so the field is computed in a single pass and only per thread partial results are kept in shared memory.
+    """
+    field_max = cuda.shared.array(THREADS_PER_BLOCK, dtype=numba.float64)
+    field_sq = cuda.shared.array(THREADS_PER_BLOCK, dtype=numba.float64)
+    field_scan = cuda.shared.array(THREADS_PER_BLOCK, dtype=numba.float64)
+    scan_sq = cuda.shared.array(THREADS_PER_BLOCK, dtype=numba.float64)
+
+    tid = cuda.threadIdx.x
+    nx = search_x.shape[0]
+    ny = search_y.shape[0]
+    nz = search_z.shape[0]
+    num_samples = scan_pts.shape[0]
+    scan_range = scan_max_val - scan_min
+
+    for ivoxel in range(cuda.blockIdx.x, nx * ny * nz, cuda.gridDim.x):
+        ix = ivoxel // (ny * nz)
+        iy = (ivoxel // nz) % ny
+        iz = ivoxel % nz
+
+        thread_max = 0.0
+        thread_sq = 0.0
+        thread_scan = 0.0
+        thread_scan_sq = 0.0
+        for ipoint in range(tid, num_samples, THREADS_PER_BLOCK):
+            field_val = cuda_dipole_field(search_x[ix], search_y[iy], search_z[iz],
+                                          scan_pts[ipoint, 0], scan_pts[ipoint, 1], scan_pts[ipoint, 2],
+                                          norm_dipole_axis[0], norm_dipole_axis[1], norm_dipole_axis[2])
+            curr_val = (scan_vals[ipoint] - scan_min) / scan_range
+            thread_max = max(thread_max, field_val)
+            thread_sq += field_val ** 2
+            thread_scan += field_val * curr_val
+            thread_scan_sq += curr_val ** 2
+
+        field_max[tid] = thread_max
+        field_sq[tid] = thread_sq
+        field_scan[tid] = thread_scan
+        scan_sq[tid] = thread_scan_sq
+        cuda.syncthreads()
+
+        # Tree reduction, the block totals end up in the first entries.
+        stride = THREADS_PER_BLOCK // 2
+        while stride > 0:
+            if tid < stride:
+                field_max[tid] = max(field_max[tid], field_max[tid + stride])
+                field_sq[tid] += field_sq[tid + stride]
+                field_scan[tid] += field_scan[tid + stride]
+                scan_sq[tid] += scan_sq[tid + stride]
+            cuda.syncthreads()
+            stride //= 2
+
+        if tid == 0:
+            sim_trace_sq = field_sq[0] / field_max[0] ** 2
+            semblance_nom = sim_trace_sq + 2 * field_scan[0] / field_max[0] + scan_sq[0]
+            semb_vals[ix, iy, iz] = semblance_nom / (2 * (sim_trace_sq + scan_sq[0]))
+
+        # The shared arrays are reused by the next voxel.
+        cuda.syncthreads()
+
+
+@numba.njit(cache=True)
+def voxel_semblance(x, y, z, scan_pts, scan_vals, norm_dipole_axis, mag_field_vals, scan_max_val, scan_min):
+    """
+    Semblance between the scan and the field of a dipole at (x, y, z), same computation as cuda_semblance_kernel.
+    Args:
+        x, y, z (float): Location of the simulated dipole.
+        scan_pts (np.array): (n,3) locations of the scan points.
+        scan_vals (np.array): (n,) measured field at each scan point.
+        norm_dipole_axis (np.array): Direction of the simulated dipole.
+        mag_field_vals (np.array): (n,) scratch buffer for the simulated field.
+        scan_max_val (float): Value normalized to 1 in the scan values.
+        scan_min (float): Value normalized to 0 in the scan values.
+    """
+    num_samples = scan_pts.shape[0]
+    mean_x = norm_dipole_axis[0] * 1e-9
+    mean_y = norm_dipole_axis[1] * 1e-9
+    mean_z = norm_dipole_axis[2] * 1e-9
+
+    max_field_val = 0.0
+    for ipoint in range(num_samples):
+        dipole_vec_x = scan_pts[ipoint, 0] - x
+        dipole_vec_y = scan_pts[ipoint, 1] - y
+        dipole_vec_z = scan_pts[ipoint, 2] - z
+
+        sqrt_dot = (dipole_vec_x**2 + dipole_vec_y**2 + dipole_vec_z**2) ** 0.5
+
+        normed_sens_x = dipole_vec_x / sqrt_dot
+        normed_sens_y = dipole_vec_y / sqrt_dot
+        normed_sens_z = dipole_vec_z / sqrt_dot
+
+        const_val = 1.2566e-6 / (4 * np.pi * (sqrt_dot ** 3))
+
+        dot_norm_axis_sen_vec = (norm_dipole_axis[0] * normed_sens_x
+                                 + norm_dipole_axis[1] * normed_sens_y
+                                 + norm_dipole_axis[2] * normed_sens_z)
+
+        x_part = mean_x + const_val * (3 * normed_sens_x * dot_norm_axis_sen_vec - norm_dipole_axis[0])
+        y_part = mean_y + const_val * (3 * normed_sens_y * dot_norm_axis_sen_vec - norm_dipole_axis[1])
+        z_part = mean_z + const_val * (3 * normed_sens_z * dot_norm_axis_sen_vec - norm_dipole_axis[2])
+
+        field_val = (x_part ** 2 + y_part ** 2 + z_part ** 2) ** 0.5 * 1e9
+        mag_field_vals[ipoint] = field_val
+        if field_val > max_field_val:
+            max_field_val = field_val
+
+    # Compute the semblance value.
+    sim_trace_sq = 0.0
+    semblance_nom = 0.0
+    denom_scan_val = 0.0
+    for ipoint in range(num_samples):
+        curr_val = (scan_vals[ipoint] - scan_min) / (scan_max_val - scan_min)
+        normed_field = mag_field_vals[ipoint] / max_field_val
+
+        sim_trace_sq += normed_field ** 2
+        semblance_nom += (normed_field + curr_val) ** 2
+        denom_scan_val += curr_val ** 2
+
+    return semblance_nom / (2 * (sim_trace_sq + denom_scan_val))
+
+
+@numba.njit(parallel=True, cache=True)
+def cpu_magnetic_inversion(search_x, search_y, search_z, scan_pts, scan_vals, norm_dipole_axis,
+                           semb_vals, scan_max_val, scan_min):
+    """
+    Numba compiled CPU version of cuda_semblance_kernel.
+    Each (x, y) column of the search grid is handled by a different thread, the simulated field
+    buffer is allocated once per column and reused for all of its heights.
+    Args:
+        search_x, search_y, search_z (np.array): Axes of the searched grid.
+        scan_pts (np.array): (n,3) locations of the scan points.
+        scan_vals (np.array): (n,) measured field at each scan point.
+        norm_dipole_axis (np.array): Direction of the simulated dipoles.
+        semb_vals (np.array): (nx,ny,nz) output array of semblance values.
+        scan_max_val (float): Value normalized to 1 in the scan values.
+        scan_min (float): Value normalized to 0 in the scan values.
+    """
+    nx = search_x.shape[0]
+    ny = search_y.shape[0]
+    nz = search_z.shape[0]
+
+    for icol in numba.prange(nx * ny):
+        ix = icol // ny
+        iy = icol % ny
+        mag_field_vals = np.empty(scan_pts.shape[0])
+
+        for iz in range(nz):
+            semb_vals[ix, iy, iz] = voxel_semblance(search_x[ix], search_y[iy], search_z[iz], scan_pts, scan_vals,
+                                                    norm_dipole_axis, mag_field_vals, scan_max_val, scan_min)
+
+
+@numba.njit(parallel=True, cache=True)
+def cpu_semblance_at_points(pts, scan_pts, scan_vals, norm_dipole_axis, semb_vals, scan_max_val, scan_min):
+    """
+    Semblance of a dipole at each of the given (m,3) points, written to the (m,) semb_vals.
+    Same arguments as cpu_magnetic_inversion otherwise.
+    """
+    for ipt in numba.prange(pts.shape[0]):
+        mag_field_vals = np.empty(scan_pts.shape[0])
+        semb_vals[ipt] = voxel_semblance(pts[ipt, 0], pts[ipt, 1], pts[ipt, 2], scan_pts, scan_vals,
+                                         norm_dipole_axis, mag_field_vals, scan_max_val, scan_min)
+
+
+def cuda_magnetic_inversion(search_x, search_y, search_z, scan_pts, scan_vals, norm_dipole_axis,
+                            semb_vals, scan_max_val, scan_min):
+    """
+    Launch the cuda kernel over the whole search grid, same arguments as cpu_magnetic_inversion.
+    The kernel doesn't depend on the number of samples, it's compiled once per process.
+    """
+    num_blocks = min(semb_vals.size, MAX_BLOCKS)
+    cuda_semblance_kernel[num_blocks, THREADS_PER_BLOCK](search_x, search_y, search_z, scan_pts, scan_vals,
+                                                         norm_dipole_axis, semb_vals, scan_max_val, scan_min)
+
+
+@numba.njit(parallel=True, cache=True)
+def cpu_magnetic_sweep(search_x, search_y, search_z, scan_pts, scan_vals, norm_dipole_axes, angles, center,
+                       semb_vals, axis_idxs, angle_idxs, grid_x, grid_y, scan_max_val, scan_min):
+    """
+    Best semblance of each voxel over several rotations of the search grid and dipole directions.
+    The geometry of each scan point (distance and direction to the voxel) is computed once and shared by all
+    the directions, the semblance is accumulated through the single pass sums of cuda_semblance_kernel.
+    Args:
+        search_x, search_y, search_z (np.array): Axes of the searched grid.
+        scan_pts (np.array): (n,3) locations of the scan points.
+        scan_vals (np.array): (n,) measured field at each scan point.
+        norm_dipole_axes (np.array): (d,3) candidate directions of the simulated dipoles.
+        angles (np.array): (r,) rotations (in radians) of the grid around center, as in civilized_cpu_sohograma.
+        center (np.array): (x,y) center of the rotations.
+        semb_vals (np.array): (nx,ny,nz) output array of the best semblance values.
+        axis_idxs (np.array): (nx,ny,nz) output array of the index of the best direction.
+        angle_idxs (np.array): (nx,ny,nz) output array of the index of the best rotation.
+        grid_x, grid_y (np.array): (nx,ny,nz) output arrays of the location of each voxel under its best rotation.
+        scan_max_val (float): Value normalized to 1 in the scan values.
+        scan_min (float): Value normalized to 0 in the scan values.
+    """
+    nx = search_x.shape[0]
+    ny = search_y.shape[0]
+    nz = search_z.shape[0]
+    num_samples = scan_pts.shape[0]
+    num_axes = norm_dipole_axes.shape[0]
+
+    scan_sq = 0.0
+    for ipoint in range(num_samples):
+        scan_sq += ((scan_vals[ipoint] - scan_min) / (scan_max_val - scan_min)) ** 2
+
+    for icol in numba.prange(nx * ny):
+        ix = icol // ny
+        iy = icol % ny
+        field_max = np.empty(num_axes)
+        field_sq = np.empty(num_axes)
+        field_scan = np.empty(num_axes)
+
+        for iz in range(nz):
+            best_semb = -np.inf
+            best_axis = -1
+            best_angle = -1
+            best_x = search_x[ix]
+            best_y = search_y[iy]
+            for iangle in range(angles.shape[0]):
+                diff_x = search_x[ix] - center[0]
+                diff_y = search_y[iy] - center[1]
+                x_grid = (diff_x * np.cos(angles[iangle]) + diff_y * np.sin(angles[iangle])) + center[0]
+                y_grid = (-diff_x * np.sin(angles[iangle]) + diff_y * np.cos(angles[iangle])) + center[1]
+
+                field_max[:] = 0.0
+                field_sq[:] = 0.0
+                field_scan[:] = 0.0
+                for ipoint in range(num_samples):
+                    dipole_vec_x = scan_pts[ipoint, 0] - x_grid
+                    dipole_vec_y = scan_pts[ipoint, 1] - y_grid
+                    dipole_vec_z = scan_pts[ipoint, 2] - search_z[iz]
+
+                    sqrt_dot = (dipole_vec_x**2 + dipole_vec_y**2 + dipole_vec_z**2) ** 0.5
+                    normed_sens_x = dipole_vec_x / sqrt_dot
+                    normed_sens_y = dipole_vec_y / sqrt_dot
+                    normed_sens_z = dipole_vec_z / sqrt_dot
+                    const_val = 1.2566e-6 / (4 * np.pi * (sqrt_dot ** 3))
+                    curr_val = (scan_vals[ipoint] - scan_min) / (scan_max_val - scan_min)
+
+                    for iaxis in range(num_axes):
+                        axis_x = norm_dipole_axes[iaxis, 0]
+                        axis_y = norm_dipole_axes[iaxis, 1]
+                        axis_z = norm_dipole_axes[iaxis, 2]
+                        dot_norm_axis_sen_vec = axis_x * normed_sens_x + axis_y * normed_sens_y + axis_z * normed_sens_z
+
+                        x_part = axis_x * 1e-9 + const_val * (3 * normed_sens_x * dot_norm_axis_sen_vec - axis_x)
+                        y_part = axis_y * 1e-9 + const_val * (3 * normed_sens_y * dot_norm_axis_sen_vec - axis_y)
+                        z_part = axis_z * 1e-9 + const_val * (3 * normed_sens_z * dot_norm_axis_sen_vec - axis_z)
+                        field_val = (x_part ** 2 + y_part ** 2 + z_part ** 2) ** 0.5 * 1e9
+
+                        field_max[iaxis] = max(field_max[iaxis], field_val)
+                        field_sq[iaxis] += field_val ** 2
+                        field_scan[iaxis] += field_val * curr_val
+
+                for iaxis in range(num_axes):
+                    sim_trace_sq = field_sq[iaxis] / field_max[iaxis] ** 2
+                    semblance_nom = sim_trace_sq + 2 * field_scan[iaxis] / field_max[iaxis] + scan_sq
+                    semblance_val = semblance_nom / (2 * (sim_trace_sq + scan_sq))
+                    if semblance_val > best_semb:
+                        best_semb = semblance_val
+                        best_axis = iaxis
+                        best_angle = iangle
+                        best_x = x_grid
+                        best_y = y_grid
+
+            # Voxels with no valid semblance (a scan point on the voxel) are left as nan.
+            semb_vals[ix, iy, iz] = best_semb if best_axis >= 0 else np.nan
+            axis_idxs[ix, iy, iz] = max(best_axis, 0)
+            angle_idxs[ix, iy, iz] = max(best_angle, 0)
+            grid_x[ix, iy, iz] = best_x
+            grid_y[ix, iy, iz] = best_y
+
+
+# Engines already use all the cores (or the gpu), requests served from several threads wait for each other.
+# This also keeps numba's workqueue threading layer from being entered concurrently.
+ENGINE_LOCK = threading.Lock()
+
+INVERSION_ENGINES = {
+    CUDA_ENGINE: cuda_magnetic_inversion,
+    CPU_ENGINE: cpu_magnetic_inversion
+}
+
+
+def compute_semblance(search_x, search_y, search_z, scan_pts, scan_vals, dipole_axis, engine=None,
+                      on_slice=None, is_cancelled=None):
+    """
+    Compute the semblance of a dipole at each voxel of the search grid with the given scan.
+    When on_slice or is_cancelled are given the grid is computed one z-slice at a time.
+    Args:
+        search_x, search_y, search_z (np.array): Axes of the searched grid.
+        scan_pts (np.array): (n,3) locations of the scan points.
+        scan_vals (np.array): (n,) measured field at each scan point.
+        dipole_axis (np.array): Direction of the simulated dipoles.
+        engine (str): One of INVERSION_ENGINES, DEFAULT_ENGINE if not given.
+        on_slice (callable): Called with the z index and the (nx,ny) semblance slice once it's computed.
+        is_cancelled (callable): Checked before each slice, stops the computation once it returns True.
+
+    Returns:
+        (nx,ny,nz) array of semblance values, slices which weren't computed are left as zeros.
+    """
+    engine = DEFAULT_ENGINE if engine is None else engine
+    if engine not in INVERSION_ENGINES:
+        raise ValueError(f'Unknown inversion engine: {engine}')
+
+    inversion_func = INVERSION_ENGINES[engine]
+    search_x = np.ascontiguousarray(search_x, dtype=np.float64)
+    search_y = np.ascontiguousarray(search_y, dtype=np.float64)
+    search_z = np.ascontiguousarray(search_z, dtype=np.float64)
+    scan_pts = np.ascontiguousarray(scan_pts, dtype=np.float64)
+    scan_vals = np.ascontiguousarray(scan_vals, dtype=np.float64)
+    dipole_axis = np.ascontiguousarray(dipole_axis, dtype=np.float64)
+    semb_vals = np.zeros((search_x.shape[0], search_y.shape[0], search_z.shape[0]))
+
+    if on_slice is None and is_cancelled is None:
+        with ENGINE_LOCK:
+            inversion_func(search_x, search_y, search_z, scan_pts, scan_vals, dipole_axis, semb_vals,
+                           scan_vals.max(), scan_vals.mean())
+        return semb_vals
+
+    # Engines need contiguous outputs, compute each slice separately and copy it in place.
+    slice_vals = np.zeros((search_x.shape[0], search_y.shape[0], 1))
+    for iz in range(search_z.shape[0]):
+        if is_cancelled is not None and is_cancelled():
+            break
+
+        with ENGINE_LOCK:
+            inversion_func(search_x, search_y, search_z[iz:iz+1], scan_pts, scan_vals, dipole_axis, slice_vals,
+                           scan_vals.max(), scan_vals.mean())
+        semb_vals[:, :, iz] = slice_vals[:, :, 0]
+        if on_slice is not None:
+            on_slice(iz, semb_vals[:, :, iz])
+
+    return semb_vals
+
+
+def semblance_at_points(pts, scan_pts, scan_vals, dipole_axis):
+    """
+    Semblance of a dipole at arbitrary (m,3) points rather than over a grid, computed on the cpu.
+    The scan values are normalized the same way as in compute_semblance.
+    """
+    pts = np.ascontiguousarray(pts, dtype=np.float64)
+    scan_pts = np.ascontiguousarray(scan_pts, dtype=np.float64)
+    scan_vals = np.ascontiguousarray(scan_vals, dtype=np.float64)
+    dipole_axis = np.ascontiguousarray(dipole_axis, dtype=np.float64)
+    semb_vals = np.zeros(pts.shape[0])
+    with ENGINE_LOCK:
+        cpu_semblance_at_points(pts, scan_pts, scan_vals, dipole_axis, semb_vals, scan_vals.max(), scan_vals.mean())
+    return semb_vals
+
+
+def compute_semblance_sweep(search_x, search_y, search_z, scan_pts, scan_vals, dipole_axes, angles, center):
+    """
+    Sweep the candidate dipole directions and rotations of the search grid in one pass, computed on the cpu.
+    Args:
+        search_x, search_y, search_z (np.array): Axes of the searched grid.
+        scan_pts (np.array): (n,3) locations of the scan points.
+        scan_vals (np.array): (n,) measured field at each scan point.
+        dipole_axes (np.array): (d,3) candidate directions of the simulated dipoles.
+        angles (np.array): (r,) rotations (in radians) of the search grid.
+        center (np.array): (x,y) center of the rotations.
+
+    Returns:
+        SweepResult of (nx,ny,nz) cubes.
+    """
+    search_x = np.ascontiguousarray(search_x, dtype=np.float64)
+    search_y = np.ascontiguousarray(search_y, dtype=np.float64)
+    search_z = np.ascontiguousarray(search_z, dtype=np.float64)
+    scan_pts = np.ascontiguousarray(scan_pts, dtype=np.float64)
+    scan_vals = np.ascontiguousarray(scan_vals, dtype=np.float64)
+    dipole_axes = np.ascontiguousarray(np.reshape(dipole_axes, (-1, 3)), dtype=np.float64)
+    angles = np.ascontiguousarray(np.reshape(angles, -1), dtype=np.float64)
+    center = np.ascontiguousarray(center, dtype=np.float64)
+    if dipole_axes.shape[0] == 0 or angles.shape[0] == 0:
+        raise ValueError('The sweep needs at least one dipole axis and one angle')
+
+    shape = (search_x.shape[0], search_y.shape[0], search_z.shape[0])
+    result = SweepResult(semb_vals=np.zeros(shape), axis_idxs=np.zeros(shape, dtype=np.int32),
+                         angle_idxs=np.zeros(shape, dtype=np.int32), grid_x=np.zeros(shape),
+                         grid_y=np.zeros(shape))
+    with ENGINE_LOCK:
+        cpu_magnetic_sweep(search_x, search_y, search_z, scan_pts, scan_vals, dipole_axes, angles, center,
+                           result.semb_vals, result.axis_idxs, result.angle_idxs, result.grid_x, result.grid_y,
+                           scan_vals.max(), scan_vals.mean())
+    return result
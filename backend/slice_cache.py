@@ -0,0 +1,116 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+import numpy as np
+from localizations.sohograma import compute_semblance
+
+"""
+Cache of computed semblance z-slices.
+A slice only depends on the scan, the (x, y) axes of the grid, the dipole axis and its depth, so repeated
+requests (or requests with an overlapping z range) only compute the depths which weren't computed before.
+The least recently used slices are evicted once the cache holds more than its byte budget.
+"""
+
+# Byte budget of the slices kept by the server, can be overridden through the environment.
+MAX_CACHE_BYTES = int(os.environ.get('SOHOGRAMA_CACHE_BYTES', 512 * 2 ** 20))
+
+# Depths are rounded to this many decimals in the keys, fractional resolutions don't produce exact values.
+DEPTH_DECIMALS = 6
+
+
+def scenario_key(search_x, search_y, scan_pts, scan_vals, dipole_axis):
+    """
+    Digest of everything a z-slice depends on except its depth.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    for arr in (search_x, search_y, scan_pts, scan_vals, dipole_axis):
+        arr = np.ascontiguousarray(arr, dtype=np.float64)
+        digest.update(str(arr.shape).encode())
+        digest.update(arr)
+    return digest.hexdigest()
+
+
+class SliceCache():
+
+    def __init__(self, max_bytes=MAX_CACHE_BYTES) -> None:
+        self.max_bytes = max_bytes
+        self.num_bytes = 0
+        self.slices = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            slice_vals = self.slices.get(key)
+            if slice_vals is not None:
+                self.slices.move_to_end(key)
+            return slice_vals
+
+    def put(self, key, slice_vals):
+        # Slices larger than the whole budget are never kept.
+        if slice_vals.nbytes > self.max_bytes:
+            return
+
+        slice_vals = np.array(slice_vals)
+        slice_vals.flags.writeable = False
+        with self.lock:
+            if key in self.slices:
+                self.num_bytes -= self.slices.pop(key).nbytes
+            self.slices[key] = slice_vals
+            self.num_bytes += slice_vals.nbytes
+
+            while self.num_bytes > self.max_bytes:
+                _, evicted = self.slices.popitem(last=False)
+                self.num_bytes -= evicted.nbytes
+
+    def clear(self):
+        with self.lock:
+            self.slices.clear()
+            self.num_bytes = 0
+
+
+def cached_semblance(cache, search_x, search_y, search_z, scan_pts, scan_vals, dipole_axis, engine=None,
+                     on_slice=None, is_cancelled=None):
+    """
+    Same as compute_semblance, slices found in the cache are reused and the missing ones are computed and cached.
+    Cached slices are reported through on_slice before the computation starts.
+    """
+    key = scenario_key(search_x, search_y, scan_pts, scan_vals, dipole_axis)
+    depth_keys = [(key, round(float(z), DEPTH_DECIMALS)) for z in search_z]
+    semb_vals = np.zeros((len(search_x), len(search_y), len(search_z)))
+
+    missing = []
+    for iz, depth_key in enumerate(depth_keys):
+        slice_vals = cache.get(depth_key)
+        if slice_vals is None:
+            missing.append(iz)
+            continue
+
+        semb_vals[:, :, iz] = slice_vals
+        if on_slice is not None:
+            on_slice(iz, semb_vals[:, :, iz])
+
+    print(f'Semblance cache: {len(search_z) - len(missing)} cached slices, {len(missing)} computed')
+    if not missing:
+        return semb_vals
+
+    missing = np.array(missing)
+
+    def on_missing_slice(imissing, slice_vals):
+        iz = missing[imissing]
+        semb_vals[:, :, iz] = slice_vals
+        cache.put(depth_keys[iz], slice_vals)
+        if on_slice is not None:
+            on_slice(iz, semb_vals[:, :, iz])
+
+    # Without callbacks the whole missing cube is computed at once.
+    if on_slice is None and is_cancelled is None:
+        missing_vals = compute_semblance(search_x, search_y, np.asarray(search_z)[missing], scan_pts, scan_vals,
+                                         dipole_axis, engine=engine)
+        for imissing in range(missing.shape[0]):
+            on_missing_slice(imissing, missing_vals[:, :, imissing])
+    else:
+        compute_semblance(search_x, search_y, np.asarray(search_z)[missing], scan_pts, scan_vals, dipole_axis,
+                          engine=engine, on_slice=on_missing_slice, is_cancelled=is_cancelled)
+
+    return semb_vals
@@ -0,0 +1,41 @@
+import os
+import subprocess
+import sys
+
+"""
+The cuda kernel is checked on the cpu through numba's simulator. NUMBA_ENABLE_CUDASIM is read when numba is first
+imported, so the comparison runs in its own interpreter.
+"""
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+COMPARE_ENGINES = '''
+import numpy as np
+from numba import config
+from localizations import sohograma
+
+assert config.ENABLE_CUDASIM
+rng = np.random.default_rng(0)
+# Neither the number of voxels (5*3*2) nor the number of scan points is a multiple of THREADS_PER_BLOCK.
+search_x, search_y, search_z = np.arange(0., 10., 2.), np.arange(0., 9., 3.), np.array([-5., -2.])
+scan_pts = np.column_stack((rng.uniform(0, 10, 301), rng.uniform(0, 10, 301), np.zeros(301)))
+scan_vals = 4.5e4 + rng.normal(0, 5, 301)
+dipole_axis = np.array([0., 1., -1.]) / np.sqrt(2)
+semb_vals = {}
+for engine in (sohograma.cpu_magnetic_inversion, sohograma.cuda_magnetic_inversion):
+    semb_vals[engine] = np.zeros((5, 3, 2))
+    engine(search_x, search_y, search_z, scan_pts, scan_vals, dipole_axis, semb_vals[engine],
+           scan_vals.max(), scan_vals.mean())
+diff = np.abs(semb_vals[sohograma.cpu_magnetic_inversion] - semb_vals[sohograma.cuda_magnetic_inversion])
+print(diff.max())
+'''
+
+
+def test_cuda_kernel_simulator():
+    "cuda_magnetic_inversion against cpu_magnetic_inversion on the cuda simulator"
+    env = dict(os.environ, NUMBA_ENABLE_CUDASIM='1')
+    result = subprocess.run([sys.executable, '-c', COMPARE_ENGINES], cwd=BACKEND_DIR, env=env,
+                            capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+    max_diff = float(result.stdout.split()[-1])
+    assert max_diff <= 1e-12, 'max diff: %g' % (max_diff)
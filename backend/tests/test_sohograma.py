@@ -0,0 +1,58 @@
+import numpy as np
+
+from localizations.sohograma import compute_semblance, compute_semblance_sweep, CPU_ENGINE
+from localizations.peaks import extract_peaks
+
+dipole_axis = np.array([0., 1., -1.]) / np.sqrt(2)
+source = np.array([3., -4., -4.])
+
+
+def dipole_field(pts, location, axis):
+    "Total field of a unit dipole on top of a 1nT field along its axis"
+    vecs = pts - location
+    dists = np.linalg.norm(vecs, axis=1)[:, None]
+    normed = vecs / dists
+    field = axis * 1e-9 + 1.2566e-6 / (4 * np.pi * dists ** 3) * (3 * normed * (normed @ axis)[:, None] - axis)
+    return np.linalg.norm(field, axis=1) * 1e9
+
+
+search_x = np.arange(-8., 9.)
+search_y = np.arange(-8., 9.)
+search_z = np.arange(-6., -2.)
+scan_xs, scan_ys = np.meshgrid(np.linspace(-10, 10, 21), np.linspace(-10, 10, 21))
+scan_pts = np.column_stack((scan_xs.ravel(), scan_ys.ravel(), np.zeros(scan_xs.size)))
+scan_vals = dipole_field(scan_pts, source, dipole_axis)
+
+
+def test_sweep_no_rotation():
+    "compute_semblance_sweep with a single direction and angle 0 against compute_semblance"
+    full = compute_semblance(search_x, search_y, search_z, scan_pts, scan_vals, dipole_axis, engine=CPU_ENGINE)
+    sweep = compute_semblance_sweep(search_x, search_y, search_z, scan_pts, scan_vals, [dipole_axis], [0.],
+                                    np.zeros(2))
+    diff = np.abs(sweep.semb_vals - full)
+    assert np.nanmax(diff) <= 1e-12, 'max diff: %g' % (np.nanmax(diff))
+
+
+def test_sweep_rotated_peak():
+    "Peaks of a rotated sweep are located at the rotated voxel, same as without the rotation"
+    full = compute_semblance(search_x, search_y, search_z, scan_pts, scan_vals, dipole_axis, engine=CPU_ENGINE)
+    expected = extract_peaks(full, search_x, search_y, search_z)
+    sweep = compute_semblance_sweep(search_x, search_y, search_z, scan_pts, scan_vals, [dipole_axis],
+                                    [np.pi / 2], np.zeros(2))
+    peaks = extract_peaks(sweep.semb_vals, search_x, search_y, search_z, grid_x=sweep.grid_x,
+                          grid_y=sweep.grid_y)
+    assert np.allclose(peaks[0, :2], source[:2]), 'best peak: %s' % (peaks[0, :3])
+    assert np.allclose(peaks[0], expected[0]), 'best peak: %s expected: %s' % (peaks[0], expected[0])
+
+
+def test_sweep_best_angle_location():
+    "Each voxel of a sweep is located under the angle reaching its semblance"
+    angles = np.array([0., np.pi / 3])
+    sweep = compute_semblance_sweep(search_x, search_y, search_z, scan_pts, scan_vals, [dipole_axis], angles,
+                                    np.zeros(2))
+    xs, ys = np.meshgrid(search_x, search_y, indexing='ij')
+    chosen = angles[sweep.angle_idxs[:, :, 0]]
+    grid_x = xs * np.cos(chosen) + ys * np.sin(chosen)
+    grid_y = -xs * np.sin(chosen) + ys * np.cos(chosen)
+    assert np.allclose(sweep.grid_x[:, :, 0], grid_x)
+    assert np.allclose(sweep.grid_y[:, :, 0], grid_y)
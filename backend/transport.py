@@ -0,0 +1,60 @@
+import io
+import json
+import time
+from collections import namedtuple
+import numpy as np
+
+"""
+Binary wire format for the arrays exchanged between the GUI and the backend.
+Arrays are packed in a .npz archive (optionally deflate compressed), the scalar parameters of a
+request are carried next to them as a json document stored under META_KEY.
+Shared by both sides - the backend imports it as `transport` and the GUI as `backend.transport`.
+"""
+
+NPZ_MIMETYPE = 'application/x-npz'
+
+JSON_MIMETYPE = 'application/json'
+
+META_KEY = '__meta__'
+
+# Time (in seconds) it took to encode/decode a payload and the payload size in bytes.
+TransportStats = namedtuple('TransportStats', 'seconds num_bytes')
+
+
+def encode_arrays(arrays, meta=None, compress=False):
+    """
+    Pack the given arrays into a single npz payload.
+    Args:
+        arrays (dict): Maps a name to a numpy array.
+        meta (dict): Json serializable scalar parameters sent along with the arrays.
+        compress (bool): Deflate the arrays, slower but smaller for smooth data.
+
+    Returns:
+        Tuple of the payload bytes and its TransportStats.
+    """
+    start = time.perf_counter()
+    buffer = io.BytesIO()
+    content = {name: np.ascontiguousarray(arr) for name, arr in arrays.items()}
+    content[META_KEY] = np.frombuffer(json.dumps(meta or {}).encode(), dtype=np.uint8)
+
+    save_func = np.savez_compressed if compress else np.savez
+    save_func(buffer, **content)
+    payload = buffer.getvalue()
+    return payload, TransportStats(seconds=time.perf_counter() - start, num_bytes=len(payload))
+
+
+def decode_arrays(payload):
+    """
+    Unpack a payload created by encode_arrays.
+    Args:
+        payload (bytes): Raw npz payload.
+
+    Returns:
+        Tuple of the arrays dictionary, the meta dictionary and the TransportStats.
+    """
+    start = time.perf_counter()
+    with np.load(io.BytesIO(payload), allow_pickle=False) as npz:
+        arrays = {name: npz[name] for name in npz.files if name != META_KEY}
+        meta = json.loads(npz[META_KEY].tobytes().decode()) if META_KEY in npz.files else {}
+
+    return arrays, meta, TransportStats(seconds=time.perf_counter() - start, num_bytes=len(payload))
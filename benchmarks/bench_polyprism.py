@@ -0,0 +1,55 @@
+import argparse
+import time
+import numpy as np
+from fatiando.mesher import PolygonalPrism
+from fatiando.gravmag import _polyprism_numpy, _polyprism_numba
+from simulations.mag_object import EARTH_INC, EARTH_DEC
+
+"""
+Benchmark of the total field of a polygonal prism, numpy kernels against the fused numba kernel.
+Run from the repository root:
+    python -m benchmarks.bench_polyprism --points 1000000
+"""
+
+# The numpy implementation still relies on the removed np.float alias.
+if not hasattr(np, 'float'):
+    np.float = float
+
+
+def time_tf(tf, scan_pts, prisms, moment):
+    start = time.perf_counter()
+    field = tf(xp=scan_pts[:, 0], yp=scan_pts[:, 1], zp=scan_pts[:, 2], prisms=prisms,
+               inc=EARTH_INC, dec=EARTH_DEC, pmag=moment)
+    return time.perf_counter() - start, field
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--points', type=int, default=10 ** 6, help='Number of scan points.')
+    parser.add_argument('--vertices', type=int, default=4, help='Number of vertices of the prism.')
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    scan_pts = np.empty((args.points, 3))
+    scan_pts[:, :2] = rng.uniform(-100, 100, (args.points, 2))
+    scan_pts[:, 2] = 0.3
+
+    angles = np.linspace(0, 2 * np.pi, args.vertices, endpoint=False)
+    vertices = np.column_stack((10 * np.cos(angles), 10 * np.sin(angles)))
+    prisms = [PolygonalPrism(vertices=vertices.tolist(), z1=5, z2=3)]
+    moment = 2.0
+
+    # The first call compiles the kernel (or loads it from numba's cache).
+    compile_time, _ = time_tf(_polyprism_numba.tf, scan_pts[:10], prisms, moment)
+    print(f'Numba compilation: {compile_time:.2f}s')
+
+    numpy_time, numpy_field = time_tf(_polyprism_numpy.tf, scan_pts, prisms, moment)
+    print(f'Numpy kernels: {numpy_time:.2f}s')
+
+    numba_time, numba_field = time_tf(_polyprism_numba.tf, scan_pts, prisms, moment)
+    print(f'Fused numba kernel: {numba_time:.2f}s ({numpy_time / numba_time:.1f}x)')
+    print(f'Max difference: {np.abs(numba_field - numpy_field).max():.2e}nT')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+import argparse
+import os
+import tempfile
+import time
+import numpy as np
+from utils.survey_reader import read_survey, get_cache_path
+
+"""
+Benchmark of the survey reader over a synthetic csv log.
+Run from the repository root:
+    python -m benchmarks.bench_survey_reader --rows 10000000
+"""
+
+# Rows written to the synthetic log at a time.
+WRITE_CHUNK_ROWS = 10 ** 6
+
+
+def write_synthetic_survey(path, num_rows, seed=0):
+    """
+    Csv log of a walk over a 100x100m field sampled at 10Hz, with a header line.
+    """
+    rng = np.random.default_rng(seed)
+    with open(path, 'w') as survey_file:
+        survey_file.write('x,y,z,time,value\n')
+        for start in range(0, num_rows, WRITE_CHUNK_ROWS):
+            num_chunk_rows = min(WRITE_CHUNK_ROWS, num_rows - start)
+            rows = np.empty((num_chunk_rows, 5))
+            rows[:, :2] = rng.uniform(0, 100, (num_chunk_rows, 2))
+            rows[:, 2] = rng.uniform(0.3, 0.5, num_chunk_rows)
+            rows[:, 3] = (start + np.arange(num_chunk_rows)) / 10
+            rows[:, 4] = 4.5e4 + rng.normal(0, 5, num_chunk_rows)
+            np.savetxt(survey_file, rows, fmt='%.3f,%.3f,%.3f,%.1f,%.4f')
+
+
+def time_loadtxt(path, num_rows, max_rows):
+    """
+    Time np.loadtxt over the first max_rows rows and extrapolate to the whole log.
+    """
+    start = time.perf_counter()
+    np.loadtxt(path, delimiter=',', skiprows=1, max_rows=max_rows)
+    return (time.perf_counter() - start) * num_rows / min(max_rows, num_rows)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=10 ** 7, help='Number of rows in the synthetic log.')
+    parser.add_argument('--loadtxt-rows', type=int, default=10 ** 6,
+                        help='Number of rows timed with np.loadtxt.')
+    parser.add_argument('--path', default=None, help='Existing log to read instead of a synthetic one.')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = args.path
+        if path is None:
+            path = os.path.join(tmp_dir, 'survey.csv')
+            start = time.perf_counter()
+            write_synthetic_survey(path, args.rows)
+            print(f'Wrote {args.rows} rows ({os.path.getsize(path) / 2 ** 20:.0f}MB) in '
+                  f'{time.perf_counter() - start:.1f}s')
+
+        num_rows = read_survey(path, use_cache=False).values.shape[0] if args.path is not None else args.rows
+        print(f'np.loadtxt (extrapolated): {time_loadtxt(path, num_rows, args.loadtxt_rows):.2f}s')
+
+        start = time.perf_counter()
+        read_survey(path, use_cache=False)
+        print(f'Chunked parse: {time.perf_counter() - start:.2f}s')
+
+        cache_path = get_cache_path(path)
+        if os.path.exists(cache_path):
+            os.remove(cache_path)
+
+        start = time.perf_counter()
+        read_survey(path)
+        print(f'Chunked parse into the binary cache: {time.perf_counter() - start:.2f}s')
+
+        start = time.perf_counter()
+        survey = read_survey(path)
+        print(f'Memory mapped cache: {time.perf_counter() - start:.3f}s')
+
+        start = time.perf_counter()
+        survey.values.max()
+        print(f'Max of the mapped values: {time.perf_counter() - start:.3f}s')
+
+
+if __name__ == "__main__":
+    main()
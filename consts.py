@@ -1,3 +1,5 @@
+import os
+
 
 DEFAULT_MOMENT = '1'
 
@@ -6,3 +8,9 @@ DEFAULT_DEPTH = '-5'
 DEFAULT_DIPOLE_ZDIM = '0'
 
 DEFAULT_MAGOBJ_ZDIM = '0.1'
+
+# Empty - objects are modelled at every scan point.
+DEFAULT_ACCURACY = ''
+
+# Print debug output such as frame times and cache statistics, enabled with MAGSTUDIO_DEBUG=1.
+DEBUG = os.environ.get('MAGSTUDIO_DEBUG', '0') == '1'
@@ -0,0 +1,140 @@
+"""
+A numba implementation of the total-field anomaly of polygonal prisms.
+
+The numpy implementation computes each of the six second derivatives of the
+prism's volume integral (``kernelxx`` ... ``kernelzz``) separately, going over
+the edges six times and computing the same distances, logarithms and
+arctangents in each pass. Here they are computed once per edge and shared by
+all six terms, and the observation points are split between threads.
+
+tf has the same signature as fatiando.gravmag._polyprism_numpy.tf and is used
+in its place when the compiled extension isn't available.
+"""
+from __future__ import division
+import math
+import numba
+import numpy
+
+from .. import utils
+from ..constants import CM, T2NT
+
+
+# Used to avoid singularities, same as the numpy implementation.
+DUMMY = 10. ** (-10)
+
+
+def tf(xp, yp, zp, prisms, inc, dec, pmag=None):
+    """
+    Total-field anomaly of polygonal prisms, same as
+    fatiando.gravmag.polyprism.tf.
+    """
+    if xp.shape != yp.shape != zp.shape:
+        raise ValueError("Input arrays xp, yp, and zp must have same shape!")
+    xp = numpy.asarray(xp, dtype=numpy.float64)
+    yp = numpy.asarray(yp, dtype=numpy.float64)
+    zp = numpy.asarray(zp, dtype=numpy.float64)
+    # Calculate the 3 components of the unit vector in the direction of the
+    # regional field
+    fx, fy, fz = utils.dircos(inc, dec)
+    if pmag is not None:
+        if isinstance(pmag, float) or isinstance(pmag, int):
+            pmx, pmy, pmz = pmag * fx, pmag * fy, pmag * fz
+        else:
+            pmx, pmy, pmz = pmag
+    res = numpy.zeros(len(xp), dtype=numpy.float64)
+    for prism in prisms:
+        if prism is None or ('magnetization' not in prism.props
+                             and pmag is None):
+            continue
+        if pmag is None:
+            mag = prism.props['magnetization']
+            if isinstance(mag, float) or isinstance(mag, int):
+                mx, my, mz = mag * fx, mag * fy, mag * fz
+            else:
+                mx, my, mz = mag
+        else:
+            mx, my, mz = pmx, pmy, pmz
+        x = numpy.asarray(prism.x, dtype=numpy.float64)
+        y = numpy.asarray(prism.y, dtype=numpy.float64)
+        _tf(xp, yp, zp, x, y, float(prism.z1), float(prism.z2),
+            float(mx), float(my), float(mz), fx, fy, fz, res)
+    res *= CM * T2NT
+    return res
+
+
+@numba.jit(nopython=True, parallel=True, cache=True)
+def _tf(xp, yp, zp, x, y, z1, z2, mx, my, mz, fx, fy, fz, res):
+    """
+    Add the total-field anomaly of a single prism (without the CM * T2NT
+    factor) to res.
+    """
+    nverts = x.shape[0]
+    for i in numba.prange(xp.shape[0]):
+        Z1 = z1 - zp[i]
+        Z2 = z2 - zp[i]
+        v1, v2, v3, v4, v5, v6 = _kernels(xp[i], yp[i], Z1, Z2, x, y, nverts)
+        bx = v1 * mx + v2 * my + v3 * mz
+        by = v2 * mx + v4 * my + v5 * mz
+        bz = v3 * mx + v5 * my + v6 * mz
+        res[i] += fx * bx + fy * by + fz * bz
+
+
+@numba.jit(nopython=True, cache=True)
+def _kernels(xp, yp, Z1, Z2, x, y, nverts):
+    """
+    The six kernels (xx, xy, xz, yy, yz, zz) of a prism at a single point.
+    Same terms as _integral_v1 ... _integral_v6 of the numpy implementation.
+    """
+    v1 = v2 = v3 = v4 = v5 = v6 = 0.
+    Z1_sqr = Z1 * Z1
+    Z2_sqr = Z2 * Z2
+    for k in range(nverts):
+        X1 = x[k] - xp
+        X2 = x[(k + 1) % nverts] - xp
+        Y1 = y[k] - yp
+        Y2 = y[(k + 1) % nverts] - yp
+        # Terms of the edge shared by all the kernels
+        aux0 = X2 - X1 + DUMMY
+        aux1 = Y2 - Y1 + DUMMY
+        n = aux0 / aux1
+        g = X1 - Y1 * n
+        m = aux1 / aux0
+        c = Y1 - X1 * m
+        aux2 = math.sqrt(aux0 * aux0 + aux1 * aux1)
+        p = (X1 * Y2 - X2 * Y1) / aux2 + DUMMY
+        d1 = (aux0 * X1 + aux1 * Y1) / aux2 + DUMMY
+        d2 = (aux0 * X2 + aux1 * Y2) / aux2 + DUMMY
+        aux6 = X1 * X1 + Y1 * Y1
+        aux7 = X2 * X2 + Y2 * Y2
+        R11 = math.sqrt(aux6 + Z1_sqr)
+        R12 = math.sqrt(aux6 + Z2_sqr)
+        R21 = math.sqrt(aux7 + Z1_sqr)
+        R22 = math.sqrt(aux7 + Z2_sqr)
+        atan2 = (math.atan2(Z2 * d2, p * R22) -
+                 math.atan2(Z1 * d2, p * R21))
+        atan1 = (math.atan2(Z2 * d1, p * R12) -
+                 math.atan2(Z1 * d1, p * R11))
+        log_z = ((math.log(Z2 + R12 + DUMMY) - math.log(Z1 + R11 + DUMMY)) -
+                 (math.log(Z2 + R22 + DUMMY) - math.log(Z1 + R21 + DUMMY)))
+        log_d2 = (math.log((R22 - d2) / (R22 + d2) + DUMMY) -
+                  math.log((R21 - d2) / (R21 + d2) + DUMMY)) / (2 * d2)
+        log_d1 = (math.log((R12 - d1) / (R12 + d1) + DUMMY) -
+                  math.log((R11 - d1) / (R11 + d1) + DUMMY)) / (2 * d1)
+        atan2_pd = atan2 / (p * d2)
+        atan1_pd = atan1 / (p * d1)
+        patan2_d = p * atan2 / d2
+        patan1_d = p * atan1 / d1
+        n_sqr = 1.0 + n * n
+        m_sqr = 1.0 + m * m
+        v1 -= ((g * Y2 * atan2_pd + n * patan2_d) -
+               (g * Y1 * atan1_pd + n * patan1_d) + n * log_z) / n_sqr
+        v2 += (((g * g + g * n * Y2) * atan2_pd - patan2_d) -
+               ((g * g + g * n * Y1) * atan1_pd - patan1_d) - log_z) / n_sqr
+        v3 -= ((Y2 * n_sqr + g * n) * log_d2 -
+               (Y1 * n_sqr + g * n) * log_d1) / n_sqr
+        v4 += ((c * X2 * atan2_pd + m * patan2_d) -
+               (c * X1 * atan1_pd + m * patan1_d) + m * log_z) / m_sqr
+        v5 += ((X2 * m_sqr + c * m) * log_d2 -
+               (X1 * m_sqr + c * m) * log_d1) / m_sqr
+        v6 += atan2 - atan1
+    return v1, v2, v3, v4, v5, v6
@@ -1,7 +1,8 @@
 import numpy as np
 
 from fatiando.mesher import PolygonalPrism, Prism
-from fatiando.gravmag import polyprism, prism, _polyprism_numpy
+from fatiando.gravmag import polyprism, prism, _polyprism_numpy, \
+    _polyprism_numba
 from fatiando import utils
 
 model = None
@@ -326,3 +327,20 @@ def test_kernelzz_numpy():
         py = _polyprism_numpy.kernelzz(xp, yp, zp, p)
         diff = np.abs(py - cy)
         assert np.all(diff <= precision), 'max diff: %g' % (max(diff))
+
+
+def test_tf_numba():
+    "polyprism.tf numpy vs numba implementation"
+    py = _polyprism_numpy.tf(xp, yp, zp, model, inc, dec)
+    nb = _polyprism_numba.tf(xp, yp, zp, model, inc, dec)
+    diff = np.abs(nb - py)
+    assert np.all(diff <= precision_mag), 'max diff: %g' % (max(diff))
+
+
+def test_tf_numba_pmag():
+    "polyprism.tf numpy vs numba implementation with pmag"
+    for pmag in [3., [1., 2., -3.]]:
+        py = _polyprism_numpy.tf(xp, yp, zp, model, inc, dec, pmag=pmag)
+        nb = _polyprism_numba.tf(xp, yp, zp, model, inc, dec, pmag=pmag)
+        diff = np.abs(nb - py)
+        assert np.all(diff <= precision_mag), 'max diff: %g' % (max(diff))
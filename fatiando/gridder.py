@@ -710,7 +710,7 @@ def unpad_array(a, nps):
     o = []
     for ii in range(0, a.ndim):
         o.append(slice(nps[ii][0], a.shape[ii] - nps[ii][1]))
-    b = a[o]
+    b = a[tuple(o)]
 
     return b
 
@@ -807,10 +807,8 @@ def _costaper(a, lp, rp):
 def _calccostaper(ntp):
     # Used by _costaper to compute a cosine taper from 1 to zero over
     # ntp points
-    tp = numpy.zeros(ntp)
-    for ii in range(1, ntp + 1):
-        tp[ii-1] = (1.0 + numpy.cos((ii*numpy.pi) / float(ntp))/2.) - 0.5
-    return tp
+    ii = numpy.arange(1, ntp + 1)
+    return (1.0 + numpy.cos((ii*numpy.pi) / float(ntp))/2.) - 0.5
 
 
 def _nextpow2(ii):
@@ -0,0 +1,60 @@
+from collections import OrderedDict, namedtuple
+
+"""
+LRU cache of interpolated grids, bounded by the total size of the cached arrays.
+"""
+
+# By default keep up to 256MB of interpolated grids.
+DEFAULT_CACHE_BYTES = 256 * 2 ** 20
+
+InterpKey = namedtuple('InterpKey', 'geometry_hash field_hash interp_type grid_shape')
+
+CacheStats = namedtuple('CacheStats', 'hits misses entries num_bytes max_bytes')
+
+
+class InterpCache():
+
+    def __init__(self, max_bytes=DEFAULT_CACHE_BYTES) -> None:
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.num_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """
+        Cached grid of the given InterpKey or None, the returned arrays are read only.
+        """
+        grid = self.entries.get(key)
+        if grid is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return grid
+
+    def put(self, key, grid):
+        if grid.nbytes > self.max_bytes:
+            return
+
+        if key in self.entries:
+            self.num_bytes -= self.entries.pop(key).nbytes
+
+        grid.setflags(write=False)
+        self.entries[key] = grid
+        self.num_bytes += grid.nbytes
+
+        # Evict the least recently used grids until we're within budget.
+        while self.num_bytes > self.max_bytes:
+            _, evicted = self.entries.popitem(last=False)
+            self.num_bytes -= evicted.nbytes
+
+    def clear(self):
+        self.entries.clear()
+        self.num_bytes = 0
+
+    @property
+    def stats(self):
+        return CacheStats(hits=self.hits, misses=self.misses, entries=len(self.entries),
+                          num_bytes=self.num_bytes, max_bytes=self.max_bytes)
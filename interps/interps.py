@@ -2,12 +2,46 @@ from re import search
 from scipy.interpolate import NearestNDInterpolator
 import numpy as np
 from enum import Enum
-from collections import namedtuple
-from scipy.spatial.distance import cdist
+from collections import namedtuple, OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+import hashlib
+from scipy.spatial import cKDTree
 from pykrige.ok import OrdinaryKriging
 
 InterpContent = namedtuple('InterpContent','value display_str interp_func')
 
+# Number of nearest scan points averaged at each grid node, neighbours=len(scan_pts) and power=1 average all of them.
+IDW_NEIGHBOURS = 16
+
+# Weights are 1 / distance ** IDW_POWER.
+IDW_POWER = 2
+
+# Grid nodes queried at once, bounds the (chunk, neighbours) distance arrays.
+IDW_CHUNK_SIZE = 2 ** 16
+
+# Grid nodes closer than this to a scan point take its value as is.
+EXACT_HIT_DIST = 1e-9
+
+# Up to this many scan points kriging solves a single global system, above it each node is
+# kriged from its KRIGING_NEIGHBOURS nearest scan points.
+GLOBAL_KRIGING_MAX_SAMPLES = 2000
+
+KRIGING_NEIGHBOURS = 32
+
+# Side (in grid nodes) of the tiles kriged by each worker process.
+KRIGING_TILE_SIZE = 64
+
+# The variogram fit is quadratic in the number of samples, fit it over a random subset.
+VARIOGRAM_MAX_SAMPLES = 2000
+
+KRIGING_VARIOGRAM_MODEL = 'linear'
+
+# Fitted variograms kept in the variogram cache of a scenario (see Scenario.variogram_cache).
+MAX_CACHED_VARIOGRAMS = 8
+
+# (max_workers, pool) of the tiled kriging, started on first use and reused by later calls.
+_kriging_pool = None
+
 def nearest_interp(scan_pts, scan_vals, search_x, search_y):
     interpolator = NearestNDInterpolator(x=scan_pts[:, :2], y=scan_vals)
     
@@ -15,30 +49,168 @@ def nearest_interp(scan_pts, scan_vals, search_x, search_y):
     z = interpolator(x, y)
     return z
 
-def weighted_average(scan_pts, scan_vals, search_x, search_y):
+def weighted_average(scan_pts, scan_vals, search_x, search_y, neighbours=IDW_NEIGHBOURS, power=IDW_POWER,
+                     radius=None, chunk_size=IDW_CHUNK_SIZE, workers=-1):
+    """
+    Inverse distance weighting over the nearest scan points of each grid node.
+    Args:
+        scan_pts (np.array): (n,2+) locations of the scan points.
+        scan_vals (np.array): (n,) values at the scan points.
+        search_x, search_y (np.array): Axes of the interpolated grid.
+        neighbours (int): Number of nearest scan points weighted at each node.
+        power (float): Power of the inverse distance weights.
+        radius (float): If given, only scan points within this distance are weighted. Nodes with
+                        no scan point in range take the value of their nearest scan point.
+        chunk_size (int): Number of grid nodes processed at once.
+        workers (int): Number of threads used by the kd-tree queries, -1 uses all of them.
+
+    Returns:
+        (len(search_x), len(search_y)) array of interpolated values.
+    """
     x, y = np.meshgrid(search_x, search_y, indexing='ij')
     grid_pts = np.vstack((x.reshape(-1), y.reshape(-1))).T
-    dist_mat = cdist(grid_pts, scan_pts[:, :2])
-    1 / dist_mat
-    z_vals = np.sum(((1/dist_mat)*scan_vals), axis=1) / (np.sum((1/dist_mat), axis=1))
+    
+    tree = cKDTree(scan_pts[:, :2])
+    neighbours = min(neighbours, scan_pts.shape[0])
+    upper_bound = np.inf if radius is None else radius
+    
+    # Pad the values so missing neighbours (index n when outside the radius) can be indexed safely.
+    padded_vals = np.append(scan_vals, 0)
+    z_vals = np.empty(grid_pts.shape[0])
+    
+    for start in range(0, grid_pts.shape[0], chunk_size):
+        chunk = grid_pts[start:start+chunk_size]
+        dists, idxs = tree.query(chunk, k=neighbours, distance_upper_bound=upper_bound, workers=workers)
+        dists = dists.reshape(chunk.shape[0], -1)
+        idxs = idxs.reshape(chunk.shape[0], -1)
+        
+        with np.errstate(divide='ignore'):
+            weights = 1 / dists ** power
+        
+        # Exact hits take the sample value, nodes with no neighbour in range take the nearest one.
+        exact_hits = dists[:, 0] < EXACT_HIT_DIST
+        no_neighbours = np.isinf(dists[:, 0])
+        weights[exact_hits | no_neighbours] = 0
+        weights[exact_hits | no_neighbours, 0] = 1
+        if no_neighbours.any():
+            _, idxs[no_neighbours, 0] = tree.query(chunk[no_neighbours], k=1, workers=workers)
+        
+        z_vals[start:start+chunk.shape[0]] = np.sum(weights * padded_vals[idxs], axis=1) / np.sum(weights, axis=1)
+
     z_vals = np.reshape(z_vals, x.shape)
     return z_vals
 
-def krigging(scan_pts, scan_vals, search_x, search_y):
-    search_x = search_x.astype(np.float64)
-    search_y = search_y.astype(np.float64)
+def fit_variogram(scan_pts, scan_vals, variogram_cache=None):
+    """
+    Fit the variogram model parameters of the given scan.
+    Args:
+        variogram_cache (OrderedDict): Fitted parameters by the scan content, up to MAX_CACHED_VARIOGRAMS of
+                                       them are kept. The scan is fitted every time when not given.
+    """
+    if variogram_cache is None:
+        variogram_cache = OrderedDict()
+    
+    key = hashlib.blake2b(np.ascontiguousarray(scan_pts[:, :2]).tobytes()
+                          + np.ascontiguousarray(scan_vals).tobytes()).hexdigest()
+    if key in variogram_cache:
+        variogram_cache.move_to_end(key)
+        return variogram_cache[key]
+    
+    fit_idxs = np.arange(scan_pts.shape[0])
+    if fit_idxs.shape[0] > VARIOGRAM_MAX_SAMPLES:
+        fit_idxs = np.random.default_rng(0).choice(fit_idxs, VARIOGRAM_MAX_SAMPLES, replace=False)
+    
+    variogram_params = OrdinaryKriging(scan_pts[fit_idxs, 0], scan_pts[fit_idxs, 1], scan_vals[fit_idxs],
+                                       variogram_model=KRIGING_VARIOGRAM_MODEL).variogram_model_parameters
+    
+    variogram_cache[key] = variogram_params
+    if len(variogram_cache) > MAX_CACHED_VARIOGRAMS:
+        variogram_cache.popitem(last=False)
+    return variogram_params
 
 
-    # print('hello')
+def get_kriging_pool(max_workers=None):
+    """
+    Process pool of the tiled kriging, recreated only if a different number of workers is asked for.
+    """
+    global _kriging_pool
+    if _kriging_pool is None or _kriging_pool[0] != max_workers:
+        if _kriging_pool is not None:
+            _kriging_pool[1].shutdown()
+        _kriging_pool = (max_workers, ProcessPoolExecutor(max_workers=max_workers))
+    return _kriging_pool[1]
 
-    zvalues, sigmasq = OrdinaryKriging(scan_pts[:, 0], scan_pts[:, 1], scan_vals).execute(
+
+def krige_grid(scan_pts, scan_vals, search_x, search_y, variogram_params, n_closest_points=None):
+    """
+    Ordinary kriging of the scan over the given grid with a fixed variogram.
+    Returns:
+        (len(search_x), len(search_y)) array of interpolated values.
+    """
+    zvalues, sigmasq = OrdinaryKriging(scan_pts[:, 0], scan_pts[:, 1], scan_vals,
+                                       variogram_model=KRIGING_VARIOGRAM_MODEL,
+                                       variogram_parameters=list(variogram_params)).execute(
         style='grid',
         xpoints=search_x,
-        ypoints=search_y
+        ypoints=search_y,
+        backend='vectorized' if n_closest_points is None else 'loop',
+        n_closest_points=n_closest_points
     )
     
     return zvalues.T
 
+
+def krigging(scan_pts, scan_vals, search_x, search_y, n_closest_points=KRIGING_NEIGHBOURS,
+             tile_size=KRIGING_TILE_SIZE, max_workers=None, variogram_cache=None):
+    """
+    Ordinary kriging of the scan values over the grid.
+    Small scans are kriged as a single system. Larger ones are kriged locally - each node from its
+    n_closest_points nearest scan points, the grid is split to tiles that are kriged in parallel processes.
+    Args:
+        scan_pts (np.array): (n,2+) locations of the scan points.
+        scan_vals (np.array): (n,) values at the scan points.
+        search_x, search_y (np.array): Axes of the interpolated grid.
+        n_closest_points (int): Scan points used to krige each node of a large scan.
+        tile_size (int): Side (in grid nodes) of the tiles kriged by each process.
+        max_workers (int): Number of worker processes, defaults to the number of cores.
+        variogram_cache (OrderedDict): Fitted variograms of the scenario, see fit_variogram.
+
+    Returns:
+        (len(search_x), len(search_y)) array of interpolated values.
+    """
+    search_x = search_x.astype(np.float64)
+    search_y = search_y.astype(np.float64)
+    variogram_params = fit_variogram(scan_pts, scan_vals, variogram_cache)
+    
+    if scan_pts.shape[0] <= GLOBAL_KRIGING_MAX_SAMPLES:
+        return krige_grid(scan_pts, scan_vals, search_x, search_y, variogram_params)
+    
+    # Each tile only needs the scan points which are among the nearest of one of its nodes.
+    tree = cKDTree(scan_pts[:, :2])
+    tiles = []
+    tile_args = []
+    for x_start in range(0, search_x.shape[0], tile_size):
+        for y_start in range(0, search_y.shape[0], tile_size):
+            tile_x = search_x[x_start:x_start+tile_size]
+            tile_y = search_y[y_start:y_start+tile_size]
+            x, y = np.meshgrid(tile_x, tile_y, indexing='ij')
+            _, idxs = tree.query(np.vstack((x.reshape(-1), y.reshape(-1))).T, k=n_closest_points, workers=-1)
+            tile_idxs = np.unique(idxs)
+            
+            tiles.append((slice(x_start, x_start+tile_size), slice(y_start, y_start+tile_size)))
+            tile_args.append((scan_pts[tile_idxs, :2], scan_vals[tile_idxs], tile_x, tile_y, variogram_params,
+                              n_closest_points))
+    
+    z_vals = np.empty((search_x.shape[0], search_y.shape[0]))
+    if len(tiles) == 1:
+        z_vals[tiles[0]] = krige_grid(*tile_args[0])
+        return z_vals
+    
+    for tile, tile_vals in zip(tiles, get_kriging_pool(max_workers).map(krige_grid, *zip(*tile_args))):
+        z_vals[tile] = tile_vals
+    
+    return z_vals
+
 class InterpType(Enum):
     NEAREST=InterpContent(0, 'Nearest', nearest_interp)
     WEIGHTED_AVERAGE=InterpContent(1, "Weighted Average", weighted_average)
@@ -3,6 +3,7 @@ from widgets.scan_designer import ScanDesigner
 from widgets.sim_controller import SimulationController
 from widgets.simulation_view import SimulationView
 from widgets.sohograma_view import SohogramaView
+from utils.project import SohogramaResult, save_project, load_project
 
 matplotlib.use('Qt5Agg')
 from PyQt5.QtWidgets import QApplication, QWidget
@@ -44,12 +45,15 @@ class Window(Qtw.QMainWindow):
         self.showMaximized()
         self.show()
     
-    def on_sohograma_finish(self, pt_cloud, z_min, z_max):
+    def on_sohograma_finish(self, pt_cloud, z_min, z_max, peaks=None, cube_url=None):
         """
         Add a new tab presenting the sohograma results.
+        Without a pt_cloud the tab lists the peaks, the cube is fetched from cube_url when the 3d view is opened.
         """
         soh_view = SohogramaView(self, scenario=self.sim_view.get_scenario(), pt_cloud=pt_cloud,
-                                 interp_data=self.sim_view.get_interp_data(), z_min=z_min, z_max=z_max)
+                                 interp_data=self.sim_view.get_interp_data(), z_min=z_min, z_max=z_max,
+                                 peaks=peaks, cube_url=cube_url)
+        soh_view.canvas_shown.connect(lambda: self.on_tab_change(self.tab_widget.currentIndex()))
         self.tab_widget.addTab(soh_view, 'SohogramaView')
         
         # Jump to the last tab.
@@ -57,7 +61,55 @@ class Window(Qtw.QMainWindow):
     
     
       
+    def save_project(self):
+        """
+        Save the scenario, its interpolations and the results of all the sohograma tabs into a project directory.
+        """
+        scenario = self.sim_view.get_scenario()
+        if scenario is None:
+            return
+        
+        project_dir = Qtw.QFileDialog.getExistingDirectory(self, 'Save Project')
+        if not project_dir:
+            return
+        
+        sohograma_results = [SohogramaResult(pt_cloud=view.pt_cloud, z_min=view.z_min, z_max=view.z_max,
+                                             peaks=view.peaks)
+                             for view in self.get_sohograma_views()]
+        save_project(project_dir, scenario, interp_type=self.sim_view.sim_canvas.interp_type,
+                     interp_grids=self.sim_view.sim_canvas.get_interp_grids(), sohograma_results=sohograma_results)
+        print(f'Saved project to {project_dir}')
+    
+    def load_project(self):
+        project_dir = Qtw.QFileDialog.getExistingDirectory(self, 'Load Project')
+        if not project_dir:
+            return
+        
+        try:
+            project = load_project(project_dir)
+        except (OSError, ValueError, KeyError) as e:
+            Qtw.QMessageBox.warning(self, 'Load Project Failed', str(e))
+            return
+        
+        # Results of the previous session are replaced by the ones of the project.
+        while self.tab_widget.count() > 1:
+            self.tab_widget.removeTab(self.tab_widget.count() - 1)
+        
+        self.sim_view.load_project(project)
+        for result in project.sohograma_results:
+            self.on_sohograma_finish(result.pt_cloud, result.z_min, result.z_max, result.peaks)
+        self.tab_widget.setCurrentIndex(0)
+        print(f'Loaded project from {project_dir}')
+    
+    def get_sohograma_views(self):
+        return [self.tab_widget.widget(idx) for idx in range(self.tab_widget.count())
+                if isinstance(self.tab_widget.widget(idx), SohogramaView)]
+      
     def initUI(self):
+        file_menu = self.menuBar().addMenu('File')
+        file_menu.addAction('Save Project', self.save_project, 'Ctrl+S')
+        file_menu.addAction('Load Project', self.load_project, 'Ctrl+O')
+        
         layout = Qtw.QHBoxLayout()
         self.tab_widget = Qtw.QTabWidget()
         
@@ -75,10 +127,13 @@ class Window(Qtw.QMainWindow):
         self.setCentralWidget(main_widget)
         
     def on_tab_change(self, idx):
-        self.removeToolBar(self.toolbar)
+        # Tabs without a canvas (e.g. sohograma results whose cube wasn't fetched yet) have no toolbar.
+        if self.toolbar is not None:
+            self.removeToolBar(self.toolbar)
         self.tab_widget.currentWidget().reset_toolbar()
         self.toolbar = self.tab_widget.currentWidget().toolbar
-        self.addToolBar(self.toolbar)
+        if self.toolbar is not None:
+            self.addToolBar(self.toolbar)
  
         
         
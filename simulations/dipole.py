@@ -1,5 +1,4 @@
 import numpy as np
-from yaml import scan
 
 # Vacuum permeability constant.
 MU_0 = 1.256637e-6
@@ -9,30 +8,56 @@ EARTH_FIELD = np.array([0, 1, -1])
 
 EARTH_SCALAR_FIELD = 4.5e-6
 
+# Upper bound on the number of (dipole, scan point) pairs evaluated in a single array pass.
+# Each pair holds a handful of float64 3-vectors, so this keeps the temporaries around ~100MB.
+MAX_CHUNK_PAIRS = 2 ** 21
 
-def sim_dipole(scan_pts, dipole_loc, dipole_moment):
-    """_summary_
-    Simulate a single dipole according to the magnetic dipole equation 
+
+def sim_dipole(scan_pts, dipole_loc, dipole_moment, max_chunk_pairs=MAX_CHUNK_PAIRS):
+    """
+    Simulate dipoles according to the magnetic dipole equation
     (see https://en.wikipedia.org/wiki/Magnetic_dipole).
+    All the scan points are evaluated against all the dipoles in batched array passes, the scan
+    points are split into chunks such that no more than max_chunk_pairs pairs are held in memory.
     Args:
-        scan_pts (np.array): (n,3) array of the locations in which we'll simulate the dipole.
-        dipole_loc (np.array): Location of the dipole.
-    
+        scan_pts (np.array): (n,3) array of the locations in which we'll simulate the dipoles.
+        dipole_loc (np.array): Location of a single dipole (3,) or of several dipoles (m,3).
+        dipole_moment (np.array): Moment of the dipole (3,), either shared by all the dipoles
+                                  or given per dipole (m,3).
+        max_chunk_pairs (int): Maximal number of dipole-scan point pairs evaluated at once.
+
     Returns:
         Array of magnetic field values (in nanoteslas) at each of the given scan points.
+        (n,) for a single dipole and (m,n) for several dipoles.
     """
-    # Initial field without any magnetic anomaly.
-    field_vals = []
-    for i, pt in enumerate(scan_pts):
-        r = pt - dipole_loc
-        abs_r = np.linalg.norm(r)
-        norm_r = r / abs_r
-        
+    scan_pts = np.asarray(scan_pts, dtype=np.float64)
+    dipole_loc = np.asarray(dipole_loc, dtype=np.float64)
+    single_dipole = dipole_loc.ndim == 1
+
+    dipole_locs = np.atleast_2d(dipole_loc)
+    dipole_moments = np.broadcast_to(np.asarray(dipole_moment, dtype=np.float64), dipole_locs.shape)
+
+    num_dipoles = dipole_locs.shape[0]
+    num_pts = scan_pts.shape[0]
+    chunk_size = max(1, max_chunk_pairs // num_dipoles)
+
+    # The moment acts as the background field, add it once per dipole.
+    background = dipole_moments[:, None, :] * 1e-9
+    field_vals = np.empty((num_dipoles, num_pts))
+
+    for start in range(0, num_pts, chunk_size):
+        end = min(start + chunk_size, num_pts)
+
+        # (m, chunk, 3) displacement of every scan point from every dipole.
+        r = scan_pts[None, start:end, :] - dipole_locs[:, None, :]
+        abs_r = np.sqrt(np.einsum('mnk,mnk->mn', r, r))
+        norm_r = r / abs_r[..., None]
+
         const_val = MU_0 / (4 * np.pi * (abs_r ** 3))
-        
-        mag_vec = (3 * norm_r * (np.sum(dipole_moment * norm_r))-dipole_moment) * const_val
-        mag_vec += dipole_moment * 1e-9
-        field_val = np.linalg.norm(mag_vec) * 1e9
-        field_vals.append(field_val)
-    
-    return np.array(field_vals)
+        moment_proj = np.einsum('mnk,mk->mn', norm_r, dipole_moments)
+
+        mag_vec = (3 * norm_r * moment_proj[..., None] - dipole_moments[:, None, :]) * const_val[..., None]
+        mag_vec += background
+        field_vals[:, start:end] = np.sqrt(np.einsum('mnk,mnk->mn', mag_vec, mag_vec)) * 1e9
+
+    return field_vals[0] if single_dipole else field_vals
@@ -1,7 +1,7 @@
 from fatiando.mesher import PolygonalPrism
-from simulations.dipole import sim_dipole
+from simulations.dipole import sim_dipole, MU_0
 import numpy as np
-from fatiando.gravmag._polyprism_numpy import tf
+from fatiando.gravmag._polyprism_numba import tf
 from collections import namedtuple
 
 
@@ -21,6 +21,10 @@ EARTH_INC = -45
 EARTH_DEC = 90
 
 
+# Upper bound on the norm of the field of a unit dipole moment is 2*MU_0/(4*pi*r^3), in nT.
+DIPOLE_FIELD_BOUND = 2e9 * MU_0 / (4 * np.pi)
+
+
 # Contains all the magnetic properties which are configured by the user.
 MagProps = namedtuple('MagProps', 'moment depth zdim')
 
@@ -38,26 +42,95 @@ class MagneticObject():
         self.z_dim = z_dim
         self.obj_id = MagneticObject.ID
         MagneticObject.ID += 1
+        
+        # Bumped whenever the magnetic properties change, invalidates cached fields of this object.
+        self.version = 0
     
     def update_mag_props(self, mag_props):
         self.depth = mag_props.depth
         self.z_dim = mag_props.zdim
         self.moment = mag_props.moment * EARTH_FIELD_DIRECTION
+        self.version += 1
     
     @property
     def scalar_moment(self):
         return self.moment[1]
+    
+    @property
+    def is_dipole(self):
+        return len(self.vertices) == 1
+    
+    @property
+    def far_field(self):
+        """
+        Value of get_inflicted_field far away from the object.
+        The simulated dipole carries the background field (its moment in nT), the prism anomaly vanishes.
+        """
+        return float(np.linalg.norm(self.moment)) if self.is_dipole else 0.0
+    
+    @property
+    def center(self):
+        """
+        (x, y, z) center of the object.
+        """
+        vertices = np.asarray(self.vertices)
+        return np.array([vertices[:, 0].mean(), vertices[:, 1].mean(),
+                         self.depth if self.is_dipole else self.depth - self.z_dim / 2])
+    
+    def cutoff_radius(self, accuracy, scan_z_range=None):
+        """
+        Horizontal distance from the center of the object beyond which its anomaly is below the given accuracy.
+        The object is bounded by a dipole of its total moment (the moment of a prism is its magnetization times its
+        volume), whose anomaly is at most DIPOLE_FIELD_BOUND * |m| / r^3.
+        Args:
+            accuracy (float): Largest ignored anomaly, in nT.
+            scan_z_range (tuple): (min, max) heights of the scan points, the radius shrinks with their distance to
+                                  the object. A scan at the height of the object is assumed if not given.
+        """
+        vertices = np.asarray(self.vertices)
+        total_moment = np.linalg.norm(self.moment)
+        if not self.is_dipole:
+            area = 0.5 * abs(np.dot(vertices[:, 0], np.roll(vertices[:, 1], 1))
+                             - np.dot(vertices[:, 1], np.roll(vertices[:, 0], 1)))
+            total_moment *= area * abs(self.z_dim)
+        
+        radius = (DIPOLE_FIELD_BOUND * total_moment / accuracy) ** (1 / 3)
+        
+        # Every point of the object is within footprint_radius (horizontally) and z_dim / 2 (vertically) of its center.
+        center = self.center
+        footprint_radius = np.hypot(vertices[:, 0] - center[0], vertices[:, 1] - center[1]).max()
+        height_dist = 0.0
+        if scan_z_range is not None:
+            height_dist = max(scan_z_range[0] - center[2], center[2] - scan_z_range[1], 0)
+            height_dist = max(height_dist - abs(self.z_dim) / 2, 0)
         
-    def get_inflicted_field(self, scan_pts):
+        if height_dist >= radius:
+            return 0.0
+        return np.sqrt(radius ** 2 - height_dist ** 2) + footprint_radius
+    
+    def get_inflicted_field(self, scan_pts, scan_tree=None, accuracy=None):
         """
         Get the variations inflicted by this magnetic object at the given scan pts.
         Depends on the number of vertices:
         - Single vertex = dipole.
         - Several = Simulate via fatiando.
+        When an accuracy is given only the scan points within the cutoff radius are modelled, the others get the
+        far field value.
         Args:
             scan_pts (np.array): Locations of the scan points.
+            scan_tree (cKDTree): Index of the (x,y) scan points, required along with accuracy.
+            accuracy (float): Largest anomaly (in nT) which may be ignored.
         """
-        if len(self.vertices) == 1:
+        if accuracy is not None and scan_tree is not None:
+            radius = self.cutoff_radius(accuracy, (scan_pts[:, 2].min(), scan_pts[:, 2].max()))
+            idxs = np.asarray(scan_tree.query_ball_point(self.center[:2], r=radius), dtype=np.int64)
+            field = np.full(scan_pts.shape[0], self.far_field)
+            if idxs.shape[0] > 0:
+                idxs.sort()
+                field[idxs] = self.get_inflicted_field(scan_pts[idxs])
+            return field
+        
+        if self.is_dipole:
             return sim_dipole(scan_pts, np.array([self.vertices[0,0], self.vertices[0, 1], self.depth]), self.moment)
         else:
             return tf(xp=scan_pts[:, 0], yp=scan_pts[:, 1], zp=scan_pts[:, 2],
@@ -1,6 +1,10 @@
 import numpy as np
-from collections import namedtuple
+from scipy.spatial import cKDTree
+from collections import namedtuple, OrderedDict
+import hashlib
 import math
+from utils.signal_pyramid import SignalPyramid
+from interps.interps import krigging
 
 """
 A Scenario contains all the relevant data for a magnetic simulation.
@@ -20,11 +24,20 @@ GridRange = namedtuple('GridRange', 'x_min x_max y_min y_max')
 class Scenario():
     
     
-    def __init__(self, scan_pts) -> None:
-        self.scan_pts = scan_pts
-        
-        # FIXME - Currently set a fixed height of 0.
-        self.scan_pts = np.hstack((self.scan_pts, np.zeros((self.scan_pts.shape[0], 1))))
+    def __init__(self, scan_pts, base_field=None, accuracy=None) -> None:
+        """
+        Args:
+            scan_pts (np.array): (n,3) locations of the scan points, designed (n,2) paths are scanned at a height of 0.
+            base_field (np.array): (n,) field measured at the scan points (e.g. a survey), the simulated objects
+                                   are added on top of it. A uniform field of DEFAULT_EARTH_FIELD by default.
+            accuracy (float): Objects are only modelled at the scan points where their anomaly may exceed this
+                              many nT, see MagneticObject.get_inflicted_field. Every point is modelled if not given.
+        """
+        self.scan_pts = np.asarray(scan_pts, dtype=np.float64)
+        if self.scan_pts.shape[1] == 2:
+            self.scan_pts = np.hstack((self.scan_pts, np.zeros((self.scan_pts.shape[0], 1))))
+        else:
+            self.scan_pts = np.ascontiguousarray(self.scan_pts[:, :3])
         
         self.grid_range = GridRange(x_min=math.floor(self.scan_pts[:, 0].min()-1),
                                     x_max=math.ceil(self.scan_pts[:, 0].max()+1),
@@ -36,9 +49,24 @@ class Scenario():
         self.search_x = np.arange(self.grid_range.x_min, self.grid_range.x_max)
         self.search_y = np.arange(self.grid_range.y_min, self.grid_range.y_max)
         
+        # Identifies the scan points and grid, used as part of cache keys.
+        geometry_digest = hashlib.blake2b()
+        for arr in (self.scan_pts, self.search_x, self.search_y):
+            geometry_digest.update(np.ascontiguousarray(arr))
+        self.geometry_hash = geometry_digest.hexdigest()
+        
+        # Spatial index of the (x,y) scan points, built on first use.
+        self._scan_tree = None
+        
+        # Variograms fitted to the fields of this scenario when kriging them, see interps.fit_variogram.
+        self.variogram_cache = OrderedDict()
+        
         
         # By default simulate field of strength 4.5e6
-        self.sim_field = np.ones(self.scan_pts.shape[0]) * DEFAULT_EARTH_FIELD
+        if base_field is None:
+            base_field = np.ones(self.scan_pts.shape[0]) * DEFAULT_EARTH_FIELD
+        self.base_field = np.array(base_field, dtype=np.float64)
+        self.sim_field = self.base_field.copy()
         self.min_field = self.sim_field.min()
         self.max_field = self.sim_field.max()
         
@@ -46,6 +74,18 @@ class Scenario():
         self.on_field_update = None 
         self.hidden_objects_map = {}
         
+        # Maps each object id to the (version, field) it inflicts at the scan points.
+        self.field_contributions = {}
+        self.accuracy = accuracy
+        
+        # Hash of the current field values and min/max pyramid of the signal, reset whenever the field changes.
+        self._field_hash = None
+        
+        # Digests of the base field and of each object's cached contribution (contribution, digest), see field_hash.
+        self._base_digest = None
+        self._contribution_digests = {}
+        self._signal_pyramid = None
+        
     
     
     def set_field_update_listener(self, on_field_update):
@@ -54,13 +94,63 @@ class Scenario():
     def add_mag_object(self, mag_object):
         self.mag_objects[mag_object.obj_id] = mag_object
         self.hidden_objects_map[mag_object.obj_id] = False
-        self.sim_field += mag_object.get_inflicted_field(self.scan_pts)
+        self.sim_field += self.get_contribution(mag_object)
+        self.field_changed()
+        self.update_boundaries()
+    
+    def restore_mag_objects(self, restored_objects):
+        """
+        Add objects along with their already computed contributions (e.g. loaded from a project).
+        Args:
+            restored_objects (list): (mag_object, contribution, hidden) of each object.
+        """
+        for mag_object, contribution, hidden in restored_objects:
+            self.mag_objects[mag_object.obj_id] = mag_object
+            self.hidden_objects_map[mag_object.obj_id] = hidden
+            self.field_contributions[mag_object.obj_id] = (mag_object.version, contribution)
+
+        self.reevaluate_mag_field()
+        self.min_field = self.sim_field.min()
+        self.max_field = self.sim_field.max()
+
+    def get_contribution(self, mag_object):
+        """
+        Field inflicted by the given object at the scan points.
+        Forward modelled only if the object is new or its properties changed since the last call.
+        """
+        cached = self.field_contributions.get(mag_object.obj_id)
+        if cached is None or cached[0] != mag_object.version:
+            cached = (mag_object.version, mag_object.get_inflicted_field(self.scan_pts, scan_tree=self.scan_tree,
+                                                                         accuracy=self.accuracy))
+            self.field_contributions[mag_object.obj_id] = cached
+        
+        return cached[1]
+    
+    def set_accuracy(self, accuracy):
+        """
+        Change the accuracy of the forward modelling, the contributions of all the objects are modelled again.
+        """
+        self.accuracy = accuracy
+        self.field_contributions = {}
+        self._contribution_digests = {}
+        self.reevaluate_mag_field()
         self.update_boundaries()
     
     def reevaluate_mag_field(self):
-        self.sim_field = np.ones(self.scan_pts.shape[0]) * DEFAULT_EARTH_FIELD
-        for mag_obj in self.mag_objects.values():
-            self.sim_field += mag_obj.get_inflicted_field(self.scan_pts)
+        """
+        Sum the field back from the cached contributions of the visible objects, O(N*K).
+        Edits only add or subtract the contribution of the edited object, this resyncs the field from scratch
+        (e.g. after restoring objects or changing the accuracy).
+        """
+        self.sim_field[:] = self.base_field
+        for obj_id, mag_obj in self.mag_objects.items():
+            if not self.hidden_objects_map[obj_id]:
+                self.sim_field += self.get_contribution(mag_obj)
+        self.field_changed()
+    
+    def field_changed(self):
+        self._field_hash = None
+        self._signal_pyramid = None
         
     
     def update_boundaries(self):
@@ -80,40 +170,116 @@ class Scenario():
         if obj_id not in self.mag_objects:
             return
 
-        self.sim_field -= self.mag_objects[obj_id].get_inflicted_field(self.scan_pts)
+        # The cached contribution of a visible object is the one summed into the field.
+        cached = self.field_contributions.pop(obj_id, None)
+        self._contribution_digests.pop(obj_id, None)
+        if not self.hidden_objects_map[obj_id]:
+            self.sim_field -= cached[1]
+            self.field_changed()
         del self.mag_objects[obj_id]
         del self.hidden_objects_map[obj_id]
     
     def update_mag_props(self, mag_props, obj_id):
-        self.sim_field -= self.mag_objects[obj_id].get_inflicted_field(self.scan_pts)
-        self.mag_objects[obj_id].update_mag_props(mag_props)
-        self.sim_field += self.mag_objects[obj_id].get_inflicted_field(self.scan_pts)
+        mag_object = self.mag_objects[obj_id]
+        old_contribution = self.field_contributions.get(obj_id)
+        mag_object.update_mag_props(mag_props)
+        if self.hidden_objects_map[obj_id]:
+            # Modelled again once the object is shown.
+            return
+        
+        # Points the edit doesn't affect (e.g. tiles far from the object) keep their exact value.
+        self.sim_field += self.get_contribution(mag_object) - old_contribution[1]
+        self.field_changed()
     
     def toggle_hidden_object(self, obj_id):
         if obj_id not in self.hidden_objects_map:
             return
         
         self.hidden_objects_map[obj_id] = not self.hidden_objects_map[obj_id]
-        factor = 1 if not self.hidden_objects_map[obj_id] else -1
-        self.sim_field += factor * self.mag_objects[obj_id].get_inflicted_field(self.scan_pts)
+        if self.hidden_objects_map[obj_id]:
+            self.sim_field -= self.field_contributions[obj_id][1]
+        else:
+            self.sim_field += self.get_contribution(self.mag_objects[obj_id])
+        self.field_changed()
     
     def get_sohograma_input(self, z_min, z_max):
         return {
             "grid_range": self.grid_range._asdict(),
-            "scan_pts": self.scan_pts.tolist(),
-            "scan_vals": self.sim_field.tolist(),
+            "scan_pts": self.scan_pts,
+            "scan_vals": self.sim_field,
             "z_min": z_min,
             "z_max": z_max
         }
         
+    def interpolate(self, interp_func):
+        """
+        Interpolate the field over the search grid with the given function of interps.interps.
+        """
+        return interp_func(self.scan_pts, self.raw_signal, self.search_x, self.search_y,
+                           **self.get_interp_kwargs(interp_func))
+    
+    def get_interp_kwargs(self, interp_func):
+        """
+        Scenario state passed to the interpolation, kriging reuses the variograms fitted to this scenario.
+        """
+        return {'variogram_cache': self.variogram_cache} if interp_func is krigging else {}
+    
     @property
     def raw_signal(self):
         return self.sim_field
     
+    @property
+    def field_hash(self):
+        """
+        Hash of the simulated field, made of the digests of the base field and of the visible objects'
+        contributions. It doesn't depend on the order they were added in, so undoing a hide gives back the
+        previous hash even though the incrementally updated field may differ in its last bits.
+        """
+        if self._field_hash is None:
+            if self._base_digest is None:
+                self._base_digest = hashlib.blake2b(self.base_field.tobytes()).digest()
+            
+            field_digest = hashlib.blake2b(self._base_digest)
+            for digest in sorted(self.contribution_digest(obj_id) for obj_id in self.mag_objects
+                                 if not self.hidden_objects_map[obj_id]):
+                field_digest.update(digest)
+            self._field_hash = field_digest.hexdigest()
+        return self._field_hash
+    
+    def contribution_digest(self, obj_id):
+        contribution = self.field_contributions[obj_id][1]
+        cached = self._contribution_digests.get(obj_id)
+        if cached is None or cached[0] is not contribution:
+            cached = (contribution, hashlib.blake2b(np.ascontiguousarray(contribution).tobytes()).digest())
+            self._contribution_digests[obj_id] = cached
+        return cached[1]
+    
+    @property
+    def scan_tree(self):
+        """
+        KD-tree of the (x,y) coordinates of the scan points, the points never change so it's built once.
+        """
+        if self._scan_tree is None:
+            self._scan_tree = cKDTree(self.scan_pts[:, :2])
+        return self._scan_tree
+    
+    @property
+    def signal_pyramid(self):
+        """
+        Min/max pyramid of the raw signal, built on first use after every field change.
+        """
+        if self._signal_pyramid is None:
+            self._signal_pyramid = SignalPyramid(self.sim_field)
+        return self._signal_pyramid
+    
     @property
     def grid_shape(self):
         return (len(self.search_x), len(self.search_y))
     
     def clean(self):
         self.mag_objects = {}
-        self.sim_field = np.ones(self.scan_pts.shape[0]) * DEFAULT_EARTH_FIELD
+        self.hidden_objects_map = {}
+        self.field_contributions = {}
+        self._contribution_digests = {}
+        self.sim_field = self.base_field.copy()
+        self.field_changed()
@@ -0,0 +1,54 @@
+import numpy as np
+
+from simulations.scenario import Scenario
+from simulations.mag_object import MagneticObject, MagProps
+from utils.scan_path_generator import generate_strip_scan
+
+
+def make_scenario():
+    "A scenario with three dipoles"
+    scenario = Scenario(generate_strip_scan([0, 0], 60, 2, 30, 1))
+    scenario.set_field_update_listener(lambda min_field, max_field: None)
+    for location, moment in [([10., -10.], 1), ([30., -20.], 2), ([50., -5.], 0.5)]:
+        scenario.add_mag_object(MagneticObject(np.array([location]), moment=moment, depth=-5, z_dim=0))
+    return scenario
+
+
+def resummed_field(scenario):
+    field = scenario.base_field.copy()
+    for obj_id, mag_obj in scenario.mag_objects.items():
+        if not scenario.hidden_objects_map[obj_id]:
+            field += scenario.get_contribution(mag_obj)
+    return field
+
+
+def test_incremental_edits():
+    "Hiding, showing, editing and deleting objects only updates their contribution, same field as a full sum"
+    scenario = make_scenario()
+    obj_ids = list(scenario.mag_objects)
+    scenario.toggle_hidden_object(obj_ids[0])
+    scenario.update_mag_props(MagProps(moment=3, depth=-8, zdim=0), obj_ids[1])
+    scenario.update_mag_props(MagProps(moment=2, depth=-6, zdim=0), obj_ids[0])
+    scenario.toggle_hidden_object(obj_ids[0])
+    scenario.delete_mag_object(obj_ids[2])
+    diff = np.abs(scenario.sim_field - resummed_field(scenario))
+    assert diff.max() <= 1e-6, 'max diff: %g' % (diff.max())
+
+
+def test_field_hash():
+    "Undoing a hide or an edit gives back the field hash, whatever the order of the edits"
+    scenario = make_scenario()
+    obj_ids = list(scenario.mag_objects)
+    initial_hash = scenario.field_hash
+    scenario.toggle_hidden_object(obj_ids[1])
+    hidden_hash = scenario.field_hash
+    assert hidden_hash != initial_hash
+    scenario.toggle_hidden_object(obj_ids[1])
+    assert scenario.field_hash == initial_hash
+
+    scenario.delete_mag_object(obj_ids[1])
+    scenario.add_mag_object(MagneticObject(np.array([[30., -20.]]), moment=2, depth=-5, z_dim=0))
+    assert scenario.field_hash == initial_hash
+
+    scenario.reevaluate_mag_field()
+    assert scenario.field_hash == initial_hash
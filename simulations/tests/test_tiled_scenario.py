@@ -0,0 +1,102 @@
+import numpy as np
+
+from simulations.scenario import Scenario
+from simulations.tiled_scenario import TiledScenario, INFLUENCE_ACCURACY
+from simulations.mag_object import MagneticObject, MagProps
+from interps.interps import nearest_interp, weighted_average
+from utils.scan_path_generator import generate_strip_scan
+
+surveys = [generate_strip_scan([0, 0], 300, 2, 150, 1), generate_strip_scan([350, 0], 150, 2, 75, 1)]
+
+
+def make_scenarios(**kwargs):
+    "A tiled scenario of the surveys and a single scenario of all their points"
+    tiled = TiledScenario(surveys, **kwargs)
+    full = Scenario(np.vstack(surveys), accuracy=kwargs.get('accuracy'))
+    for scenario in (tiled, full):
+        scenario.set_field_update_listener(lambda min_field, max_field: None)
+    return tiled, full
+
+
+def add_dipole(scenarios, location, moment=1, depth=-5):
+    for scenario in scenarios:
+        scenario.add_mag_object(MagneticObject(np.array([location]), moment=moment, depth=depth, z_dim=0))
+
+
+def covered_nodes(scenario, max_dist=0.5):
+    """
+    Grid nodes within max_dist of a scan point, away from the edges of the surveys.
+    Nodes further away may have several nearest points at the same distance, picked in a different order by
+    the tiles.
+    """
+    x, y = np.meshgrid(scenario.search_x, scenario.search_y, indexing='ij')
+    dists, _ = scenario.scan_tree.query(np.column_stack((x.ravel(), y.ravel())))
+    return (dists <= max_dist).reshape(x.shape)
+
+
+def test_field_against_scenario():
+    "TiledScenario field against a single Scenario, tiles left out keep the far field of the dipole"
+    tiled, full = make_scenarios()
+    add_dipole((tiled, full), [50., -50.])
+    affected = tiled.object_tiles[list(tiled.mag_objects)[0]]
+    assert 0 < len(affected) < len(tiled.tiles)
+    diff = np.abs(tiled.sim_field - full.sim_field)
+    assert diff.max() <= INFLUENCE_ACCURACY, 'max diff: %g' % (diff.max())
+
+
+def test_strong_object_radius():
+    "The tiles affected by an object grow with its moment, no step is left at their edges"
+    tiled, full = make_scenarios()
+    add_dipole((tiled, full), [50., -50.], moment=1e4, depth=-20)
+    diff = np.abs(tiled.sim_field - full.sim_field)
+    assert diff.max() <= INFLUENCE_ACCURACY, 'max diff: %g' % (diff.max())
+
+
+def test_accuracy():
+    "With an accuracy the same points as a Scenario with that accuracy are modelled, the dropped anomaly is below it"
+    tiled, full = make_scenarios(accuracy=0.1)
+    add_dipole((tiled, full), [200., -100.], moment=10)
+    diff = np.abs(tiled.sim_field - full.sim_field)
+    assert diff.max() == 0, 'max diff: %g' % (diff.max())
+    full.set_accuracy(None)
+    diff = np.abs(tiled.sim_field - full.sim_field)
+    assert diff.max() <= 0.1, 'max diff: %g' % (diff.max())
+
+
+def test_interpolate_against_global():
+    "Grid assembled from the tiles against a global interpolation, away from the edges of the surveys"
+    tiled, full = make_scenarios()
+    add_dipole((tiled, full), [120., -80.])
+    covered = covered_nodes(tiled)
+    for interp_func, precision in [(nearest_interp, 1e-3), (weighted_average, 1e-3)]:
+        grid = tiled.interpolate(interp_func)
+        global_grid = interp_func(full.scan_pts, full.sim_field, full.search_x, full.search_y)
+        diff = np.abs(grid - global_grid)[covered]
+        assert diff.max() <= precision, '%s max diff: %g' % (interp_func.__name__, diff.max())
+
+
+def test_edit_interpolates_nearby_tiles():
+    "Moving an object down only interpolates the tiles it affects again"
+    tiled, _ = make_scenarios()
+    add_dipole((tiled,), [50., -50.])
+    tiled.interpolate(nearest_interp)
+    assert len(tiled.last_interpolated) == len(tiled.tiles)
+
+    tiled.interpolate(nearest_interp)
+    assert tiled.last_interpolated == []
+
+    obj_id = list(tiled.mag_objects)[0]
+    before = set(tiled.object_tiles[obj_id])
+    tiled.update_mag_props(MagProps(moment=1, depth=-4, zdim=0), obj_id)
+    grid = tiled.interpolate(nearest_interp)
+    changed = before | set(tiled.object_tiles[obj_id])
+    assert 0 < len(tiled.last_interpolated) < len(tiled.tiles)
+    # Tiles are interpolated from the points up to INTERP_MARGIN around them, which may belong to a changed tile.
+    for tile_idx in tiled.last_interpolated:
+        tile = tiled.tiles[tile_idx]
+        assert tile_idx in changed or any(
+            np.isin(tile.support_idxs, tiled.tiles[changed_idx].idxs).any() for changed_idx in changed)
+
+    global_grid = nearest_interp(tiled.scan_pts, tiled.sim_field, tiled.search_x, tiled.search_y)
+    diff = np.abs(grid - global_grid)[covered_nodes(tiled)]
+    assert diff.max() <= 1e-3, 'max diff: %g' % (diff.max())
@@ -0,0 +1,185 @@
+import numpy as np
+import hashlib
+from collections import namedtuple
+from simulations.scenario import Scenario
+from consts import DEBUG
+
+"""
+A Scenario made of several surveys over a large area.
+The scan points are split into square tiles, each with its own bounding box. An object only influences the
+field of the tiles within its cutoff radius, so its forward modelling only runs on their points, and the
+area wide interpolated grid is assembled from per tile grids, only tiles whose field changed are interpolated
+again after an edit.
+"""
+
+# Side (in meters) of the square tiles the surveys are split into.
+TILE_SIZE = 100
+
+# Without an accuracy, objects affect the tiles where their anomaly may exceed this many nT, see
+# MagneticObject.cutoff_radius. The anomaly dropped at the other tiles is below it.
+INFLUENCE_ACCURACY = 1e-3
+
+# Tiles are interpolated with the scan points up to this distance (in meters) outside of them, avoids seams.
+INTERP_MARGIN = 5
+
+# idxs are the indices of the tile's scan points, support_idxs the ones it's interpolated from.
+# x_range and y_range are the (start, end) indices of the tile's block in the search grid.
+Tile = namedtuple('Tile', 'idxs support_idxs x_min x_max y_min y_max x_range y_range')
+
+
+def box_distance(box, other_box):
+    """
+    Distance between two (x_min, x_max, y_min, y_max) boxes, 0 if they intersect.
+    """
+    dx = max(other_box[0] - box[1], box[0] - other_box[1], 0)
+    dy = max(other_box[2] - box[3], box[2] - other_box[3], 0)
+    return (dx ** 2 + dy ** 2) ** 0.5
+
+
+class TiledScenario(Scenario):
+
+    def __init__(self, surveys, base_fields=None, tile_size=TILE_SIZE, influence_radius=None,
+                 interp_margin=INTERP_MARGIN, accuracy=None) -> None:
+        """
+        Args:
+            surveys (list): (n_i,2) or (n_i,3) scan points of each survey.
+            base_fields (list): (n_i,) field measured in each survey, see Scenario.
+            tile_size (float): Side of the tiles.
+            influence_radius (float): Fixed distance from the footprint of an object beyond which it doesn't affect
+                                      a tile. Lossy, the anomaly beyond it is dropped whatever the moment of the
+                                      object. By default each object's cutoff radius is used.
+            interp_margin (float): Distance outside of a tile from which scan points are used to interpolate it.
+            accuracy (float): See Scenario.
+        """
+        surveys = [np.asarray(survey, dtype=np.float64) for survey in surveys]
+        num_cols = max(survey.shape[1] for survey in surveys)
+        scan_pts = np.vstack([survey if survey.shape[1] == num_cols
+                              else np.hstack((survey, np.zeros((survey.shape[0], 1)))) for survey in surveys])
+        base_field = np.concatenate(base_fields) if base_fields is not None else None
+        super().__init__(scan_pts, base_field=base_field, accuracy=accuracy)
+
+        # Index of the survey of each scan point.
+        self.survey_idxs = np.repeat(np.arange(len(surveys)), [survey.shape[0] for survey in surveys])
+
+        self.tile_size = tile_size
+        self.influence_radius = influence_radius
+        self.interp_margin = interp_margin
+        self.tiles = self.build_tiles(interp_margin)
+
+        # Maps (tile index, interp_func) to the field hash of its support points and its interpolated block.
+        self.tile_interps = {}
+
+        # Indices of the tiles interpolated again by the last call to interpolate.
+        self.last_interpolated = []
+
+        # Indices of the tiles each object affected when its contribution was last computed.
+        self.object_tiles = {}
+
+    def build_tiles(self, interp_margin):
+        cells = np.floor(self.scan_pts[:, :2] / self.tile_size).astype(np.int64)
+        _, cell_ids = np.unique(cells, axis=0, return_inverse=True)
+        cell_ids = cell_ids.reshape(-1)
+        order = np.argsort(cell_ids, kind='stable')
+        bounds = np.flatnonzero(np.diff(cell_ids[order])) + 1
+
+        tiles = []
+        for idxs in np.split(order, bounds):
+            cell_x, cell_y = cells[idxs[0]]
+            tile_pts = self.scan_pts[idxs]
+            x_min, y_min = tile_pts[:, 0].min(), tile_pts[:, 1].min()
+            x_max, y_max = tile_pts[:, 0].max(), tile_pts[:, 1].max()
+            support_idxs = self.scan_tree.query_ball_point(
+                [(x_min + x_max) / 2, (y_min + y_max) / 2],
+                r=np.hypot((x_max - x_min) / 2 + interp_margin, (y_max - y_min) / 2 + interp_margin))
+            support_idxs = np.asarray(sorted(support_idxs), dtype=np.int64)
+            support_pts = self.scan_pts[support_idxs]
+            inside = (support_pts[:, 0] >= x_min - interp_margin) & (support_pts[:, 0] <= x_max + interp_margin) & \
+                     (support_pts[:, 1] >= y_min - interp_margin) & (support_pts[:, 1] <= y_max + interp_margin)
+
+            # The tile's block of the search grid is its cell, so the blocks of different tiles never overlap.
+            x_range = np.searchsorted(self.search_x, [cell_x * self.tile_size, (cell_x + 1) * self.tile_size])
+            y_range = np.searchsorted(self.search_y, [cell_y * self.tile_size, (cell_y + 1) * self.tile_size])
+            tiles.append(Tile(idxs=idxs, support_idxs=support_idxs[inside], x_min=x_min, x_max=x_max,
+                              y_min=y_min, y_max=y_max, x_range=tuple(x_range), y_range=tuple(y_range)))
+        return tiles
+
+    def get_affected_tiles(self, mag_object):
+        """
+        Indices of the tiles within the object's cutoff radius (for the scenario's accuracy, or INFLUENCE_ACCURACY
+        without one) of its center. With a fixed influence radius, the tiles within it of the object's footprint.
+        """
+        if self.influence_radius is None:
+            center = mag_object.center
+            accuracy = self.accuracy if self.accuracy is not None else INFLUENCE_ACCURACY
+            influence_radius = mag_object.cutoff_radius(accuracy, (self.scan_pts[:, 2].min(),
+                                                                   self.scan_pts[:, 2].max()))
+            footprint = (center[0], center[0], center[1], center[1])
+        else:
+            vertices = np.asarray(mag_object.vertices)
+            influence_radius = self.influence_radius
+            footprint = (vertices[:, 0].min(), vertices[:, 0].max(), vertices[:, 1].min(), vertices[:, 1].max())
+        return [tile_idx for tile_idx, tile in enumerate(self.tiles)
+                if box_distance(footprint, (tile.x_min, tile.x_max, tile.y_min, tile.y_max)) <= influence_radius]
+
+    def get_contribution(self, mag_object):
+        """
+        Same as Scenario.get_contribution, the object is only forward modelled at the points of the tiles it
+        affects and takes its far field value elsewhere. With an accuracy, only the points of these tiles within
+        the object's cutoff radius are modelled, same as a Scenario with that accuracy.
+        """
+        cached = self.field_contributions.get(mag_object.obj_id)
+        if cached is None or cached[0] != mag_object.version:
+            affected_tiles = self.get_affected_tiles(mag_object)
+            contribution = np.full(self.scan_pts.shape[0], mag_object.far_field)
+            if affected_tiles:
+                idxs = np.concatenate([self.tiles[tile_idx].idxs for tile_idx in affected_tiles])
+                if self.accuracy is not None:
+                    radius = mag_object.cutoff_radius(self.accuracy, (self.scan_pts[:, 2].min(),
+                                                                      self.scan_pts[:, 2].max()))
+                    idxs = np.intersect1d(idxs, self.scan_tree.query_ball_point(mag_object.center[:2], r=radius))
+                contribution[idxs] = mag_object.get_inflicted_field(self.scan_pts[idxs])
+
+            cached = (mag_object.version, contribution)
+            self.field_contributions[mag_object.obj_id] = cached
+            self.object_tiles[mag_object.obj_id] = affected_tiles
+
+        return cached[1]
+
+    def interpolate(self, interp_func):
+        """
+        Area wide grid assembled from the grids of the tiles, nodes outside of all the tiles hold the minimal field.
+        Tiles whose support points kept their field since the last call reuse their grid.
+        """
+        grid = np.full(self.grid_shape, self.sim_field.min())
+        self.last_interpolated = []
+        for tile_idx, tile in enumerate(self.tiles):
+            support_vals = self.sim_field[tile.support_idxs]
+            field_hash = hashlib.blake2b(support_vals.tobytes()).hexdigest()
+            cached = self.tile_interps.get((tile_idx, interp_func))
+            if cached is None or cached[0] != field_hash:
+                block = interp_func(self.scan_pts[tile.support_idxs], support_vals,
+                                    self.search_x[tile.x_range[0]:tile.x_range[1]],
+                                    self.search_y[tile.y_range[0]:tile.y_range[1]],
+                                    **self.get_interp_kwargs(interp_func))
+                cached = (field_hash, block)
+                self.tile_interps[(tile_idx, interp_func)] = cached
+                self.last_interpolated.append(tile_idx)
+
+            grid[tile.x_range[0]:tile.x_range[1], tile.y_range[0]:tile.y_range[1]] = cached[1]
+
+        if DEBUG:
+            print(f'Interpolated {len(self.last_interpolated)} of {len(self.tiles)} tiles')
+        return grid
+
+    def restore_mag_objects(self, restored_objects):
+        for mag_object, _, _ in restored_objects:
+            self.object_tiles[mag_object.obj_id] = self.get_affected_tiles(mag_object)
+        super().restore_mag_objects(restored_objects)
+
+    def delete_mag_object(self, obj_id):
+        self.object_tiles.pop(obj_id, None)
+        super().delete_mag_object(obj_id)
+
+    def clean(self):
+        super().clean()
+        self.object_tiles = {}
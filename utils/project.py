@@ -0,0 +1,194 @@
+import json
+import os
+from collections import namedtuple
+import numpy as np
+from interps.interps import InterpType
+from simulations.mag_object import MagneticObject
+from simulations.scenario import Scenario
+from simulations.tiled_scenario import TiledScenario
+
+"""
+On disk format of a MagStudio project.
+A project is a directory holding a project.json document with the scalar state (type and accuracy of the scenario,
+magnetic objects, selected interpolation, inversion heights) and a .npy file per array. The .npy header is padded so the data is aligned,
+arrays are loaded with np.load(mmap_mode='r') so reopening a project with large cubes only reads the pages used.
+"""
+
+PROJECT_FILE = 'project.json'
+
+PROJECT_VERSION = 1
+
+# Result of an inversion shown in a SohogramaView, pt_cloud is None if its cube was never fetched.
+SohogramaResult = namedtuple('SohogramaResult', 'pt_cloud z_min z_max peaks')
+
+# Interpolated grid of the scenario with the field of the given hash.
+InterpGrid = namedtuple('InterpGrid', 'field_hash interp_type grid')
+
+ProjectData = namedtuple('ProjectData', 'scenario interp_type interp_grids sohograma_results')
+
+
+def save_array(project_dir, name, arr):
+    """
+    Store the array as <name>.npy in the project directory, returns its file name.
+    Arrays mapped from the same file are left as they are. Others are written to a temporary file which replaces
+    the old one, pages mapped from the old file stay valid.
+    """
+    file_name = f'{name}.npy'
+    path = os.path.join(project_dir, file_name)
+    if isinstance(arr, np.memmap) and arr.filename is not None and os.path.exists(path) \
+            and os.path.samefile(arr.filename, path):
+        return file_name
+
+    tmp_path = os.path.join(project_dir, f'{name}.tmp.npy')
+    np.save(tmp_path, np.ascontiguousarray(arr))
+    os.replace(tmp_path, path)
+    return file_name
+
+
+def load_array(project_dir, file_name):
+    if file_name is None:
+        return None
+    return np.load(os.path.join(project_dir, file_name), mmap_mode='r')
+
+
+def referenced_files(project):
+    files = {project['scenario']['scan_pts'], project['scenario']['base_field']}
+    files.update(obj['contribution'] for obj in project['objects'])
+    files.update(interp['grid'] for interp in project['interp_grids'])
+    for result in project['sohograma_results']:
+        files.update(name for name in (result['pt_cloud'], result['peaks']) if name is not None)
+    return files
+
+
+def read_project_file(project_dir):
+    with open(os.path.join(project_dir, PROJECT_FILE)) as project_file:
+        project = json.load(project_file)
+
+    if project.get('version') != PROJECT_VERSION:
+        raise ValueError(f'Unsupported project version: {project.get("version")}')
+    return project
+
+
+def save_scenario(project_dir, scenario):
+    """
+    Scalar state of the scenario, a TiledScenario also keeps the number of scan points of each survey and its
+    tiling parameters so the same tiles are built on load.
+    """
+    state = {
+        'type': type(scenario).__name__,
+        'scan_pts': save_array(project_dir, 'scan_pts', scenario.scan_pts),
+        'base_field': save_array(project_dir, 'base_field', scenario.base_field),
+        'accuracy': float(scenario.accuracy) if scenario.accuracy is not None else None
+    }
+    if isinstance(scenario, TiledScenario):
+        state['tiling'] = {
+            'survey_sizes': np.bincount(scenario.survey_idxs).tolist(),
+            'tile_size': scenario.tile_size,
+            'influence_radius': scenario.influence_radius,
+            'interp_margin': scenario.interp_margin
+        }
+    return state
+
+
+def load_scenario(project_dir, state):
+    """
+    Scenario of the state saved by save_scenario.
+    """
+    scan_pts = load_array(project_dir, state['scan_pts'])
+    base_field = load_array(project_dir, state['base_field'])
+    accuracy = state['accuracy']
+    scenario_type = state['type']
+    if scenario_type == Scenario.__name__:
+        return Scenario(scan_pts, base_field=base_field, accuracy=accuracy)
+    if scenario_type != TiledScenario.__name__:
+        raise ValueError(f'Unsupported scenario type: {scenario_type}')
+
+    tiling = state['tiling']
+    survey_ends = np.cumsum(tiling['survey_sizes'])[:-1]
+    return TiledScenario(np.split(scan_pts, survey_ends), base_fields=np.split(base_field, survey_ends),
+                         tile_size=tiling['tile_size'], influence_radius=tiling['influence_radius'],
+                         interp_margin=tiling['interp_margin'], accuracy=accuracy)
+
+
+def save_project(project_dir, scenario, interp_type=None, interp_grids=(), sohograma_results=()):
+    """
+    Save the complete state of a session.
+    Args:
+        project_dir (str): Directory of the project, created if needed.
+        scenario (Scenario): Scan points, base field, accuracy and magnetic objects along with their contributions.
+        interp_type (InterpType): Selected interpolation.
+        interp_grids (list): InterpGrid of the scenario (e.g. the cached grids of its previous states).
+        sohograma_results (list): SohogramaResult of the inversions.
+    """
+    os.makedirs(project_dir, exist_ok=True)
+    previous_files = set()
+    if os.path.exists(os.path.join(project_dir, PROJECT_FILE)):
+        previous_files = referenced_files(read_project_file(project_dir))
+
+    objects = []
+    for idx, (obj_id, mag_obj) in enumerate(scenario.mag_objects.items()):
+        objects.append({
+            'vertices': np.asarray(mag_obj.vertices).tolist(),
+            'moment': float(mag_obj.scalar_moment),
+            'depth': float(mag_obj.depth),
+            'z_dim': float(mag_obj.z_dim),
+            'hidden': bool(scenario.hidden_objects_map[obj_id]),
+            'contribution': save_array(project_dir, f'contribution_{idx}', scenario.get_contribution(mag_obj))
+        })
+
+    project = {
+        'version': PROJECT_VERSION,
+        'scenario': save_scenario(project_dir, scenario),
+        'objects': objects,
+        'interp_type': interp_type.name if interp_type is not None else None,
+        'interp_grids': [{'field_hash': interp.field_hash, 'interp_type': interp.interp_type.name,
+                          'grid': save_array(project_dir, f'interp_{idx}', interp.grid)}
+                         for idx, interp in enumerate(interp_grids)],
+        'sohograma_results': [{'z_min': result.z_min, 'z_max': result.z_max,
+                               'pt_cloud': save_array(project_dir, f'sohograma_{idx}', result.pt_cloud)
+                               if result.pt_cloud is not None else None,
+                               'peaks': save_array(project_dir, f'peaks_{idx}', result.peaks)
+                               if result.peaks is not None else None}
+                              for idx, result in enumerate(sohograma_results)]
+    }
+
+    tmp_path = os.path.join(project_dir, PROJECT_FILE + '.tmp')
+    with open(tmp_path, 'w') as project_file:
+        json.dump(project, project_file, indent=2)
+    os.replace(tmp_path, os.path.join(project_dir, PROJECT_FILE))
+
+    # Arrays of the previous save which aren't used anymore (e.g. deleted objects).
+    for file_name in previous_files - referenced_files(project):
+        path = os.path.join(project_dir, file_name)
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def load_project(project_dir):
+    """
+    Load a project saved by save_project, its arrays are memory mapped.
+    The scenario is rebuilt with its saved type and accuracy, so the restored contributions match it.
+    The magnetic objects get new ids, their saved contributions are reused instead of simulating them again.
+    Returns:
+        ProjectData of the project.
+    """
+    project = read_project_file(project_dir)
+    scenario = load_scenario(project_dir, project['scenario'])
+
+    restored_objects = []
+    for obj in project['objects']:
+        mag_obj = MagneticObject(np.array(obj['vertices']), moment=obj['moment'], depth=obj['depth'],
+                                 z_dim=obj['z_dim'])
+        restored_objects.append((mag_obj, load_array(project_dir, obj['contribution']), obj['hidden']))
+    scenario.restore_mag_objects(restored_objects)
+
+    interp_grids = [InterpGrid(field_hash=interp['field_hash'], interp_type=InterpType[interp['interp_type']],
+                               grid=load_array(project_dir, interp['grid']))
+                    for interp in project['interp_grids']]
+    sohograma_results = [SohogramaResult(pt_cloud=load_array(project_dir, result['pt_cloud']),
+                                         z_min=result['z_min'], z_max=result['z_max'],
+                                         peaks=load_array(project_dir, result['peaks']))
+                         for result in project['sohograma_results']]
+    interp_type = InterpType[project['interp_type']] if project['interp_type'] is not None else None
+    return ProjectData(scenario=scenario, interp_type=interp_type, interp_grids=interp_grids,
+                       sohograma_results=sohograma_results)
@@ -12,7 +12,7 @@ class ScanPath():
                                     y_max=scan_pts[: ,1].max())
     
     @staticmethod
-    def get_scans_grid_range(self, grid_ranges):
+    def get_scans_grid_range(grid_ranges):
         x_min = min([gr.x_min for gr in grid_ranges])
         y_min = min([gr.y_min for gr in grid_ranges])
         x_max = max([gr.x_max for gr in grid_ranges])
@@ -7,21 +7,123 @@ def generate_grid(search_x, search_y):
     return scan_pts
 
 
-def generate_spiral_scan(center_pt, line_dist, num_lines, angle_resolution):
-    """_summary_
+# Maximal number of points generated at once by the chunked generators.
+CHUNK_SIZE = 2 ** 18
+
+# Newton iterations used to invert the arc length of a spiral, converges to machine precision well before.
+SPIRAL_NEWTON_ITERATIONS = 30
+
+
+def spiral_arc_length(theta, line_dist):
+    """
+    Length of the spiral r = b * theta (b = line_dist / 2pi) from its center up to the angle theta.
+    """
+    b = line_dist / (2 * np.pi)
+    return b / 2 * (theta * np.sqrt(1 + theta ** 2) + np.arcsinh(theta))
+
+
+def spiral_angle_at_length(arc_length, line_dist):
+    """
+    Inverse of spiral_arc_length, solved with newton iterations.
+    The arc length is convex in theta and sqrt(2s/b) over-estimates the solution so newton converges monotonically.
+    """
+    b = line_dist / (2 * np.pi)
+    theta = np.sqrt(2 * arc_length / b)
+    for _ in range(SPIRAL_NEWTON_ITERATIONS):
+        step = (spiral_arc_length(theta, line_dist) - arc_length) / (b * np.sqrt(1 + theta ** 2))
+        theta -= step
+        if np.all(np.abs(step) <= 1e-12 * np.maximum(theta, 1)):
+            break
+    return theta
+
+
+def num_spiral_points(line_dist, num_lines, angle_resolution=None, sample_dist=None):
+    max_angle = 2 * np.pi * num_lines
+    if sample_dist is None:
+        return int(np.ceil(max_angle / angle_resolution))
+    return int(spiral_arc_length(max_angle, line_dist) // sample_dist) + 1
+
+
+def spiral_points(center_pt, line_dist, angle_resolution, sample_dist, first, last):
+    """
+    Points first..last-1 of the spiral, see generate_spiral_scan.
+    """
+    idx = np.arange(first, last)
+    if sample_dist is None:
+        angles = idx * angle_resolution
+    else:
+        angles = spiral_angle_at_length(idx * sample_dist, line_dist)
+
+    radii = (line_dist / (2 * np.pi)) * angles
+    pts = np.empty((idx.shape[0], 2))
+    pts[:, 0] = center_pt[0] + radii * np.cos(angles)
+    pts[:, 1] = center_pt[1] + radii * np.sin(angles)
+    return pts
+
+
+def iter_spiral_scan(center_pt, line_dist, num_lines, angle_resolution=None, sample_dist=None,
+                     chunk_size=CHUNK_SIZE):
+    """
+    Lazily generate the points of generate_spiral_scan, up to chunk_size points at a time.
+    """
+    num_pts = num_spiral_points(line_dist, num_lines, angle_resolution, sample_dist)
+    for first in range(0, num_pts, chunk_size):
+        yield spiral_points(center_pt, line_dist, angle_resolution, sample_dist, first,
+                            min(first + chunk_size, num_pts))
+
+
+def generate_spiral_scan(center_pt, line_dist, num_lines, angle_resolution=None, sample_dist=None):
+    """
     Generate a spiral according to the equation:
     (r(theta) * cos(theta), r(theta) * sin(theta))
+    Where r(theta) = line_dist * theta / 2pi.
 
     Args:
-        center_pt (_type_): _description_
-        line_dist (_type_): _description_
-        num_lines (_type_): _description_
-        sample_dist (_type_): _description_
+        center_pt (2d array): Center of the spiral.
+        line_dist (float): Distance in meters between two consecutive turns.
+        num_lines (float): Number of turns.
+        angle_resolution (float): Angle in radians between each pair of points.
+        sample_dist (float): Distance in meters along the path between each pair of points, used instead
+                             of the angle resolution when given.
     """
-    angles = np.arange(0, 2 * np.pi * num_lines, angle_resolution)
-    radii = (line_dist / (2 * np.pi)) * angles
-    pts = np.vstack((center_pt[0] + radii * np.cos(angles), center_pt[1] + radii * np.sin(angles))).T
-    return pts
+    num_pts = num_spiral_points(line_dist, num_lines, angle_resolution, sample_dist)
+    return spiral_points(center_pt, line_dist, angle_resolution, sample_dist, 0, num_pts)
+
+
+def strip_points(start_pt, strip_length, strips_dist, sample_dist, first, last):
+    """
+    Points of the strips first..last-1 of the scan (see generate_strip_scan), each strip after the first one
+    is preceded by the connector leading to it from the previous strip.
+    """
+    strip_x = start_pt[0] + np.arange(int(math.ceil(strip_length / sample_dist))) * sample_dist
+    connector_steps = np.arange(1, int(math.ceil(strips_dist / sample_dist))) * sample_dist
+    num_strip_pts, num_connector_pts = strip_x.shape[0], connector_steps.shape[0]
+
+    # Even strips go forward, odd strips backwards. The connector to strip k is at the end of strip k-1.
+    strips = np.arange(first, last)
+    is_odd = (strips % 2 == 1)[:, None]
+    pts = np.empty((strips.shape[0], num_connector_pts + num_strip_pts, 2))
+    pts[:, :num_connector_pts, 0] = np.where(is_odd, strip_x[-1], strip_x[0])
+    pts[:, :num_connector_pts, 1] = (start_pt[1] - strips_dist * (strips[:, None] - 1)) - connector_steps
+    pts[:, num_connector_pts:, 0] = np.where(is_odd, strip_x[::-1], strip_x)
+    pts[:, num_connector_pts:, 1] = (start_pt[1] - strips_dist * strips)[:, None]
+
+    pts = pts.reshape(-1, 2)
+    # The first strip has no connector.
+    return pts[num_connector_pts:] if first == 0 else pts
+
+
+def iter_strip_scan(start_pt, strip_length, strips_dist, num_strips, sample_dist, chunk_size=CHUNK_SIZE):
+    """
+    Lazily generate the points of generate_strip_scan, chunks hold whole strips of up to chunk_size points.
+    """
+    pts_per_strip = int(math.ceil(strip_length / sample_dist)) + int(math.ceil(strips_dist / sample_dist))
+    strips_per_chunk = max(1, chunk_size // pts_per_strip)
+    num_strips = max(num_strips, 1)
+    for first in range(0, num_strips, strips_per_chunk):
+        yield strip_points(start_pt, strip_length, strips_dist, sample_dist, first,
+                           min(first + strips_per_chunk, num_strips))
+
 
 def generate_strip_scan(start_pt, strip_length, strips_dist, num_strips, sample_dist):
     """
@@ -33,26 +135,9 @@ def generate_strip_scan(start_pt, strip_length, strips_dist, num_strips, sample_
         num_strips (int): Total number of strips.
         sample_dist (float): Distance in meters between each pair of points in the strip.
     """
-    # First half.
-    
-    strips = [[start_pt[0] + i * sample_dist, start_pt[1]] for i in range(int(math.ceil(strip_length/sample_dist)))]
-    
-    prev_strip = strips
-    # Add the remaining strips iteratively.
-    for i in range(num_strips-1):
-        
-        end_pt = prev_strip[0] if i % 2 == 1 else prev_strip[-1]
-        connector = [[end_pt[0], end_pt[1] - sample_dist * t] for t in range(1, int(math.ceil(strips_dist/sample_dist)))]
-        
-        strips += connector
-        curr_strip = [[start_pt[0] + t * sample_dist, start_pt[1] - strips_dist * (i+1)] 
-                      for t in range(int(math.ceil(strip_length/sample_dist)))]
-        
-        strips += curr_strip if i % 2 == 1 else curr_strip[::-1]
-        prev_strip = curr_strip
-    
-    return np.array(strips)
-        
+    # The first strip is always generated.
+    return strip_points(start_pt, strip_length, strips_dist, sample_dist, 0, max(num_strips, 1))
+
 
 if __name__ == "__main__":
     import matplotlib.pyplot as plt
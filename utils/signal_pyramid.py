@@ -0,0 +1,64 @@
+import numpy as np
+
+"""
+Multi-resolution min/max pyramid of a signal, used to plot long signals with a bounded number of points.
+Level l holds the min and max of consecutive blocks of 2^l samples, a view of the signal draws a vertical
+min-max segment per block so peaks are never lost however far the plot is zoomed out.
+"""
+
+# Levels are built down to this number of blocks.
+MIN_LEVEL_SIZE = 256
+
+
+class SignalPyramid():
+
+    def __init__(self, signal) -> None:
+        self.signal = np.asarray(signal)
+
+        # levels[l] is the (mins, maxs) of the blocks of 2^l samples, level 0 is the signal itself.
+        self.levels = [(self.signal, self.signal)]
+        mins, maxs = self.signal, self.signal
+        while mins.shape[0] > MIN_LEVEL_SIZE:
+            if mins.shape[0] % 2 == 1:
+                # The last block repeats the last value, it doesn't change its min/max.
+                mins = np.append(mins, mins[-1])
+                maxs = np.append(maxs, maxs[-1])
+
+            mins = mins.reshape(-1, 2).min(axis=1)
+            maxs = maxs.reshape(-1, 2).max(axis=1)
+            self.levels.append((mins, maxs))
+
+    def __len__(self):
+        return self.signal.shape[0]
+
+    def view(self, x_start, x_end, num_pixels):
+        """
+        Points to plot for the samples between x_start and x_end.
+        Args:
+            x_start (float): First visible sample index.
+            x_end (float): Last visible sample index.
+            num_pixels (int): Width in pixels of the plot, about 2 points are returned per pixel.
+
+        Returns:
+            The x values (sample indices of the original signal) and y values of the points.
+        """
+        first = int(np.clip(np.floor(x_start), 0, len(self)))
+        last = int(np.clip(np.ceil(x_end) + 1, first, len(self)))
+        num_pixels = max(int(num_pixels), 1)
+        if last - first <= 2 * num_pixels:
+            return np.arange(first, last), self.signal[first:last]
+
+        # Coarsest level with at least one block per pixel.
+        level = min(int(np.log2((last - first) / num_pixels)), len(self.levels) - 1)
+        block_size = 2 ** level
+        mins, maxs = self.levels[level]
+        first_block, last_block = first // block_size, min(-(-last // block_size), mins.shape[0])
+
+        centers = np.arange(first_block, last_block) * block_size + (block_size - 1) / 2
+        x = np.repeat(np.clip(centers, first, last - 1), 2)
+        y = np.column_stack((mins[first_block:last_block], maxs[first_block:last_block])).ravel()
+
+        # Keep the exact end points so autoscaling sees the whole range.
+        x = np.concatenate(([first], x, [last - 1]))
+        y = np.concatenate(([self.signal[first]], y, [self.signal[last - 1]]))
+        return x, y
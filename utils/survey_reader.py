@@ -0,0 +1,225 @@
+import io
+import os
+import warnings
+from collections import namedtuple
+import numpy as np
+
+"""
+Streaming reader of magnetometer survey logs (csv or whitespace separated xyz files).
+Each row holds the x, y, z, time and value of a single sample, the file is parsed in chunks of bytes straight
+into a preallocated array so the text is never held in memory as a whole. The parsed array is stored in a
+binary .npy cache next to the log, later reads memory map the cache instead of parsing the text again.
+"""
+
+# Bytes of text parsed at a time.
+CHUNK_BYTES = 2 ** 24
+
+# Suffix of the binary cache of a parsed log.
+CACHE_SUFFIX = '.npy'
+
+# Bytes which may start a line np.loadtxt doesn't parse into a row (blank or comment lines).
+NON_DATA_STARTS = np.frombuffer(b' \t\r\n#', dtype=np.uint8)
+
+# Index of each field in the rows of the log, time may be None for logs without it.
+SurveyColumns = namedtuple('SurveyColumns', 'x y z time value')
+
+DEFAULT_COLUMNS = SurveyColumns(x=0, y=1, z=2, time=3, value=4)
+
+# Views into the parsed rows: (n,3) scan points, (n,) times (None without a time column) and (n,) values.
+SurveyData = namedtuple('SurveyData', 'scan_pts times values')
+
+
+def iter_chunks(path, chunk_bytes=CHUNK_BYTES):
+    """
+    Yield the bytes of the file in chunks of whole lines.
+    """
+    with open(path, 'rb') as survey_file:
+        remainder = b''
+        while True:
+            chunk = survey_file.read(chunk_bytes)
+            if not chunk:
+                break
+
+            chunk = remainder + chunk
+            last_newline = chunk.rfind(b'\n')
+            if last_newline == -1:
+                remainder = chunk
+                continue
+
+            remainder = chunk[last_newline + 1:]
+            yield chunk[:last_newline + 1]
+
+        if remainder.strip():
+            yield remainder
+
+
+def is_header(line):
+    try:
+        float(line.replace(b',', b' ').split()[0])
+        return False
+    except (ValueError, IndexError):
+        return True
+
+
+def strip_header(chunk):
+    """
+    Drop the header line (any line starting with a non numeric value) from the first chunk of the file.
+    """
+    chunk = chunk.lstrip()
+    first_line, _, rest = chunk.partition(b'\n')
+    return rest if is_header(first_line) else chunk
+
+
+def blank_line_spans(chunk):
+    """
+    (start, end) of the blank (possibly whitespace only) and comment (#) lines of the chunk, ends include the newline.
+    Only the few lines starting with whitespace or # are looked at one by one.
+    """
+    chars = np.frombuffer(chunk, dtype=np.uint8)
+    starts = np.concatenate(([0], np.flatnonzero(chars == ord('\n')) + 1))
+    starts = starts[starts < chars.shape[0]]
+
+    spans = []
+    for start in starts[np.isin(chars[starts], NON_DATA_STARTS)]:
+        end = chunk.find(b'\n', start)
+        end = end + 1 if end != -1 else len(chunk)
+        line = chunk[start:end].strip()
+        if not line or line.startswith(b'#'):
+            spans.append((start, end))
+    return spans
+
+
+def count_data_lines(chunk):
+    """
+    Number of lines of the chunk parse_chunk parses into rows, blank and comment lines are skipped.
+    """
+    num_lines = chunk.count(b'\n') + (0 if chunk.endswith(b'\n') or not chunk else 1)
+    return num_lines - len(blank_line_spans(chunk))
+
+
+def parse_chunk(chunk, num_cols, delimiter):
+    """
+    Parse a chunk of whole lines into a (rows, num_cols) array.
+    Blank and comment lines are dropped first, np.loadtxt doesn't skip whitespace only lines of csv logs.
+    """
+    spans = blank_line_spans(chunk)
+    if spans:
+        ends = [0] + [end for _, end in spans]
+        starts = [start for start, _ in spans] + [len(chunk)]
+        chunk = b''.join(chunk[end:start] for end, start in zip(ends, starts))
+
+    # Chunks without data (e.g. only blank lines) are expected, not worth a warning.
+    with warnings.catch_warnings():
+        warnings.filterwarnings('ignore', message='loadtxt: input contained no data', category=UserWarning)
+        rows = np.loadtxt(io.BytesIO(chunk), dtype=np.float64, delimiter=delimiter, ndmin=2)
+    if rows.shape[0] > 0 and rows.shape[1] != num_cols:
+        raise ValueError(f'Survey rows are expected to have {num_cols} values')
+    return rows
+
+
+def count_rows(path, chunk_bytes=CHUNK_BYTES):
+    """
+    Number of rows of the file (its lines without the header, blank and comment lines), along with its number of
+    columns and their delimiter (a comma for csv logs, None for whitespace separated ones).
+    """
+    num_rows = 0
+    num_cols = None
+    delimiter = None
+    for ichunk, chunk in enumerate(iter_chunks(path, chunk_bytes)):
+        if ichunk == 0:
+            chunk = strip_header(chunk)
+        if num_cols is None:
+            first_line = chunk.lstrip().partition(b'\n')[0]
+            if first_line:
+                delimiter = ',' if b',' in first_line else None
+                num_cols = len(first_line.replace(b',', b' ').split())
+        num_rows += count_data_lines(chunk)
+    return num_rows, num_cols, delimiter
+
+
+def parse_survey(path, out_path=None, chunk_bytes=CHUNK_BYTES):
+    """
+    Parse the log into a (n, num_cols) array.
+    Args:
+        path (str): Path of the csv/xyz log, may start with a header line.
+        out_path (str): When given the rows are written into a .npy file at this path and memory mapped.
+        chunk_bytes (int): Bytes of text parsed at a time.
+
+    Returns:
+        The parsed rows.
+    """
+    num_rows, num_cols, delimiter = count_rows(path, chunk_bytes)
+    if num_cols is None:
+        raise ValueError(f'No survey rows in {path}')
+
+    # The rows are counted exactly, so they're parsed straight into an array of the final size.
+    shape = (num_rows, num_cols)
+    if out_path is None:
+        rows = np.empty(shape)
+    else:
+        rows = np.lib.format.open_memmap(out_path, mode='w+', dtype=np.float64, shape=shape)
+
+    num_parsed = 0
+    for ichunk, chunk in enumerate(iter_chunks(path, chunk_bytes)):
+        if ichunk == 0:
+            chunk = strip_header(chunk)
+
+        chunk_rows = parse_chunk(chunk, num_cols, delimiter)
+        if num_parsed + chunk_rows.shape[0] > num_rows:
+            raise ValueError(f'Survey {path} has more rows than counted')
+        rows[num_parsed:num_parsed + chunk_rows.shape[0]] = chunk_rows
+        num_parsed += chunk_rows.shape[0]
+
+    if num_parsed != num_rows:
+        raise ValueError(f'Parsed {num_parsed} of the {num_rows} rows of {path}')
+    return rows
+
+
+def get_cache_path(path):
+    return path + CACHE_SUFFIX
+
+
+def load_rows(path, use_cache=True, chunk_bytes=CHUNK_BYTES):
+    """
+    Rows of the log, memory mapped from its binary cache if it's newer than the log, parsed (and cached) otherwise.
+    """
+    if not use_cache:
+        return parse_survey(path, chunk_bytes=chunk_bytes)
+
+    cache_path = get_cache_path(path)
+    if os.path.exists(cache_path) and os.path.getmtime(cache_path) >= os.path.getmtime(path):
+        return np.load(cache_path, mmap_mode='r')
+
+    # Parse into a temporary file so an interrupted parse never leaves a valid looking cache behind.
+    tmp_path = cache_path + '.tmp' + CACHE_SUFFIX
+    try:
+        rows = parse_survey(path, out_path=tmp_path, chunk_bytes=chunk_bytes)
+    except ValueError:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    rows.flush()
+    del rows
+    os.replace(tmp_path, cache_path)
+    return np.load(cache_path, mmap_mode='r')
+
+
+def read_survey(path, columns=DEFAULT_COLUMNS, use_cache=True, chunk_bytes=CHUNK_BYTES):
+    """
+    Read a magnetometer survey log.
+    Args:
+        path (str): Path of the csv/xyz log.
+        columns (SurveyColumns): Index of each field in the rows.
+        use_cache (bool): Memory map the binary cache of the log, creating it if needed.
+        chunk_bytes (int): Bytes of text parsed at a time.
+
+    Returns:
+        SurveyData of the log.
+    """
+    rows = load_rows(path, use_cache=use_cache, chunk_bytes=chunk_bytes)
+    if max(col for col in columns if col is not None) >= rows.shape[1]:
+        raise ValueError(f'Survey {path} has only {rows.shape[1]} columns')
+
+    return SurveyData(scan_pts=rows[:, [columns.x, columns.y, columns.z]],
+                      times=None if columns.time is None else rows[:, columns.time],
+                      values=rows[:, columns.value])
@@ -0,0 +1,43 @@
+import os
+import numpy as np
+
+from utils.survey_reader import read_survey, count_rows, get_cache_path
+
+rows = np.array([[float(i), -2. * i, 0.3, 10. + i, 4.5e6 + i] for i in range(20)])
+
+
+def write_log(path, lines):
+    with open(path, 'w') as log_file:
+        log_file.write('\n'.join(lines) + '\n')
+    return str(path)
+
+
+def check_survey(path, chunk_bytes):
+    num_rows, num_cols, _ = count_rows(path, chunk_bytes)
+    assert (num_rows, num_cols) == rows.shape, 'counted: %s' % ((num_rows, num_cols),)
+    for use_cache in (False, True, True):
+        survey = read_survey(path, use_cache=use_cache, chunk_bytes=chunk_bytes)
+        diff = np.abs(survey.values - rows[:, 4]).max()
+        assert diff == 0, 'max diff: %g' % (diff)
+        assert np.array_equal(survey.scan_pts, rows[:, :3])
+
+
+def test_csv_blank_lines(tmp_path):
+    "Blank, whitespace only and comment lines of a csv log are skipped when counting and parsing"
+    lines = ['x,y,z,time,value']
+    for idx, row in enumerate(rows):
+        lines.append(','.join(repr(val) for val in row))
+        lines.append(['', '   ', '\t', '# comment', '  # indented comment'][idx % 5])
+    path = write_log(tmp_path / 'survey.csv', lines)
+    for chunk_bytes in (64, 2 ** 20):
+        check_survey(path, chunk_bytes)
+        os.remove(get_cache_path(path))
+
+
+def test_xyz_blank_lines(tmp_path):
+    "Same as test_csv_blank_lines for a whitespace separated log without a header"
+    lines = []
+    for row in rows:
+        lines.extend(['   ', ' '.join(repr(val) for val in row), ''])
+    path = write_log(tmp_path / 'survey.xyz', lines)
+    check_survey(path, 64)
@@ -9,6 +9,9 @@ DEFAULT_NUM_LINES = 5
 
 DEFAULT_ANGULAR_RES = 15
 
+# Empty sampling distance means the points are spread by the angular resolution.
+DEFAULT_SAMPLE_DIST = ''
+
 
 class SpiralForm(Qtw.QWidget):
     
@@ -23,6 +26,7 @@ class SpiralForm(Qtw.QWidget):
         self.line_dist_edit = None
         self.num_lines_edit = None
         self.samp_dist_edit = None
+        self.track_dist_edit = None
         self.initUI()
         
     def initUI(self):
@@ -33,10 +37,13 @@ class SpiralForm(Qtw.QWidget):
         self.line_dist_edit = Qtw.QLineEdit(str(DEFAULT_LINE_DIST))
         self.num_lines_edit = Qtw.QLineEdit(str(DEFAULT_NUM_LINES))
         self.samp_dist_edit = Qtw.QLineEdit(str(DEFAULT_ANGULAR_RES))
+        self.track_dist_edit = Qtw.QLineEdit(DEFAULT_SAMPLE_DIST)
+        self.track_dist_edit.setPlaceholderText('Use angular resolution')
         
         self.line_dist_edit.returnPressed.connect(self.update_scan_params)
         self.num_lines_edit.returnPressed.connect(self.update_scan_params)
         self.samp_dist_edit.returnPressed.connect(self.update_scan_params)
+        self.track_dist_edit.returnPressed.connect(self.update_scan_params)
         
         
         self.center_pt_button = Qtw.QPushButton('Mark Center Point')
@@ -48,6 +55,7 @@ class SpiralForm(Qtw.QWidget):
         path_props_form.addRow('Line Distance: ', self.line_dist_edit)
         path_props_form.addRow('Number of lines: ', self.num_lines_edit)
         path_props_form.addRow('Angular Resolution: ', self.samp_dist_edit)
+        path_props_form.addRow('Sampling distance: ', self.track_dist_edit)
         container.setLayout(path_props_form)
         layout.addWidget(container)
         
@@ -66,10 +74,12 @@ class SpiralForm(Qtw.QWidget):
         if self.center_pt is None:
             return
         
+        track_dist = self.track_dist_edit.text().strip()
         return generate_spiral_scan(center_pt=self.center_pt,
                                         line_dist=float(self.line_dist_edit.text()),
                                         num_lines=float(self.num_lines_edit.text()),
-                                        angle_resolution=float(self.samp_dist_edit.text()) * np.pi/180)
+                                        angle_resolution=float(self.samp_dist_edit.text()) * np.pi/180,
+                                        sample_dist=float(track_dist) if track_dist else None)
 
  
         
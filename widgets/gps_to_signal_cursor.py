@@ -1,12 +1,20 @@
 from matplotlib.widgets import Cursor
+from scipy.spatial import cKDTree
 import numpy as np
+import time
 
 
 """
 Cursor that synchronized a gps 2d plot and a signal of measurements.
 """
 
-def bind_gps_to_signal(gps_cursor, signal_cursor, raw_signal, gps_coords):
+# Maximal distance (in meters) between the gps cursor and the scan point it's bound to.
+MAX_CURSOR_DIST = 1
+
+# Motion events are handled at most at the display refresh rate (in seconds).
+MIN_MOVE_INTERVAL = 1 / 60
+
+def bind_gps_to_signal(gps_cursor, signal_cursor, raw_signal, gps_coords, gps_tree=None):
     """_summary_
     Bind two extendable cursors.
     Args:
@@ -14,7 +22,10 @@ def bind_gps_to_signal(gps_cursor, signal_cursor, raw_signal, gps_coords):
         signal_cursor (_type_): _description_
         raw_signal (_type_): _description_
         gps_coords (_type_): _description_
+        gps_tree (cKDTree): Spatial index of gps_coords, built here if not given.
     """
+    if gps_tree is None:
+        gps_tree = cKDTree(gps_coords)
     
     def post_move_signal(event):
         if event.xdata is None or event.ydata is None:
@@ -31,9 +42,8 @@ def bind_gps_to_signal(gps_cursor, signal_cursor, raw_signal, gps_coords):
         # if event.xdata is None or event.ydata is None:
         #     return 
         
-        dist_mat = np.linalg.norm(gps_coords-np.array([event.xdata, event.ydata]), axis=1)
-        coord_idx = np.argmin(dist_mat)
-        if dist_mat[coord_idx] > 1:
+        dist, coord_idx = gps_tree.query([event.xdata, event.ydata], distance_upper_bound=MAX_CURSOR_DIST)
+        if np.isinf(dist):
             return
 
         signal_cursor.move_to(coord_idx, 0)
@@ -45,19 +55,53 @@ def bind_gps_to_signal(gps_cursor, signal_cursor, raw_signal, gps_coords):
 class ExtendableCursor(Cursor):
     
     def __init__(self, ax, horizOn=True, vertOn=True, useblit=False, post_move=None,
-                 **lineprops) -> None:
+                 min_move_interval=MIN_MOVE_INTERVAL, **lineprops) -> None:
         super().__init__(ax, horizOn, vertOn, useblit,
                  **lineprops)
         
         self.post_move = post_move
         
+        # Motion events arriving faster than min_move_interval are coalesced, only the latest one is handled.
+        self.min_move_interval = min_move_interval
+        self.last_move_time = 0
+        self.pending_event = None
+        self.move_timer = None
+        
     def onmove(self, event):
+        self.pending_event = event
+        elapsed = time.perf_counter() - self.last_move_time
+        if elapsed >= self.min_move_interval:
+            self.handle_pending_move()
+        elif self.move_timer is None:
+            # Handle the latest event once the interval passes so the cursor ends where the mouse stopped.
+            self.move_timer = self.ax.figure.canvas.new_timer(
+                interval=int(np.ceil((self.min_move_interval - elapsed) * 1e3)))
+            self.move_timer.single_shot = True
+            self.move_timer.add_callback(self.handle_pending_move)
+            self.move_timer.start()
+    
+    def handle_pending_move(self):
+        if self.move_timer is not None:
+            self.move_timer.stop()
+            self.move_timer = None
         
+        event, self.pending_event = self.pending_event, None
+        if event is None:
+            return
+        
+        self.last_move_time = time.perf_counter()
         super().onmove(event)
         
         if event.inaxes == self.ax and self.post_move is not None:
             self.post_move(event)
     
+    def refresh_background(self):
+        """
+        Recapture the blitting background, e.g. after animated artists were drawn over the axes.
+        """
+        if self.useblit:
+            self.background = self.canvas.copy_from_bbox(self.ax.bbox)
+    
     def move_to(self, x, y):
         if self.vertOn:
             self.linev.set_xdata((x, x))
@@ -0,0 +1,132 @@
+import time
+import requests
+from PyQt5.QtCore import QThread, pyqtSignal
+from backend.transport import encode_arrays, decode_arrays, NPZ_MIMETYPE
+
+"""
+Drive an inversion job on the server from a background thread so the GUI stays responsive.
+Only the candidate sources are fetched once the job is done, the semblance cube is fetched by a CubeWorker
+when it's shown.
+"""
+
+# Seconds between two polls of the job status.
+POLL_INTERVAL = 0.5
+
+
+def fetch_result(result_url, include_cube, max_peaks):
+    """
+    Fetch the result of a finished job.
+    Args:
+        result_url (str): Url of the job's result.
+        include_cube (bool): Whether to fetch the semblance cube (pt_cloud) along with the peaks.
+        max_peaks (int): Maximal number of fetched candidate sources.
+
+    Returns:
+        Dictionary of the received arrays.
+    """
+    response = requests.get(result_url, params={'cube': int(include_cube), 'max_peaks': max_peaks},
+                            headers={'Accept': NPZ_MIMETYPE})
+    response.raise_for_status()
+    arrays, _, decode_stats = decode_arrays(response.content)
+    print(f'Received {decode_stats.num_bytes} bytes (decoded in {decode_stats.seconds:.3f}s), '
+          f'server serialize: {response.headers.get("X-Serialize-Time")}s')
+    return arrays
+
+
+class InversionWorker(QThread):
+    """
+    Submit the scenario as a job, poll its progress and fetch its candidate sources once it's done.
+    The signals are delivered in the GUI thread.
+    """
+
+    # Fraction of the z-slices computed so far.
+    progress_changed = pyqtSignal(float)
+
+    # Url of the job's result (to fetch the cube from) and its ranked candidate sources (x,y,z,semblance).
+    inversion_done = pyqtSignal(str, object)
+
+    # Error message, or an empty string if the job was cancelled.
+    inversion_failed = pyqtSignal(str)
+
+    def __init__(self, jobs_url, soh_inp, max_peaks, compress=False) -> None:
+        super().__init__()
+        self.jobs_url = jobs_url
+        self.compress = compress
+        self.max_peaks = max_peaks
+
+        soh_inp = dict(soh_inp)
+        self.arrays = {'scan_pts': soh_inp.pop('scan_pts'), 'scan_vals': soh_inp.pop('scan_vals')}
+        self.meta = dict(soh_inp, compress=compress)
+
+    def cancel(self):
+        self.requestInterruption()
+
+    def run(self):
+        # Any failure has to be signalled, the GUI waits for the job until then.
+        try:
+            self.run_job()
+        except requests.RequestException as e:
+            self.inversion_failed.emit(str(e))
+        except (KeyError, ValueError) as e:
+            self.inversion_failed.emit(f'Unexpected server response: {e!r}')
+
+    def run_job(self):
+        payload, encode_stats = encode_arrays(self.arrays, meta=self.meta, compress=self.compress)
+        response = requests.post(self.jobs_url, data=payload, headers={'Content-Type': NPZ_MIMETYPE})
+        response.raise_for_status()
+        job_url = f'{self.jobs_url}/{response.json()["job_id"]}'
+        print(f'Submitted inversion job: {job_url} ({encode_stats.num_bytes} bytes)')
+
+        while True:
+            if self.isInterruptionRequested():
+                requests.delete(job_url)
+                self.inversion_failed.emit('')
+                return
+
+            response = requests.get(job_url)
+            response.raise_for_status()
+            status = response.json()
+            self.progress_changed.emit(status['progress'])
+            if status['status'] == 'done':
+                break
+            elif status['status'] in ('failed', 'cancelled'):
+                self.inversion_failed.emit(status['error'] or status['status'])
+                return
+
+            time.sleep(POLL_INTERVAL)
+
+        result_url = f'{job_url}/result'
+        arrays = fetch_result(result_url, include_cube=False, max_peaks=self.max_peaks)
+        print(f'Received {arrays["peaks"].shape[0]} candidate sources')
+        self.inversion_done.emit(result_url, arrays['peaks'])
+
+
+class CubeWorker(QThread):
+    """
+    Fetch the semblance cube of a finished job.
+    """
+
+    cube_received = pyqtSignal(object)
+
+    fetch_failed = pyqtSignal(str)
+
+    # The server no longer holds the job, it only keeps the results of its latest finished jobs.
+    cube_expired = pyqtSignal()
+
+    def __init__(self, result_url) -> None:
+        super().__init__()
+        self.result_url = result_url
+
+    def run(self):
+        try:
+            arrays = fetch_result(self.result_url, include_cube=True, max_peaks=0)
+            self.cube_received.emit(arrays['pt_cloud'])
+        except requests.HTTPError as e:
+            if e.response is not None and e.response.status_code == 404:
+                self.cube_expired.emit()
+            else:
+                self.fetch_failed.emit(str(e))
+        except requests.RequestException as e:
+            self.fetch_failed.emit(str(e))
+        except (KeyError, ValueError) as e:
+            self.fetch_failed.emit(f'Unexpected server response: {e!r}')
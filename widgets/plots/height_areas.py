@@ -0,0 +1,64 @@
+from collections import namedtuple
+from scipy import ndimage
+import numpy as np
+
+"""
+Area covered by the points of a filtered point cloud in each height layer of the searched cube.
+The points of each layer are grouped into clusters of adjacent cells (one per source), the area of a cluster
+is its number of cells times the area of a cell.
+"""
+
+# Per height (only heights with any point): total area, number of clusters and area of the largest cluster.
+HeightAreas = namedtuple('HeightAreas', 'heights areas num_clusters largest_areas')
+
+# Cells are connected to their 8 neighbours in the same layer, never across layers.
+LAYER_STRUCTURE = np.zeros((3, 3, 3), dtype=bool)
+LAYER_STRUCTURE[:, :, 1] = True
+
+
+class HeightAreaAnalyzer():
+
+    def __init__(self, search_x, search_y, search_z) -> None:
+        self.search_z = search_z
+        self.shape = (len(search_x), len(search_y), len(search_z))
+        self.cell_area = abs((search_x[1] - search_x[0]) if len(search_x) > 1 else 1) * \
+                         abs((search_y[1] - search_y[0]) if len(search_y) > 1 else 1)
+
+        # The points over a percentile are identified by their count, see PercentileFilter.
+        self.cache = {}
+
+    def get_height_areas(self, flat_idxs):
+        """
+        Areas of the layers of the points with the given flat indices into the cube.
+        Args:
+            flat_idxs (np.ndarray): Indices as returned by PercentileFilter.get_idxs_over_percentile.
+
+        Returns:
+            HeightAreas of the points.
+        """
+        key = len(flat_idxs)
+        if key not in self.cache:
+            self.cache[key] = self.compute(flat_idxs)
+        return self.cache[key]
+
+    def compute(self, flat_idxs):
+        mask = np.zeros(self.shape, dtype=bool)
+        mask.flat[flat_idxs] = True
+        labels, num_labels = ndimage.label(mask, structure=LAYER_STRUCTURE)
+
+        # Labels don't cross layers so each one belongs to a single height.
+        pt_layers = np.unravel_index(flat_idxs, self.shape)[2]
+        label_layers = np.zeros(num_labels, dtype=int)
+        label_layers[labels.flat[flat_idxs] - 1] = pt_layers
+        label_sizes = np.bincount(labels.flat[flat_idxs], minlength=num_labels + 1)[1:]
+
+        num_cells = np.bincount(pt_layers, minlength=self.shape[2])
+        num_clusters = np.bincount(label_layers, minlength=self.shape[2])
+        largest_cells = np.zeros(self.shape[2], dtype=int)
+        np.maximum.at(largest_cells, label_layers, label_sizes)
+
+        valid = num_cells > 0
+        return HeightAreas(heights=self.search_z[valid],
+                           areas=num_cells[valid] * self.cell_area,
+                           num_clusters=num_clusters[valid],
+                           largest_areas=largest_cells[valid] * self.cell_area)
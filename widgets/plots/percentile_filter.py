@@ -1,13 +1,10 @@
 import numpy as np
 
 """
-Map the points in the point cloud to the given
+Map the points in the point cloud to the given percentiles.
+The cloud is sorted once in descending order, the points over any percentile are then a prefix of it.
 """
 
-def np_where_3d_wrapper(condition):
-    idxs = np.where(condition)
-    return np.vstack((idxs[0], idxs[1], idxs[2])).T
-    
 def get_percentile_vals(start_val=80, end_val=99.99, jump=5.):
     vals = []
     curr_val = start_val
@@ -20,44 +17,55 @@ def get_percentile_vals(start_val=80, end_val=99.99, jump=5.):
 
 
 class PercentileFilter():
-    
+
     def __init__(self, search_x, search_y, search_z, pt_cloud) -> None:
-        
-        # Map each percentile to the pts that will be added once we pass it.
+
         self.pt_cloud = pt_cloud
-        self.percentile_map = {}
-        
-        self.X, self.Y, self.Z = np.meshgrid(search_x, search_y, search_z, indexing='ij')
-        
+
         self.percentile_vals = get_percentile_vals()
-        self.preprocess()
-        
-
-    def preprocess(self):
-        prev_per_val = None
-        for per in self.percentile_vals[::-1]:
-            per_val = np.percentile(self.pt_cloud, per)
-            
-            if prev_per_val:
-                idxs = np_where_3d_wrapper(self.pt_cloud >= per_val and self.pt_cloud <= prev_per_val)
-            else:
-                idxs = np_where_3d_wrapper(self.pt_cloud >= per_val)
-            
-            
-            self.percentile_map[per] = idxs
-    
+        self.preprocess(search_x, search_y, search_z)
+
+
+    def preprocess(self, search_x, search_y, search_z):
+        flat_cloud = self.pt_cloud.reshape(-1)
+        ascending_order = np.argsort(flat_cloud, kind='stable')
+        self.sorted_vals = flat_cloud[ascending_order]
+
+        # Flat indices of the cloud from the highest value to the lowest.
+        self.sorted_idxs = ascending_order[::-1]
+
+        # (x,y,z,value) of each point in descending order.
+        ix, iy, iz = np.unravel_index(self.sorted_idxs, self.pt_cloud.shape)
+        self.sorted_pts = np.column_stack((search_x[ix], search_y[iy], search_z[iz], self.sorted_vals[::-1]))
+
+    def percentile_value(self, percentile):
+        """
+        Same as np.percentile (linear interpolation) over the already sorted values.
+        """
+        pos = percentile / 100 * (self.sorted_vals.shape[0] - 1)
+        low = int(np.floor(pos))
+        high = min(low + 1, self.sorted_vals.shape[0] - 1)
+        return self.sorted_vals[low] + (pos - low) * (self.sorted_vals[high] - self.sorted_vals[low])
+
+    def count_over_percentile(self, percentile):
+        per_val = self.percentile_value(percentile)
+        return self.sorted_vals.shape[0] - np.searchsorted(self.sorted_vals, per_val, side='left')
+
+    def get_idxs_over_percentile(self, percentile):
+        """
+        Flat indices (into pt_cloud) of the points over the given percentile, highest value first.
+        """
+        return self.sorted_idxs[:self.count_over_percentile(percentile)]
+
     def get_pts_over_percentile(self, percentile):
         """
-        Gather all the preprocessed indices and return a section of the pt cloud
+        Return the section of the pt cloud over the given percentile, highest value first.
         Args:
-            percentile (_type_): _description_
+            percentile (float): Percentile between 0 and 100.
+
+        Returns:
+            Read only (N,4) array of the (x,y,z,value) of each point.
         """
-        pts = []
-        per_idx = np.argmin(np.abs(self.percentile_vals-percentile))
-        for i in range(per_idx, len(self.percentile_vals)):
-            idxs = self.percentile_map[self.percentile_vals[i]]
-            for idx in idxs:
-                tup_idx = tuple(idx)
-                pts.append([self.X[tup_idx], self.Y[tup_idx], self.Z[tup_idx], self.pt_cloud[tup_idx]])
-        
-        return np.array(pts)
\ No newline at end of file
+        pts = self.sorted_pts[:self.count_over_percentile(percentile)]
+        pts.flags.writeable = False
+        return pts
@@ -8,14 +8,23 @@ from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg
 from transforms.rtp import rtp
 
 from matplotlib.figure import Figure
-from matplotlib.pyplot import Rectangle
 from simulations.mag_object import MagneticObject
+from collections import deque
+import time
 import numpy as np
 from simulations.scenario import GridRange
 from matplotlib.widgets import RectangleSelector
 from enum import Enum
 import matplotlib.gridspec as gridspec
 from widgets.gps_to_signal_cursor import ExtendableCursor, bind_gps_to_signal
+from interps.interp_cache import InterpCache, InterpKey
+from utils.project import InterpGrid
+from consts import DEBUG
+
+# Number of recent frames averaged by the frame time instrumentation.
+FRAME_TIME_WINDOW = 20
+
+SELECTED_COLOR = 'pink'
 
 class SimMode(Enum):
     """
@@ -43,6 +52,7 @@ class SimulationCanvas(FigureCanvasQTAgg):
         
         # If true allows the user to simulate objects using the cursor.
         self.sim_on = False
+        self.rect_selector = None
         
         # The simulation mode selected by the user.
         self.sim_mode = SimMode.DIPOLE
@@ -53,6 +63,8 @@ class SimulationCanvas(FigureCanvasQTAgg):
         # Map each magnetic object to its plot.
         self.mag_obj_plots = {}
         
+        self.sig_cursor = None
+        self.interp_cursor = None
         self.initialize_cursor()
         
         # self.hover_sig_plt = self.signal_ax.axvline(color='black')
@@ -67,9 +79,26 @@ class SimulationCanvas(FigureCanvasQTAgg):
         # Selected interp type by the user.
         self.interp_type = None
         
-        self.interp_contour = None
+        # Artists created once per scenario, redraws only update their data.
+        self.interp_image = None
+        self.scan_scatter = None
+        self.signal_line = None
+        
+        # Highlight of the selected object, blitted over the cached background of the interpolation axes.
+        self.highlight_plot = None
+        self.interp_background = None
+        
+        # Recent frame times (in seconds) of each kind of redraw.
+        self.frame_times = {}
+        
+        # Interpolated grids of previous scenario states, switching back to them is instant.
+        self.interp_cache = InterpCache()
         
         super(SimulationCanvas, self).__init__(self.fig)
+        self.mpl_connect('draw_event', self.on_draw)
+        
+        # Zooming or panning the signal picks the resolution of the plotted signal.
+        self.signal_ax.callbacks.connect('xlim_changed', self.update_signal_view)
     
     def flip_rtp_mode(self):
         self.show_rtp = not self.show_rtp
@@ -82,15 +111,23 @@ class SimulationCanvas(FigureCanvasQTAgg):
             self.plot_data()
     
     def update_interp_data(self):
-        if len(self.scenario.mag_objects) == 0:
-            # Fill with empty grid.
+        if np.ptp(self.scenario.sim_field) == 0:
+            # Uniform field (no objects on top of the default base field), fill with empty grid.
             self.interp_data = np.ones((len(self.scenario.search_x), len(self.scenario.search_y))) \
                                 * self.scenario.sim_field.min()
         else:
-            self.interp_data = self.interp_type.value.interp_func(self.scenario.scan_pts, 
-                self.scenario.raw_signal,
-                self.scenario.search_x,
-                self.scenario.search_y)
+            interp_key = InterpKey(geometry_hash=self.scenario.geometry_hash,
+                                   field_hash=self.scenario.field_hash,
+                                   interp_type=self.interp_type,
+                                   grid_shape=self.scenario.grid_shape)
+            self.interp_data = self.interp_cache.get(interp_key)
+            
+            if self.interp_data is None:
+                self.interp_data = self.scenario.interpolate(self.interp_type.value.interp_func)
+                self.interp_cache.put(interp_key, self.interp_data)
+            
+            if DEBUG:
+                print(f'Interpolation cache: {self.interp_cache.stats}')
             
             if self.show_rtp:
                 self.interp_data = rtp(self.scenario.search_x, self.scenario.search_y,
@@ -98,24 +135,49 @@ class SimulationCanvas(FigureCanvasQTAgg):
 
    
     def initialize_cursor(self):
+        if self.sig_cursor is not None:
+            self.sig_cursor.disconnect_events()
+            self.interp_cursor.disconnect_events()
+            
         self.sig_cursor = ExtendableCursor(self.signal_ax, useblit=True, color='black', linewidth=1, horizOn=False) 
         self.interp_cursor = ExtendableCursor(self.interp_ax, useblit=True, color='black', linewidth=1)     
         
         if self.scenario is not None:
             bind_gps_to_signal(self.interp_cursor, self.sig_cursor, self.scenario.raw_signal,
-                        self.scenario.scan_pts[:, :2])
+                        self.scenario.scan_pts[:, :2], gps_tree=self.scenario.scan_tree)
 
 
        
-    def set_scenario(self, scenario):
+    def set_scenario(self, scenario, interp_grids=()):
+        """
+        Show the given scenario, interp_grids (see get_interp_grids) are cached before its field is interpolated.
+        """
+        self.remove_artists()
         self.scenario = scenario
+        self.restore_interp_grids(interp_grids)
         self.interp_ax.set_xlim(self.scenario.search_x.min(), self.scenario.search_x.max())
         self.interp_ax.set_ylim(self.scenario.search_y.min(), self.scenario.search_y.max())
 
+        # A measured base field is shown before any object is added.
+        self.update_interp_data()
         self.plot_data()
         self.initialize_cursor()
 
         
+    def get_interp_grids(self):
+        """
+        Cached interpolations of the current scan, see InterpGrid.
+        """
+        return [InterpGrid(field_hash=key.field_hash, interp_type=key.interp_type, grid=grid)
+                for key, grid in self.interp_cache.entries.items()
+                if key.geometry_hash == self.scenario.geometry_hash]
+    
+    def restore_interp_grids(self, interp_grids):
+        for interp in interp_grids:
+            self.interp_cache.put(InterpKey(geometry_hash=self.scenario.geometry_hash, field_hash=interp.field_hash,
+                                            interp_type=interp.interp_type, grid_shape=interp.grid.shape),
+                                  interp.grid)
+    
     def set_mag_props_query(self, mag_props_query):
         self.mag_properties_query = mag_props_query
         
@@ -126,22 +188,14 @@ class SimulationCanvas(FigureCanvasQTAgg):
         self.draw()
     
     def set_selected_id(self, selected_id):
-        # Update previously selected.
-        if self.selected_id:
-            self.remove_object_plot(self.selected_id)
-            self.draw_mag_object(self.scenario.mag_objects[self.selected_id])
-            
+        # Only the highlight changes, no need to render the whole figure.
         self.selected_id = selected_id
-        self.remove_object_plot(self.selected_id)
-        self.draw_mag_object(self.scenario.mag_objects[selected_id], color='pink')
-        self.draw()
+        self.update_highlight()
         
     def remove_object_plot(self, obj_id):
-        try:
-            self.mag_obj_plots[self.selected_id].remove()
-        except ValueError:
-            # TODO - Add logs.
-            return
+        obj_plot = self.mag_obj_plots.pop(obj_id, None)
+        if obj_plot is not None:
+            obj_plot.remove()
     
     def update_mag_properties(self, mag_props, obj_id):
         """
@@ -158,6 +212,17 @@ class SimulationCanvas(FigureCanvasQTAgg):
         self.scenario.update_boundaries()
         self.plot_data()
     
+    def set_accuracy(self, accuracy):
+        """
+        Forward model the objects up to the given accuracy (in nT), None models them at every scan point.
+        """
+        if self.scenario is None:
+            return
+        
+        self.scenario.set_accuracy(accuracy)
+        self.update_interp_data()
+        self.plot_data()
+    
     def set_mag_object_listener(self, listener_func):
         """
         Set the listener which will be activated once we add a new magnetic object.
@@ -170,9 +235,9 @@ class SimulationCanvas(FigureCanvasQTAgg):
     def add_rect_object(self, eclick, erelease):
         x1, y1 = eclick.xdata, eclick.ydata
         x2, y2 = erelease.xdata, erelease.ydata
-
-        rect = Rectangle( (min(x1,x2),min(y1,y2)), np.abs(x1-x2), np.abs(y1-y2) , fill=None)
-        self.interp_ax.add_patch(rect)
+        
+        # The object is drawn by plot_data, the selection box is only shown while dragging.
+        self.rect_selector.set_visible(False)
         
         # Add the magnetic object.
         moment, depth, zdim = self.mag_properties_query()
@@ -184,7 +249,6 @@ class SimulationCanvas(FigureCanvasQTAgg):
                     [x2, y1]
                 ]), moment=moment, depth=depth, z_dim=zdim))
         self.plot_data()
-        self.draw()
     
     def attach_rectangle_selector(self):
         self.rect_selector = RectangleSelector(self.interp_ax, self.add_rect_object,
@@ -246,7 +310,8 @@ class SimulationCanvas(FigureCanvasQTAgg):
     def deactivate_sim_mode_listener(self, curr_sim_mode):
         if curr_sim_mode.value == SimMode.DIPOLE.value:
             self.fig.canvas.mpl_disconnect(self.dipole_cid)
-        else:
+        elif self.rect_selector is not None:
+            self.rect_selector.set_visible(False)
             self.rect_selector = None
 
             
@@ -274,7 +339,6 @@ class SimulationCanvas(FigureCanvasQTAgg):
     
     def reset_state(self):
         self.scenario.clean()
-        self.mag_obj_plots = {}
         self.sim_on = False
         self.selected_id = None
         self.sim_mode = SimMode.DIPOLE
@@ -284,57 +348,169 @@ class SimulationCanvas(FigureCanvasQTAgg):
     def get_magnetic_object(self, obj_id):
         return self.scenario.mag_objects[obj_id]
 
-    def plot_data(self):
+    def create_artists(self):
+        """
+        Create the artists of the current scenario, plot_data only updates their data afterwards.
+        """
+        self.remove_artists()
+        
         # Keep the same xlim and ylim
         prev_xlim = self.interp_ax.get_xlim()
         prev_ylim = self.interp_ax.get_ylim()
         
-        self.interp_ax.clear()
-        self.signal_ax.clear()
+        search_x, search_y = self.scenario.search_x, self.scenario.search_y
+        dx = search_x[1] - search_x[0] if len(search_x) > 1 else 1
+        dy = search_y[1] - search_y[0] if len(search_y) > 1 else 1
+        self.interp_image = self.interp_ax.imshow(np.zeros((len(search_y), len(search_x))), origin='lower',
+                                                  extent=(search_x[0] - dx / 2, search_x[-1] + dx / 2,
+                                                          search_y[0] - dy / 2, search_y[-1] + dy / 2),
+                                                  aspect='auto', cmap='jet', interpolation='bilinear',
+                                                  zorder=1, visible=False)
+        
+        # Stroking the edge of every marker costs more than filling it.
+        self.scan_scatter = self.interp_ax.scatter(self.scenario.scan_pts[:, 0], self.scenario.scan_pts[:, 1],
+                                                   c=self.scenario.raw_signal, alpha=0.5, zorder=10, cmap='seismic',
+                                                   linewidths=0)
+        self.signal_line = self.signal_ax.plot([], [])[0]
+        self.highlight_plot = self.interp_ax.plot([], [], c=SELECTED_COLOR, zorder=1e3, animated=True)[0]
+        
+        self.interp_ax.set_xlim(prev_xlim[0], prev_xlim[1])
+        self.interp_ax.set_ylim(prev_ylim[0], prev_ylim[1])
+    
+    def remove_artists(self):
+        for artist in [self.interp_image, self.scan_scatter, self.signal_line, self.highlight_plot]:
+            if artist is not None:
+                artist.remove()
+        
+        for obj_id in list(self.mag_obj_plots):
+            self.remove_object_plot(obj_id)
+        
+        self.interp_image = None
+        self.scan_scatter = None
+        self.signal_line = None
+        self.highlight_plot = None
+        self.interp_background = None
+
+    def plot_data(self):
+        start = time.perf_counter()
+        if self.scan_scatter is None:
+            self.create_artists()
+        
         raw_signal = self.scenario.raw_signal
-        self.signal_ax.plot(raw_signal)
+        self.scan_scatter.set_array(raw_signal)
+        self.scan_scatter.autoscale()
         
-        if self.scenario is not None:
-            self.interp_ax.scatter(self.scenario.scan_pts[:, 0], self.scenario.scan_pts[:, 1],
-                                   c=raw_signal, alpha=0.5, zorder=10, cmap='seismic',)
-            self.interp_ax.set_xlim(prev_xlim[0], prev_xlim[1])
-            self.interp_ax.set_ylim(prev_ylim[0], prev_ylim[1])
+        self.update_signal_view()
+        self.signal_ax.relim(visible_only=True)
+        self.signal_ax.autoscale_view()
 
         if self.interp_data is not None:
-            self.interp_contour = self.interp_ax.contourf(self.scenario.search_x, self.scenario.search_y,
-                                    self.interp_data.T, cmap='jet', levels=200,
-                                    zorder=1)
- 
+            self.interp_image.set_data(self.interp_data.T)
+            self.interp_image.autoscale()
+        self.interp_image.set_visible(self.interp_data is not None)
         
         # Redraw the magnetic objects.
         self.draw_mag_objects()
-        
-        # FIXME - Why we need reinitialize the selector on each render?
-        if self.sim_on and self.sim_mode == SimMode.MAGOBJ:
-            self.attach_rectangle_selector()
+        self.update_highlight(blit=False)
 
         # self.initialize_cursor()
         self.draw()
+        self.record_frame_time('plot_data', start)
+    
+    def update_signal_view(self, *args):
+        """
+        Plot the signal decimated to about two points per pixel of the visible range, the x values are
+        still the original sample indices.
+        """
+        if self.signal_line is None:
+            return
+        
+        pyramid = self.scenario.signal_pyramid
+        if self.signal_ax.get_autoscalex_on():
+            x_start, x_end = 0, len(pyramid) - 1
+        else:
+            x_start, x_end = self.signal_ax.get_xlim()
+        
+        self.signal_line.set_data(*pyramid.view(x_start, x_end, self.signal_ax.bbox.width))
+    
+    def on_draw(self, event):
+        """
+        Cache the background of the interpolation axes after every full render and draw the highlight over it.
+        """
+        if self.highlight_plot is None:
+            return
+        
+        self.interp_background = self.copy_from_bbox(self.interp_ax.bbox)
+        self.interp_ax.draw_artist(self.highlight_plot)
+        self.interp_cursor.refresh_background()
+    
+    def update_highlight(self, blit=True):
+        if self.highlight_plot is None:
+            return
+        
+        mag_obj = self.scenario.mag_objects.get(self.selected_id)
+        if mag_obj is None or self.scenario.hidden_objects_map[mag_obj.obj_id]:
+            self.highlight_plot.set_data([], [])
+        elif len(mag_obj.vertices) == 1:
+            self.highlight_plot.set_data(mag_obj.vertices[:, 0], mag_obj.vertices[:, 1])
+            self.highlight_plot.set_linestyle('None')
+            self.highlight_plot.set_marker('o')
+        else:
+            rect = np.vstack((mag_obj.vertices, mag_obj.vertices[0]))
+            self.highlight_plot.set_data(rect[:, 0], rect[:, 1])
+            self.highlight_plot.set_linestyle('-')
+            self.highlight_plot.set_marker('None')
+        
+        if blit:
+            self.blit_highlight()
+    
+    def blit_highlight(self):
+        if self.interp_background is None:
+            self.draw()
+            return
+        
+        start = time.perf_counter()
+        self.restore_region(self.interp_background)
+        self.interp_ax.draw_artist(self.highlight_plot)
+        
+        # The cursor restores its own background when moving, it should include the new highlight.
+        self.interp_cursor.refresh_background()
+        self.blit(self.interp_ax.bbox)
+        self.record_frame_time('highlight', start)
+    
+    def record_frame_time(self, name, start):
+        frame_time = time.perf_counter() - start
+        frame_times = self.frame_times.setdefault(name, deque(maxlen=FRAME_TIME_WINDOW))
+        frame_times.append(frame_time)
+        if DEBUG:
+            print(f'Frame time ({name}): {frame_time * 1e3:.1f}ms, '
+                  f'mean of last {len(frame_times)}: {np.mean(frame_times) * 1e3:.1f}ms')
     
     def update_clim(self, vmin, vmax):
-        if self.interp_contour is not None:
+        if self.interp_image is not None and self.interp_data is not None:
             vmin = max(self.interp_data.min(), vmin)
             vmax = min(self.interp_data.max(), vmax)
             
             if vmax < vmin:
                 vmin = vmax
             
-            self.interp_contour.set_clim(vmin, vmax)
-            self.draw()
+            self.interp_image.set_clim(vmin, vmax)
+            self.draw_idle()
         
     def draw_mag_objects(self):
         """
-        Draw all the relevant magnetic objects.
+        Sync the plots of the magnetic objects with the scenario, only new objects are drawn.
         - Dipole - Single black dot.
         - Rectangle - Add a rectangle patch.
+        The selected object is highlighted separately, see update_highlight.
         """
+        for obj_id in list(self.mag_obj_plots):
+            if obj_id not in self.scenario.mag_objects or self.scenario.hidden_objects_map[obj_id]:
+                self.remove_object_plot(obj_id)
+        
         for obj_id, mag_obj in self.scenario.mag_objects.items():
-            self.draw_mag_object(mag_obj, color='pink' if obj_id == self.selected_id else 'k')
+            if obj_id not in self.mag_obj_plots:
+                self.draw_mag_object(mag_obj)
                 
     def draw_mag_object(self, mag_obj, color='k'):
         if self.scenario.hidden_objects_map[mag_obj.obj_id]:
@@ -347,5 +523,3 @@ class SimulationCanvas(FigureCanvasQTAgg):
             rect = np.vstack((mag_obj.vertices, mag_obj.vertices[0]))
             self.mag_obj_plots[mag_obj.obj_id] = self.interp_ax.plot(rect[:, 0], rect[:, 1], c=color,
                                                                      zorder=1e2)[0]
-
-        
\ No newline at end of file
@@ -5,21 +5,27 @@ from mpl_toolkits.mplot3d import Axes3D
 import numpy as np
 from matplotlib.widgets import Slider
 from widgets.plots.percentile_filter import PercentileFilter
-from scipy.spatial import ConvexHull
-from simulations.dipole import sim_dipole
+from widgets.plots.height_areas import HeightAreaAnalyzer
+from simulations.dipole import sim_dipole, EARTH_FIELD
 
 
 MIN_PERCENTILE = 80
 
+# Number of the strongest candidate sources shown over the point cloud.
+DISPLAYED_PEAKS = 10
+
 
 class SohogramaCanvas(FigureCanvasQTAgg):
     
     
-    def __init__(self, scenario, pt_cloud, interp_data, z_min, z_max) -> None:
+    def __init__(self, scenario, pt_cloud, interp_data, z_min, z_max, peaks=None) -> None:
         self.fig = Figure(figsize=(14, 14), dpi=100)
         self.z_min = z_min
         self.z_max = z_max
         
+        # Ranked (x,y,z,semblance) candidate sources found by the server.
+        self.peaks = peaks[:DISPLAYED_PEAKS] if peaks is not None else None
+        
         super(SohogramaCanvas, self).__init__(self.fig)
 
         self.gridspec = gridspec.GridSpec(ncols=21, nrows=22, figure=self.fig)
@@ -30,6 +36,9 @@ class SohogramaCanvas(FigureCanvasQTAgg):
                                                   self.scenario.search_y,
                                                   np.arange(z_min, z_max+1),
                                                   self.pt_cloud)
+        self.height_area_analyzer = HeightAreaAnalyzer(self.scenario.search_x,
+                                                       self.scenario.search_y,
+                                                       np.arange(z_min, z_max+1))
         self.interp_data = interp_data
         
         # Axis to present the 3d point cloud.
@@ -37,6 +46,7 @@ class SohogramaCanvas(FigureCanvasQTAgg):
         self.pt_cloud_ax.set_zlim(self.z_min, 0)
         
         self.filtered_cloud = None
+        self.filtered_idxs = None
         
         # Axis to show the area of each height layer.
         self.area_ax = self.fig.add_subplot(self.gridspec[:6, 13:])
@@ -94,6 +104,7 @@ class SohogramaCanvas(FigureCanvasQTAgg):
         
     def filter_cloud(self, val):
         self.filtered_cloud = self.percentile_filter.get_pts_over_percentile(val)
+        self.filtered_idxs = self.percentile_filter.get_idxs_over_percentile(val)
         self.plot_3d_data()
         self.fill_area_plot()
         self.height_changed(self.height_slider.val)
@@ -101,30 +112,21 @@ class SohogramaCanvas(FigureCanvasQTAgg):
         
     def fill_area_plot(self):
         """
-        FIXME - Assumes there is a single cluster. Find Solution to the case there are several.
+        Plot the area of each height layer over the current percentile.
+        Layers with several clusters (e.g. several sources) also show the area of their largest cluster.
         """
-        distinct_heights = np.unique(self.filtered_cloud[:, 2])
-        areas = []
-        valid_heights = []
-        
-        for h in distinct_heights:
-            rel_idxs = np.where(self.filtered_cloud[:, 2] == h)[0]
-            rel_pts = self.filtered_cloud[rel_idxs, :2]
-            
-            try:
-                curr_area = ConvexHull(rel_pts).area
-                valid_heights.append(h)
-                areas.append(curr_area)
-            except Exception:
-                continue
+        height_areas = self.height_area_analyzer.get_height_areas(self.filtered_idxs)
             
         # Update the optimal height.
-        optimal_height_idx = np.argmax(np.array(areas))
-        self.optimal_height = valid_heights[optimal_height_idx]
+        self.optimal_height = height_areas.heights[np.argmax(height_areas.areas)]
             
         self.area_ax.clear()
-        self.area_ax.plot(valid_heights, areas, marker='*')
-        self.height_to_area = np.vstack((np.array(valid_heights), np.array(areas))).T
+        self.area_ax.plot(height_areas.heights, height_areas.areas, marker='*', label='Total area')
+        if np.any(height_areas.num_clusters > 1):
+            self.area_ax.plot(height_areas.heights, height_areas.largest_areas, marker='.', linestyle='--',
+                              label='Largest cluster')
+            self.area_ax.legend()
+        self.height_to_area = np.vstack((height_areas.heights, height_areas.areas)).T
         
         self.show_signal_comparison(self.optimal_height)
     
@@ -144,7 +146,7 @@ class SohogramaCanvas(FigureCanvasQTAgg):
         opt_pt_idx = np.argmax(rel_pts[:, 3])
         opt_pt = rel_pts[opt_pt_idx]
         
-        sim_vals = sim_dipole(self.scenario.scan_pts, opt_pt[:3], np.array([0, 1, -1]))
+        sim_vals = sim_dipole(self.scenario.scan_pts, opt_pt[:3], EARTH_FIELD)
         # Get normalized original signal.
         copied_scan_vals = np.copy(self.scenario.raw_signal)
         copied_scan_vals -= 4.5e6
@@ -171,6 +173,9 @@ class SohogramaCanvas(FigureCanvasQTAgg):
         if self.filtered_cloud is not None:
             self.pt_cloud_ax.scatter(self.filtered_cloud[:, 0], self.filtered_cloud[:, 1],
                                      self.filtered_cloud[:, 2], c=self.filtered_cloud[:, 3])
+        
+        if self.peaks is not None:
+            self.pt_cloud_ax.scatter(self.peaks[:, 0], self.peaks[:, 1], self.peaks[:, 2], c='k', marker='x', s=60)
 
  
         
@@ -205,6 +210,10 @@ class SohogramaCanvas(FigureCanvasQTAgg):
         self.plot_2d_view()
         self.view_2d_ax.scatter(self.filtered_cloud[idxs, 0], self.filtered_cloud[idxs, 1],
                                 c=self.filtered_cloud[idxs, 3], zorder=1e2-1)
+        
+        if self.peaks is not None:
+            height_peaks = self.peaks[np.abs(self.peaks[:, 2] - val) < 1e-1]
+            self.view_2d_ax.scatter(height_peaks[:, 0], height_peaks[:, 1], c='w', marker='x', s=60, zorder=1e2+1)
         self.draw()
 
 
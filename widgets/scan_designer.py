@@ -1,6 +1,8 @@
 import PyQt5.QtWidgets as Qtw
 import numpy as np
 from simulations.scenario import GridRange, Scenario
+from simulations.tiled_scenario import TiledScenario
+from utils.survey_reader import read_survey
 from widgets.forms.grid_form import GridForm
 from widgets.forms.spiral_form import SpiralForm
 from widgets.forms.strip_form import StripForm
@@ -15,6 +17,8 @@ DEFAULT_NUM_LINES = 5
 
 DEFAULT_ANGULAR_RES = 15
 
+SURVEY_FILE_FILTER = 'Survey logs (*.csv *.xyz *.txt);;All files (*)'
+
 class ScanDesigner(Qtw.QWidget):
     """_summary_
     Widget that allows users to design scan paths over the simulation canvas.
@@ -131,6 +135,11 @@ class ScanDesigner(Qtw.QWidget):
         
         
         total_scan_type_layout.addWidget(self.set_scan_button)
+        
+        # Real surveys replace the designed path.
+        self.load_survey_button = Qtw.QPushButton('Load Survey')
+        self.load_survey_button.clicked.connect(self.load_survey)
+        total_scan_type_layout.addWidget(self.load_survey_button)
         total_scan_type_widget.setLayout(total_scan_type_layout)
         # total_scan_type_widget.lay
         layout.addWidget(total_scan_type_widget)
@@ -149,6 +158,32 @@ class ScanDesigner(Qtw.QWidget):
         self.on_set_scan(scan_path)
         
     
+    def load_survey(self):
+        """
+        Build the scenario from magnetometer survey logs (x, y, z, time, value rows), their measured values are
+        the base field the simulated objects are added to. Several surveys are combined into a TiledScenario.
+        """
+        paths, _ = Qtw.QFileDialog.getOpenFileNames(self, 'Load Survey', '', SURVEY_FILE_FILTER)
+        if not paths:
+            return
+        
+        try:
+            surveys = [read_survey(path) for path in paths]
+        except (OSError, ValueError) as e:
+            Qtw.QMessageBox.warning(self, 'Load Survey Failed', str(e))
+            return
+        
+        if self.previewed_scan_plot is not None:
+            self.previewed_scan_plot.remove()
+            self.previewed_scan_plot = None
+        
+        if len(surveys) == 1:
+            scenario = Scenario(surveys[0].scan_pts, base_field=surveys[0].values)
+        else:
+            scenario = TiledScenario([survey.scan_pts for survey in surveys],
+                                     base_fields=[survey.values for survey in surveys])
+        self.on_set_scan(scenario)
+    
     def select_pt(self, is_checked):
         if is_checked:
             self.center_button_cid = self.sim_canvas.fig.canvas.mpl_connect('button_press_event', self.set_pt)
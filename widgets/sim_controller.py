@@ -6,14 +6,25 @@ from simulations.mag_object import MagProps
 from simulations.mag_object import MagneticObject
 from interps.interps import InterpType
 from PyQt5.QtCore import Qt
+from PyQt5.QtGui import QColor
 from transforms.rtp import rtp
+from widgets.inversion_worker import InversionWorker
+from widgets.plots.sohograma_canvas import DISPLAYED_PEAKS
 import math
-import requests
 import numpy as np
-import json
 
 # Insert here the url of your server if you're running your backend remotely.
-SERVER_URL = 'http://127.0.0.1:5000/sohograma' 
+SERVER_URL = 'http://127.0.0.1:5000' 
+
+JOBS_URL = f'{SERVER_URL}/jobs'
+
+# Heights searched by the inversion.
+INVERSION_Z_MIN = -20
+
+INVERSION_Z_MAX = -5
+
+# Deflate the arrays sent to and from the server, worth it over slow links.
+COMPRESS_TRANSPORT = False
 
 
 class SimulationController(Qtw.QWidget):
@@ -27,6 +38,9 @@ class SimulationController(Qtw.QWidget):
         self.v_max = None
         
         self.on_server_response = on_server_response
+        
+        # Background thread of the running inversion job.
+        self.inversion_worker = None
 
         self.initUI()
     
@@ -71,6 +85,18 @@ class SimulationController(Qtw.QWidget):
                 selected_id)
  
 
+    def accuracy_changed(self):
+        """
+        Objects' anomalies below the accuracy are ignored, far away scan points aren't modelled. Empty is exact.
+        """
+        text = self.accuracy_edit.text().strip()
+        try:
+            accuracy = float(text) if text else None
+        except ValueError:
+            return
+        
+        self.sim_canvas.set_accuracy(accuracy if accuracy is None or accuracy > 0 else None)
+
     def object_selection_changed(self):
         """
         Once an object was selected - update the values in the forms and highlight it.
@@ -125,6 +151,9 @@ class SimulationController(Qtw.QWidget):
         self.moment_edit = Qtw.QLineEdit(DEFAULT_MOMENT)
         self.depth_edit = Qtw.QLineEdit(DEFAULT_DEPTH)
         self.zdim_edit = Qtw.QLineEdit(DEFAULT_DIPOLE_ZDIM)
+        self.accuracy_edit = Qtw.QLineEdit(DEFAULT_ACCURACY)
+        self.accuracy_edit.setPlaceholderText('Exact')
+        self.accuracy_edit.returnPressed.connect(self.accuracy_changed)
         self.moment_edit.returnPressed.connect(self.recalc_field)
         self.depth_edit.returnPressed.connect(self.recalc_field)
         self.zdim_edit.returnPressed.connect(self.recalc_field)
@@ -133,6 +162,7 @@ class SimulationController(Qtw.QWidget):
         mag_prop_layout.addRow('Moment: ', self.moment_edit)
         mag_prop_layout.addRow('Depth: ', self.depth_edit)
         mag_prop_layout.addRow('Z-Dimension: ', self.zdim_edit)
+        mag_prop_layout.addRow('Accuracy (nT): ', self.accuracy_edit)
         self.mag_prop_widget.setLayout(mag_prop_layout)
         layout.addWidget(self.mag_prop_widget)
         
@@ -144,10 +174,10 @@ class SimulationController(Qtw.QWidget):
         interp_layout = Qtw.QHBoxLayout()
         interp_layout.addWidget(Qtw.QLabel('Interpolation: '))
         
-        interp_dropdown = Qtw.QComboBox()
-        interp_dropdown.currentIndexChanged.connect(self.changed_interp)
-        interp_dropdown.addItems([interp.value.display_str for interp in InterpType])
-        interp_layout.addWidget(interp_dropdown)
+        self.interp_dropdown = Qtw.QComboBox()
+        self.interp_dropdown.currentIndexChanged.connect(self.changed_interp)
+        self.interp_dropdown.addItems([interp.value.display_str for interp in InterpType])
+        interp_layout.addWidget(self.interp_dropdown)
         interp_container.setLayout(interp_layout)
         layout.addWidget(interp_container)
         
@@ -195,9 +225,22 @@ class SimulationController(Qtw.QWidget):
         
         layout.addWidget(transforms_container)        
         
+        inversion_container = Qtw.QWidget()
+        inversion_layout = Qtw.QHBoxLayout()
         self.server_request_button = Qtw.QPushButton('Inversion')
         self.server_request_button.clicked.connect(self.request_from_server)
-        layout.addWidget(self.server_request_button)
+        self.cancel_inversion_button = Qtw.QPushButton('Cancel')
+        self.cancel_inversion_button.clicked.connect(self.cancel_inversion)
+        self.cancel_inversion_button.setDisabled(True)
+        inversion_layout.addWidget(self.server_request_button)
+        inversion_layout.addWidget(self.cancel_inversion_button)
+        inversion_container.setLayout(inversion_layout)
+        layout.addWidget(inversion_container)
+        
+        self.inversion_progress = Qtw.QProgressBar()
+        self.inversion_progress.setRange(0, 100)
+        self.inversion_progress.hide()
+        layout.addWidget(self.inversion_progress)
         
         
         reset_button = Qtw.QPushButton('Reset')
@@ -207,14 +250,42 @@ class SimulationController(Qtw.QWidget):
         self.setLayout(layout)
         
     def request_from_server(self):
-        if self.sim_canvas.scenario is None:
+        if self.sim_canvas.scenario is None or self.inversion_worker is not None:
             return
         
-        
-        soh_inp = self.sim_canvas.scenario.get_sohograma_input(-20, -5)
-        pt_cloud = json.loads(requests.post(SERVER_URL, json=soh_inp).content.decode())
-        pt_cloud = np.array(pt_cloud['pt_cloud'])
-        self.on_server_response(pt_cloud, -20, -5)
+        soh_inp = self.sim_canvas.scenario.get_sohograma_input(INVERSION_Z_MIN, INVERSION_Z_MAX)
+        self.inversion_worker = InversionWorker(JOBS_URL, soh_inp, DISPLAYED_PEAKS, compress=COMPRESS_TRANSPORT)
+        self.inversion_worker.progress_changed.connect(self.inversion_progress_changed)
+        self.inversion_worker.inversion_done.connect(self.inversion_done)
+        self.inversion_worker.inversion_failed.connect(self.inversion_failed)
+        self.inversion_worker.finished.connect(self.inversion_worker_finished)
+        
+        self.server_request_button.setDisabled(True)
+        self.cancel_inversion_button.setDisabled(False)
+        self.inversion_progress.setValue(0)
+        self.inversion_progress.show()
+        self.inversion_worker.start()
+    
+    def cancel_inversion(self):
+        if self.inversion_worker is not None:
+            self.inversion_worker.cancel()
+    
+    def inversion_progress_changed(self, progress):
+        self.inversion_progress.setValue(int(progress * 100))
+    
+    def inversion_done(self, result_url, peaks):
+        # The cube is only fetched from the result url once its view is opened.
+        self.on_server_response(None, INVERSION_Z_MIN, INVERSION_Z_MAX, peaks, cube_url=result_url)
+    
+    def inversion_failed(self, error):
+        if error:
+            Qtw.QMessageBox.warning(self, 'Inversion Failed', error)
+    
+    def inversion_worker_finished(self):
+        self.inversion_worker = None
+        self.server_request_button.setDisabled(False)
+        self.cancel_inversion_button.setDisabled(True)
+        self.inversion_progress.hide()
         
     
     def flip_rtp_mode(self):
@@ -252,6 +323,26 @@ class SimulationController(Qtw.QWidget):
     def changed_interp(self, interp_idx):
         self.sim_canvas.set_interp_type(list(InterpType)[interp_idx])
         
+    def restore_state(self, interp_type=None):
+        """
+        Sync the controls with a scenario which already holds objects (e.g. loaded from a project).
+        """
+        self.mag_obj_list.clear()
+        self.mag_obj_list.hidden_items = []
+        for obj_id, mag_obj in self.sim_canvas.scenario.mag_objects.items():
+            self.add_object_to_list(mag_obj)
+            if self.sim_canvas.scenario.hidden_objects_map[obj_id]:
+                self.mag_obj_list.hidden_items.append(obj_id)
+                self.mag_obj_list.item(self.mag_obj_list.count() - 1).setBackground(QColor(255, 0, 169, 100))
+        
+        accuracy = self.sim_canvas.scenario.accuracy
+        self.accuracy_edit.setText(str(accuracy) if accuracy is not None else '')
+
+        if interp_type is not None:
+            self.interp_dropdown.setCurrentIndex(list(InterpType).index(interp_type))
+        self.sim_canvas.set_interp_type(list(InterpType)[self.interp_dropdown.currentIndex()])
+        self.mag_field_changed(self.sim_canvas.scenario.min_field, self.sim_canvas.scenario.max_field)
+        
     def reset_state(self):
         MagneticObject.ID = 1
         self.mag_obj_list.clear()
@@ -33,12 +33,21 @@ class SimulationView(Qtw.QWidget):
     def get_interp_data(self):
         return self.sim_canvas.interp_data
         
-    def inject_scan(self, scenario):
+    def inject_scan(self, scenario, interp_grids=()):
         self.tab_widget.removeTab(0)
-        self.sim_canvas.set_scenario(scenario)
+        self.sim_canvas.set_scenario(scenario, interp_grids)
         self.sim_controller.bind_mag_field_changed_event()
         self.tab_widget.addTab(self.sim_controller, 'Simulate Objects')
  
+    def load_project(self, project):
+        """
+        Show the scenario of a loaded project (see utils.project.load_project) along with its objects.
+        """
+        if project.interp_type is not None:
+            self.sim_canvas.interp_type = project.interp_type
+        self.inject_scan(project.scenario, project.interp_grids)
+        self.sim_controller.restore_state(project.interp_type)
+ 
     def initUI(self):
         left_layout = Qtw.QVBoxLayout()
         self.tab_widget = Qtw.QTabWidget()
@@ -1,26 +1,121 @@
 import PyQt5.QtWidgets as Qtw
+from PyQt5.QtCore import pyqtSignal
 from widgets.plots.sohograma_canvas import SohogramaCanvas
+from widgets.inversion_worker import CubeWorker
 from matplotlib.backends.backend_qt5agg import NavigationToolbar2QT as NavigationToolbar
-        
+
+# Columns of the candidate sources table.
+PEAK_COLUMNS = ['X', 'Y', 'Z', 'Semblance']
 
 
 class SohogramaView(Qtw.QWidget):
-    
-    def __init__(self, parent, scenario, pt_cloud, interp_data, z_min, z_max) -> None:
+
+    # Emitted once the cube is fetched and its canvas (and toolbar) can be shown.
+    canvas_shown = pyqtSignal()
+
+    def __init__(self, parent, scenario, pt_cloud, interp_data, z_min, z_max, peaks=None, cube_url=None) -> None:
+        """
+        Args:
+            pt_cloud (np.array): Semblance cube, when None only the peaks are listed until the cube is fetched
+                                 from cube_url (see inversion_worker.CubeWorker).
+            cube_url (str): Url of the job's result on the server.
+        """
         super().__init__(parent)
-        
-        self.sohograma_canvas = SohogramaCanvas(scenario, pt_cloud, interp_data, z_min, z_max)
+
+        # Kept as received so the results can be saved with the project.
+        self.pt_cloud = pt_cloud
+        self.z_min = z_min
+        self.z_max = z_max
+        self.peaks = peaks
+
+        self.scenario = scenario
+        self.interp_data = interp_data
+        self.cube_url = cube_url
+        self.cube_worker = None
+
+        self.sohograma_canvas = None
+        self.peaks_widget = None
+        self.show_cube_button = None
         self.toolbar = None
         self.initUI()
 
     def reset_toolbar(self):
-        self.toolbar = NavigationToolbar(self.sohograma_canvas, self)
+        if self.sohograma_canvas is not None:
+            self.toolbar = NavigationToolbar(self.sohograma_canvas, self)
 
     def initUI(self):
-        main_layout = Qtw.QHBoxLayout()
-        main_layout.addWidget(self.sohograma_canvas)
-        self.setLayout(main_layout)
+        self.main_layout = Qtw.QHBoxLayout()
+        if self.pt_cloud is not None:
+            self.show_cube()
+        else:
+            self.peaks_widget = self.create_peaks_widget()
+            self.main_layout.addWidget(self.peaks_widget)
+        self.setLayout(self.main_layout)
+
+    def create_peaks_widget(self):
+        """
+        Table of the candidate sources along with a button fetching the cube for the 3d view.
+        """
+        peaks_widget = Qtw.QWidget()
+        layout = Qtw.QVBoxLayout()
+
+        label = Qtw.QLabel('Candidate Sources')
+        label.setObjectName('h1')
+        layout.addWidget(label)
+
+        num_peaks = self.peaks.shape[0] if self.peaks is not None else 0
+        table = Qtw.QTableWidget(num_peaks, len(PEAK_COLUMNS))
+        table.setHorizontalHeaderLabels(PEAK_COLUMNS)
+        for ipeak in range(num_peaks):
+            for icol, val in enumerate(self.peaks[ipeak]):
+                table.setItem(ipeak, icol, Qtw.QTableWidgetItem(f'{val:.3f}'))
+        layout.addWidget(table)
+
+        self.show_cube_button = Qtw.QPushButton('Show Point Cloud')
+        self.show_cube_button.setDisabled(self.cube_url is None)
+        self.show_cube_button.clicked.connect(self.fetch_cube)
+        layout.addWidget(self.show_cube_button)
+
+        peaks_widget.setLayout(layout)
+        return peaks_widget
+
+    def fetch_cube(self):
+        if self.cube_worker is not None:
+            return
+
+        self.cube_worker = CubeWorker(self.cube_url)
+        self.cube_worker.cube_received.connect(self.cube_received)
+        self.cube_worker.fetch_failed.connect(self.cube_fetch_failed)
+        self.cube_worker.cube_expired.connect(self.cube_expired)
+        self.cube_worker.finished.connect(self.cube_worker_finished)
+        self.show_cube_button.setDisabled(True)
+        self.cube_worker.start()
+
+    def cube_received(self, pt_cloud):
+        self.pt_cloud = pt_cloud
+        self.main_layout.removeWidget(self.peaks_widget)
+        self.peaks_widget.deleteLater()
+        self.peaks_widget = None
+        self.show_cube()
+        self.canvas_shown.emit()
+
+    def cube_fetch_failed(self, error):
+        Qtw.QMessageBox.warning(self, 'Fetching Point Cloud Failed', error)
+        self.show_cube_button.setDisabled(False)
+
+    def cube_expired(self):
+        # The button stays disabled, the job's result won't come back.
+        self.cube_url = None
+        self.show_cube_button.setToolTip('The server no longer holds the result of this inversion, run it again '
+                                         'to view its point cloud.')
+        Qtw.QMessageBox.warning(self, 'Point Cloud Unavailable',
+                                'The server only keeps the results of its latest inversions and this one was dropped. '
+                                'Run the inversion again to view its point cloud.')
 
+    def cube_worker_finished(self):
+        self.cube_worker = None
 
-        
-    
\ No newline at end of file
+    def show_cube(self):
+        self.sohograma_canvas = SohogramaCanvas(self.scenario, self.pt_cloud, self.interp_data, self.z_min,
+                                                self.z_max, peaks=self.peaks)
+        self.main_layout.addWidget(self.sohograma_canvas)